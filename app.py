@@ -1,37 +1,108 @@
 import re
+import threading
 from datetime import datetime
-from backend.api import api_bp  
+from backend.metrics import instrument_flask
+from backend import dao
+from backend.blob_store import digest_from_ref
+from backend.image_variants import STANDARD_WIDTHS
+from backend.startup import phase
 
-from flask import Flask, render_template
+from flask import Flask, render_template, request
 
-app = Flask(__name__)
+# Cards rendered with the page; the rest arrive from /api/v1/items as you scroll
+BROWSE_PAGE_SIZE = 24
+# Thumbnail widths offered in srcset (the card is ~250-350 CSS px wide)
+THUMB_WIDTHS = STANDARD_WIDTHS[:3]
+API_PREFIX = "/api/v1"
+
+
+def thumbnail_srcset(image_url):
+    """srcset over the variant widths for our /assets images; '' for images hosted elsewhere."""
+    if not image_url or digest_from_ref(image_url) is None:
+        return ''
+    sep = '&' if '?' in image_url else '?'
+    return ', '.join(f'{image_url}{sep}w={w} {w}w' for w in THUMB_WIDTHS)
 
 
-@app.route('/')
 def browse():
-    items = [
-        {
-            'name': 'White TOP Shirt',
-            'category': 'tops',
-            'image_url': '/static/images/shirt.jpg',
-            'tags': ['casual', 'graphic']
-        },
-
-       {
-            'name': 'Black Jeans',
-            'category': 'bottoms',
-            'image_url': '/static/images/blk-jeans.webp',
-            'tags': ['casual', 'jeans']
-        },
-
-        {
-            'name': 'Black Sneakers',
-            'category': 'shoes',
-            'image_url': '/static/images/blk-sneaker.jpg',
-            'tags': ['casual', 'sneaker']
-        },
-    ]
-    return render_template('browse.html', 
-                         items=items, 
-                         item_count=len(items))
-app.register_blueprint(api_bp, url_prefix="/api/v1")
+    category = request.args.get('category') or None
+    q = (request.args.get('q') or '').strip() or None
+    sort = request.args.get('sort', 'recent')
+    try:
+        res = dao.list_items(category=category, q=q, sort=sort, per_page=BROWSE_PAGE_SIZE,
+                             cursor=request.args.get('cursor') or None, count='cached')
+    except ValueError:  # hand-edited URL (unknown category/sort, stale cursor): start over
+        category, q, sort = None, None, 'recent'
+        res = dao.list_items(per_page=BROWSE_PAGE_SIZE, count='cached')
+    return render_template('browse.html',
+                         items=res['items'],
+                         item_count=res['total'],
+                         next_cursor=res['next_cursor'],
+                         category=category or 'all', q=q or '', sort=sort,
+                         page_size=BROWSE_PAGE_SIZE, thumb_widths=THUMB_WIDTHS)
+
+
+def api_app() -> Flask:
+    """The flask_restx items API (Swagger models, marshmallow schemas, outfit matcher) on its own app."""
+    with phase("web: flask_restx API"):
+        from backend.api import api_bp
+        app = Flask(__name__)
+        instrument_flask(app, "web")  # same metric names; its /metrics is never routed here
+        app.register_blueprint(api_bp, url_prefix=API_PREFIX)
+    return app
+
+
+class LazyMount:
+    """
+    WSGI middleware sending every request under `prefix` to the app that
+    load() builds on the first such request. Paths are passed through
+    unchanged, so the mounted app routes (and reports metrics) by full path.
+    """
+
+    def __init__(self, app, prefix: str, load):
+        self.app, self.prefix, self.load = app, prefix, load
+        self._mounted = None
+        self._lock = threading.Lock()
+
+    def mount(self):
+        if self._mounted is None:
+            with self._lock:
+                if self._mounted is None:
+                    self._mounted = self.load()
+        return self._mounted
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path != self.prefix and not path.startswith(self.prefix + '/'):
+            return self.app(environ, start_response)
+        return self.mount()(environ, start_response)
+
+
+def create_app(lazy: bool = True) -> Flask:
+    """
+    The browse page plus the items API under /api/v1. With lazy=True the API
+    (flask_restx, marshmallow, NumPy via the matcher) is only imported when
+    the first /api/v1 request arrives; lazy=False loads it here, which suits
+    servers that preload the app before forking workers.
+    """
+    app = Flask(__name__)
+    instrument_flask(app, "web")  # GET /metrics
+    app.add_template_global(thumbnail_srcset)
+    app.add_url_rule('/', view_func=browse)
+    app.wsgi_app = LazyMount(app.wsgi_app, API_PREFIX, api_app)
+    if not lazy:
+        app.wsgi_app.mount()
+    return app
+
+
+_app = None
+
+
+def __getattr__(name):
+    # `app` (flask --app app, gunicorn app:app, `from app import app`) is built on first access
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,41 +1,99 @@
-from flask import Blueprint, request, abort
+import hashlib
+import json
+from datetime import datetime
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from flask import Blueprint, Response, request, abort, make_response
 from flask_restx import Api, Resource, fields
 from marshmallow import ValidationError
-from .schemas import CreateClothingItemDTO, UpdateClothingItemDTO, ClothingItemDTO
+from .schemas import CreateClothingItemDTO, UpdateClothingItemDTO, ClothingItemDTO, ITEM_FIELDS
+from .matcher import get_seasonal, DEFAULT_BUDGET_MS
+from .weather import forecasts, forecast_payload, warmth_band, ForecastUnavailable
+from .phash import DEFAULT_MAX_DISTANCE, MAX_DISTANCE
+from .features import DEFAULT_SIMILAR, MAX_SIMILAR
 
 # ---- try to use your DAO; otherwise use a tiny in-memory fallback ----
 try:
-    from . import dao as dao  # must expose: list_items, create_item, get_item, update_item, delete_item
+    from . import dao as dao  # must expose: list_items, create_item(s), get_item, update_item(s), delete_item
 except Exception:
     _items, _next_id = [], 1
-    def list_items(category=None, color=None, q=None, page=1, per_page=20):
+    def list_items(category=None, color=None, q=None, page=1, per_page=20, cursor=None, count="exact",
+                   tolerance=None, sort="recent", fields=None):  # sort: always insertion order here
         data = _items
         if category: data = [i for i in data if i["category"] == category]
         if color: data = [i for i in data if (i.get("color") or "").lower().find(color.lower()) >= 0]
         if q: data = [i for i in data if q.lower() in i["name"].lower()]
-        total = len(data); start = (page-1)*per_page; end = start+per_page
-        return {"items": data[start:end], "page": page, "pages": (total+per_page-1)//per_page, "total": total}
+        total = len(data)
+        if cursor:  # cursor = last id seen; ids only grow, so this is keyset order
+            data = [i for i in data if i["id"] > int(cursor)]; start = 0
+        else:
+            start = (page-1)*per_page
+        chunk = data[start:start+per_page]
+        more = len(data) > start+per_page
+        return {"items": chunk, "page": None if cursor else page,
+                "pages": (total+per_page-1)//per_page, "total": None if count == "none" else total,
+                "next_cursor": str(chunk[-1]["id"]) if more and chunk else None}
+    def items_near_color(color, tolerance=10.0, category=None, limit=20):
+        from .utils_colors import parse_color, rgb_to_lab, delta_e
+        target = parse_color(color)
+        if target is None: raise ValueError(f"Unknown color: {color}")
+        target, hits = rgb_to_lab(target), []
+        for i in _items:
+            rgb = parse_color(i.get("color"))
+            if rgb is None or (category and i["category"] != category): continue
+            d = delta_e(rgb_to_lab(rgb), target)
+            if d <= tolerance: hits.append({**i, "delta_e": round(d, 2)})
+        return sorted(hits, key=lambda i: (i["delta_e"], i["id"]))[:limit]
     def create_item(name, category, color=None, image_url=None):
         global _next_id; item = {"id": _next_id, "name": name, "category": category, "color": color, "image_url": image_url}
         _items.append(item); _next_id += 1; return item
-    def get_item(item_id): return next((i for i in _items if i["id"] == item_id), None)
-    def update_item(item_id, **data):
+    def get_item(item_id, fields=None, user_id=None):  # items here already are API-shaped dicts
+        return next((i for i in _items if i["id"] == item_id), None)
+    def update_item(item_id, user_id=None, **data):
         i = get_item(item_id); 
         if not i: return None
         for k,v in data.items():
             if v is not None: i[k] = v
         return i
-    def delete_item(item_id):
+    def delete_item(item_id, user_id=None):
         global _items
         before = len(_items)
         _items = [i for i in _items if i["id"] != item_id]
         return len(_items) < before
+    def wardrobe_version(user_id=None):  # no counter here: fingerprint the list instead
+        return hash(repr(_items))
+    def item_duplicates(item_id, max_distance=None, fields=None, user_id=None):  # no image hashes in memory
+        i = get_item(item_id)
+        return {"item_id": item_id, "phash": None, "data": []} if i else None
+    def duplicate_report(max_distance=None, fields=None):
+        return {"clusters": [], "hashed": 0}
+    def similar_items(item_id, limit=None, fields=None, user_id=None):  # no feature vectors in memory
+        i = get_item(item_id)
+        return {"item_id": item_id, "analysed": False, "data": []} if i else None
+    def create_items(rows):
+        return {"ids": [create_item(**r)["id"] for r in rows], "errors": []}
+    def update_items(rows):
+        ids, errors = [], []
+        for idx, r in enumerate(rows):
+            i = update_item(r["id"], **{k: v for k, v in r.items() if k != "id"})
+            ids.append(i["id"] if i else None)
+            if not i: errors.append({"index": idx, "error": "Item not found"})
+        return {"ids": ids, "errors": errors}
     class dao:  # shim with same API
+        MAX_BULK_ROWS = 10_000
         list_items = staticmethod(list_items)
+        items_near_color = staticmethod(items_near_color)
         create_item = staticmethod(create_item)
+        create_items = staticmethod(create_items)
         get_item = staticmethod(get_item)
         update_item = staticmethod(update_item)
+        update_items = staticmethod(update_items)
         delete_item = staticmethod(delete_item)
+        wardrobe_version = staticmethod(wardrobe_version)
+        item_duplicates = staticmethod(item_duplicates)
+        duplicate_report = staticmethod(duplicate_report)
+        similar_items = staticmethod(similar_items)
 # ----------------------------------------------------------------------
 
 api_bp = Blueprint("api", __name__)
@@ -49,6 +107,27 @@ api = Api(
 
 ns = api.namespace("items", description="Clothing items")
 
+try:
+    import orjson
+except ImportError:  # stdlib fallback: same bytes out, just slower
+    orjson = None
+
+@api.representation("application/json")
+def output_json(data, code, headers=None):
+    """Every API body is encoded here, with orjson when it's installed."""
+    body = orjson.dumps(data) if orjson else json.dumps(data, separators=(",", ":")).encode()
+    resp = make_response(body, code)
+    resp.headers.extend(headers or {})
+    resp.mimetype = "application/json"
+    return resp
+
+@api.errorhandler(ValidationError)
+def on_validation(err):
+    """A request body the schemas reject (unknown color, empty name, ...): 400 with the field messages."""
+    # flask-restx answers with err.data when the exception has one, and marshmallow's is the input
+    err.data = {"error": "validation_error", "details": err.messages}
+    return err.data, 400
+
 # models for Swagger (docs only)
 ItemIn = ns.model("CreateItem", {
     "name": fields.String(required=True),
@@ -56,7 +135,7 @@ ItemIn = ns.model("CreateItem", {
     "color": fields.String,
     "image_url": fields.String,
 })
-ItemOut = ns.model("Item", {
+ItemOut = ns.model("Item", {  # same fields as schemas.ITEM_FIELDS
     "id": fields.Integer,
     "name": fields.String,
     "category": fields.String,
@@ -66,6 +145,7 @@ ItemOut = ns.model("Item", {
 ListOut = api.model("ItemListResponse", {
     "data": fields.List(fields.Nested(ItemOut)),
     "page": fields.Integer, "pages": fields.Integer, "total": fields.Integer,
+    "next_cursor": fields.String,
 })
 
 create_schema = CreateClothingItemDTO()
@@ -75,28 +155,78 @@ out_schema = ClothingItemDTO()
 def dump_item(obj):  # DTO mapping (serialize)
     return out_schema.dump(obj)
 
+# ---- conditional GET + versioned response cache ----
+# Every item write bumps the wardrobe version, so (user, version, path, query)
+# names one exact response body: it can be cached without invalidation and
+# its hash is a strong ETag.
+RESPONSE_CACHE_SIZE = 256
+USER_ID = getattr(dao, "DEFAULT_USER_ID", 1)  # no auth yet: one wardrobe
+_responses: "OrderedDict[str, bytes]" = OrderedDict()  # etag -> JSON body
+_responses_lock = Lock()
+
+def versioned(f):
+    """GET handler wrapper: ETag from the wardrobe version, 304 on If-None-Match, cached bodies."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        key = (USER_ID, dao.wardrobe_version(USER_ID), request.path,
+               tuple(sorted(request.args.items(multi=True))))
+        etag = hashlib.sha1(repr(key).encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            with _responses_lock:
+                body = _responses.get(etag)
+                if body is not None: _responses.move_to_end(etag)
+            if body is not None:
+                resp = Response(body, mimetype="application/json")
+            else:
+                resp = api.make_response(f(*args, **kwargs), 200)
+                with _responses_lock:
+                    _responses[etag] = resp.get_data()
+                    while len(_responses) > RESPONSE_CACHE_SIZE: _responses.popitem(last=False)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "no-cache"  # always revalidate; 304s are cheap
+        return resp
+    return wrapper
+
 @ns.route("")
 class Items(Resource):
     @ns.doc(params={
         "category":"tops|bottoms|shoes|accessories",
-        "color":"e.g. black",
+        "color":"e.g. black or #1b1b1b (perceptual match, see tolerance)",
+        "tolerance":"max Delta-E from color (default 10)",
         "q":"search by name",
+        "sort":"recent|oldest|name|category|relevance (default recent)",
         "page":"page number (default 1)",
         "per_page":"items per page (<=100, default 20)",
+        "cursor":"next_cursor from the previous page (keyset paging; overrides page)",
+        "count":"exact|cached|none (default exact)",
     })
-    @ns.marshal_with(ListOut)
+    @ns.response(200, "Success", ListOut)
+    @versioned
     def get(self):
         page = int(request.args.get("page", 1))
         per = min(int(request.args.get("per_page", 20)), 100)
-        res = dao.list_items(
-            category=request.args.get("category"),
-            color=request.args.get("color"),
-            q=request.args.get("q"),
-            page=page, per_page=per
-        )
+        count = request.args.get("count", "exact")
+        if count not in ("exact", "cached", "none"):
+            abort(400, description="count must be exact, cached or none")
+        try:
+            res = dao.list_items(
+                category=request.args.get("category"),
+                color=request.args.get("color"),
+                q=request.args.get("q"),
+                sort=request.args.get("sort", "recent"),
+                page=page, per_page=per,
+                cursor=request.args.get("cursor") or None, count=count,
+                tolerance=float(request.args.get("tolerance", 10)),
+                fields=ITEM_FIELDS,  # rows come back as ItemOut-shaped dicts, no marshalling
+            )
+        except ValueError as e:  # malformed / mismatched cursor, unknown color or sort
+            abort(400, description=str(e))
         return {
-            "data": [dump_item(i) for i in res["items"]],
-            "page": res["page"], "pages": res["pages"], "total": res["total"]
+            "data": res["items"],
+            "page": res["page"], "pages": res["pages"], "total": res["total"],
+            "next_cursor": res["next_cursor"],
         }
 
     @ns.expect(ItemIn, validate=True)
@@ -107,31 +237,389 @@ class Items(Resource):
         created = dao.create_item(**data)
         return dump_item(created), 201
 
+BatchIn = api.model("ItemBatchRequest", {
+    "items": fields.List(fields.Raw, required=True,
+                         description="CreateItem objects; ones with an id are updates"),
+})
+BatchResultOut = api.model("ItemBatchResult", {
+    "index": fields.Integer, "id": fields.Integer, "errors": fields.Raw,
+})
+BatchOut = api.model("ItemBatchResponse", {
+    "created": fields.Integer, "updated": fields.Integer, "failed": fields.Integer,
+    "results": fields.List(fields.Nested(BatchResultOut)),
+})
+
+@ns.route(":batch")
+class ItemsBatch(Resource):
+    @ns.expect(BatchIn, validate=False)
+    @ns.marshal_with(BatchOut)
+    def post(self):
+        """
+        Create and/or update many items in one request (e.g. onboarding import).
+        Each row is validated on its own; bad rows are reported by index and the
+        rest are written, creates and updates each in a single transaction.
+        """
+        rows = (request.get_json(force=True) or {}).get("items")
+        if not isinstance(rows, list):
+            abort(400, description="items must be a list")
+        if len(rows) > dao.MAX_BULK_ROWS:
+            abort(413, description=f"At most {dao.MAX_BULK_ROWS} items per batch")
+        results = [{"index": idx, "id": None, "errors": None} for idx in range(len(rows))]
+        creates, updates = [], []  # (index, validated row)
+        for idx, row in enumerate(rows):
+            try:
+                if not isinstance(row, dict):
+                    raise ValidationError("Expected an object")
+                if row.get("id") is not None:
+                    if not isinstance(row["id"], int):
+                        raise ValidationError({"id": ["Not a valid integer."]})
+                    updates.append((idx, {"id": row["id"], **update_schema.load(
+                        {k: v for k, v in row.items() if k != "id"})}))
+                else:
+                    creates.append((idx, create_schema.load(row)))
+            except ValidationError as e:
+                results[idx]["errors"] = e.messages
+        counts = {}
+        for name, batch, write in (("created", creates, dao.create_items),
+                                   ("updated", updates, dao.update_items)):
+            res = write([r for _, r in batch]) if batch else {"ids": [], "errors": []}
+            for (idx, _), new_id in zip(batch, res["ids"]):
+                results[idx]["id"] = new_id
+            for err in res["errors"]:
+                results[batch[err["index"]][0]]["errors"] = {"_row": [err["error"]]}
+            counts[name] = sum(1 for i in res["ids"] if i is not None)
+        return {**counts, "failed": sum(1 for r in results if r["errors"]), "results": results}
+
+NearItemOut = ns.inherit("NearItem", ItemOut, {"delta_e": fields.Float})
+
+@ns.route("/near")
+class ItemsNearColor(Resource):
+    @ns.doc(params={
+        "color":"required; name or hex, e.g. navy or #1b1b1b",
+        "tolerance":"max Delta-E (CIE76) from color (default 10)",
+        "category":"tops|bottoms|shoes|accessories",
+        "limit":"max results (<=100, default 20)",
+    })
+    @ns.marshal_list_with(NearItemOut)
+    def get(self):
+        color = request.args.get("color")
+        if not color: abort(400, description="color is required")
+        try:
+            hits = dao.items_near_color(
+                color, tolerance=float(request.args.get("tolerance", 10)),
+                category=request.args.get("category"),
+                limit=min(int(request.args.get("limit", 20)), 100),
+            )
+        except ValueError as e:
+            abort(400, description=str(e))
+        return [{**dump_item(i), "delta_e": i["delta_e"]} for i in hits]
+
+# ---- near-duplicate images (perceptual hashes, see phash.py) ----
+def max_distance_arg() -> int:
+    try:
+        d = int(request.args.get("max_distance", DEFAULT_MAX_DISTANCE))
+    except ValueError:
+        d = -1
+    if not 0 <= d <= MAX_DISTANCE:
+        abort(400, description=f"max_distance must be an integer in [0, {MAX_DISTANCE}]")
+    return d
+
+DISTANCE_PARAM = {"max_distance": f"max differing bits of the 64-bit image hashes "
+                                  f"(<={MAX_DISTANCE}, default {DEFAULT_MAX_DISTANCE})"}
+
+DuplicateItemOut = ns.inherit("DuplicateItem", ItemOut, {
+    "distance": fields.Integer(description="differing bits of the 64-bit image hashes"),
+})
+DuplicatesOut = api.model("ItemDuplicatesResponse", {
+    "item_id": fields.Integer,
+    "phash": fields.String(description="the item's image hash (hex); null if it has none"),
+    "data": fields.List(fields.Nested(DuplicateItemOut)),
+})
+DuplicateClusterOut = api.model("DuplicateCluster", {
+    "items": fields.List(fields.Nested(ItemOut)),
+    "max_distance": fields.Integer,
+})
+DuplicateReportOut = api.model("DuplicateReportResponse", {
+    "clusters": fields.List(fields.Nested(DuplicateClusterOut)),
+    "hashed": fields.Integer(description="items with an image hash"),
+})
+
+@ns.route("/duplicates")
+class ItemsDuplicateReport(Resource):
+    @ns.doc(params=DISTANCE_PARAM)
+    @ns.response(200, "Success", DuplicateReportOut)
+    @versioned
+    def get(self):
+        """Dedup report: groups of items whose images look alike, largest group first."""
+        return dao.duplicate_report(max_distance_arg(), fields=ITEM_FIELDS)
+
+@ns.route("/<int:item_id>/duplicates")
+@ns.param("item_id", "Item ID")
+class ItemDuplicates(Resource):
+    @ns.doc(params=DISTANCE_PARAM)
+    @ns.response(200, "Success", DuplicatesOut)
+    @versioned
+    def get(self, item_id):
+        """Possible duplicates of this item: other items with a near-identical image, nearest first."""
+        res = dao.item_duplicates(item_id, max_distance_arg(), fields=ITEM_FIELDS, user_id=USER_ID)
+        if res is None: abort(404, description="Item not found")
+        return res
+
+# ---- visually similar items (feature vectors, see features.py) ----
+SimilarItemOut = ns.inherit("SimilarItem", ItemOut, {
+    "score": fields.Float(description="cosine similarity of the image feature vectors (1 = same look)"),
+})
+SimilarOut = api.model("SimilarItemsResponse", {
+    "item_id": fields.Integer,
+    "analysed": fields.Boolean(description="false while the item's image has no feature vector yet"),
+    "data": fields.List(fields.Nested(SimilarItemOut)),
+})
+
+@ns.route("/<int:item_id>/similar")
+@ns.param("item_id", "Item ID")
+class SimilarItems(Resource):
+    @ns.doc(params={"limit": f"how many items (<={MAX_SIMILAR}, default {DEFAULT_SIMILAR})"})
+    @ns.response(200, "Success", SimilarOut)
+    @versioned
+    def get(self, item_id):
+        """Items whose images look most like this one's (color, pattern, texture), most similar first."""
+        try:
+            limit = int(request.args.get("limit", DEFAULT_SIMILAR))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= MAX_SIMILAR:
+            abort(400, description=f"limit must be an integer in [1, {MAX_SIMILAR}]")
+        res = dao.similar_items(item_id, limit, fields=ITEM_FIELDS, user_id=USER_ID)
+        if res is None: abort(404, description="Item not found")
+        return res
+
 @ns.route("/<int:item_id>")
 @ns.param("item_id", "Item ID")
 class ItemDetail(Resource):
-    @ns.marshal_with(ItemOut)
+    @ns.response(200, "Success", ItemOut)
+    @versioned
     def get(self, item_id):
-        i = dao.get_item(item_id)
+        i = dao.get_item(item_id, fields=ITEM_FIELDS, user_id=USER_ID)
         if not i: abort(404, description="Item not found")
-        return dump_item(i)
+        return i
 
     @ns.expect(ItemIn, validate=False)
     @ns.marshal_with(ItemOut)
     def put(self, item_id):
         data = update_schema.load(request.get_json(force=True) or {})
-        i = dao.update_item(item_id, **data)
+        i = dao.update_item(item_id, user_id=USER_ID, **data)
         if not i: abort(404, description="Item not found")
         return dump_item(i)
 
     @ns.response(204, "Deleted")
     def delete(self, item_id):
-        ok = dao.delete_item(item_id)
+        ok = dao.delete_item(item_id, user_id=USER_ID)
         if not ok: abort(404, description="Item not found")
         return "", 204
 
+# ---- outfits ----
+outfits_ns = api.namespace("outfits", description="Outfit suggestions")
+
+OutfitOut = outfits_ns.model("Outfit", {
+    "score": fields.Float,
+    "items": fields.List(fields.Nested(ItemOut)),
+})
+OutfitListOut = api.model("OutfitListResponse", {
+    "data": fields.List(fields.Nested(OutfitOut)),
+    "truncated": fields.Boolean,
+    "elapsed_ms": fields.Float,
+})
+
+def all_items(page_size=100):
+    """Walk every page of dao.list_items by cursor (the matcher needs the whole wardrobe)."""
+    out, cursor = [], None
+    while True:
+        res = dao.list_items(per_page=page_size, cursor=cursor, count="none")
+        out.extend(res["items"])
+        cursor = res["next_cursor"]
+        if not cursor: return out
+
+def wardrobe():
+    """The user's items split by season, loaded once per wardrobe version."""
+    return get_seasonal((USER_ID, dao.wardrobe_version(USER_ID)), all_items)
+
+@outfits_ns.route("")
+class Outfits(Resource):
+    @outfits_ns.doc(params={
+        "k":"number of outfits (<=50, default 5)",
+        "budget_ms":f"latency budget for the search (default {DEFAULT_BUDGET_MS:g})",
+        "season":"spring|summer|fall|winter",
+        "accessories":"include an accessory (default true)",
+    })
+    @outfits_ns.marshal_with(OutfitListOut)
+    def get(self):
+        k = max(1, min(int(request.args.get("k", 5)), 50))
+        budget = float(request.args.get("budget_ms", DEFAULT_BUDGET_MS))
+        # matrices for the whole wardrobe are built once per wardrobe version
+        res = wardrobe().index_for(()).top_k(
+            k, budget_ms=max(budget, 0.0),
+            season=request.args.get("season"),
+            include_accessories=request.args.get("accessories", "true").lower() != "false",
+        )
+        return {
+            "data": [{"score": o["score"], "items": [dump_item(i) for i in o["items"]]}
+                     for o in res["outfits"]],
+            "truncated": res["truncated"], "elapsed_ms": res["elapsed_ms"],
+        }
+
+RecommendationOut = api.model("WeatherRecommendationResponse", {
+    "forecast": fields.Raw(description="current conditions for the location's cell"),
+    "band": fields.String(description="hot|warm|mild|cool|cold, from the feels-like temperature"),
+    "seasons": fields.List(fields.String, description="item seasons worn in that band"),
+    "data": fields.List(fields.Nested(OutfitOut)),
+    "truncated": fields.Boolean,
+    "elapsed_ms": fields.Float,
+})
+
+@outfits_ns.route("/recommended")
+class RecommendedOutfits(Resource):
+    @outfits_ns.doc(params={
+        "lat":"latitude (required)",
+        "lon":"longitude (required)",
+        "k":"number of outfits (<=50, default 5)",
+        "budget_ms":f"latency budget for the search (default {DEFAULT_BUDGET_MS:g})",
+        "accessories":"include an accessory (default true)",
+    })
+    @outfits_ns.response(503, "Forecast unavailable")
+    @outfits_ns.marshal_with(RecommendationOut)
+    def get(self):
+        """Outfits for the current weather: only items whose season fits the forecast."""
+        cache = forecasts()
+        try:
+            lat, lon = float(request.args["lat"]), float(request.args["lon"])
+            forecast, cell, cached = cache.get(lat, lon)
+        except (KeyError, ValueError):
+            abort(400, description="lat and lon are required, within [-90, 90] and [-180, 180]")
+        except ForecastUnavailable as e:
+            abort(503, description=str(e))
+        band, seasons = warmth_band(forecast.feels_like_c)
+        k = max(1, min(int(request.args.get("k", 5)), 50))
+        budget = float(request.args.get("budget_ms", DEFAULT_BUDGET_MS))
+        # per-season sets are built once per wardrobe version
+        res = wardrobe().index_for(seasons).top_k(
+            k, budget_ms=max(budget, 0.0),
+            include_accessories=request.args.get("accessories", "true").lower() != "false",
+        )
+        return {
+            "forecast": forecast_payload(forecast, cell, cached),
+            "band": band, "seasons": list(seasons),
+            "data": [{"score": o["score"], "items": [dump_item(i) for i in o["items"]]}
+                     for o in res["outfits"]],
+            "truncated": res["truncated"], "elapsed_ms": res["elapsed_ms"],
+        }
+
 # simple health for quick check
 root = api.namespace("")
 @root.route("/health")
 class Health(Resource):
     def get(self): return {"status":"ok"}
+
+# ---- whole-wardrobe archive: streaming export, resumable import (see archive.py) ----
+# archive is imported by the handlers: nothing else in the API needs it
+ImportIn = api.model("ImportRequest", {
+    "size": fields.Integer(required=True, description="bytes of the archive that will be uploaded"),
+})
+ImportOut = api.model("ImportStatus", {
+    "id": fields.String,
+    "status": fields.String(description="uploading|importing|done|failed"),
+    "size": fields.Integer, "received": fields.Integer(description="bytes stored so far; resume here"),
+    "items_imported": fields.Integer,
+    "images_created": fields.Integer,
+    "images_skipped": fields.Integer(description="already stored (same content hash), not re-read"),
+    "failed": fields.Integer(description="item records or images that couldn't be imported"),
+    "error": fields.String(description="the last of those problems, or why the import failed"),
+    "created_at": fields.String, "updated_at": fields.String,
+})
+
+def import_response(job: dict):
+    # tus-style header, so clients can resume without parsing the body
+    return job, 200, {"Upload-Offset": str(job["received"])}
+
+def queue_analysis(digest: str) -> None:
+    """Analysis (colors, hash, vector) of an imported image; `manage.py reanalyze` covers a full queue."""
+    from .jobs import job_queue, QueueFull
+    try:
+        job_queue().submit(digest)
+    except QueueFull:
+        pass
+
+@root.route("/export")
+class Export(Resource):
+    @root.doc(params={"format": "zip|tar (default zip)"})
+    @root.produces(["application/zip", "application/x-tar"])
+    def get(self):
+        """
+        The whole wardrobe as one archive: NDJSON item records plus every image
+        file, streamed as it is read (see archive.py for the layout).
+        """
+        from . import archive
+        fmt = request.args.get("format", "zip")
+        if fmt not in archive.FORMATS:
+            abort(400, description="format must be zip or tar")
+        name = f"wardrobe-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+        return Response(archive.export_archive(USER_ID, fmt), mimetype=archive.FORMATS[fmt].mimetype,
+                        headers={"Content-Disposition": f'attachment; filename="{name}"',
+                                 "Cache-Control": "no-store"})
+
+@root.route("/imports")
+class Imports(Resource):
+    @root.expect(ImportIn, validate=True)
+    @root.response(201, "Created", ImportOut)
+    def post(self):
+        """
+        Start an archive import: announce its size, then PATCH /imports/<id> with
+        the bytes (any number of requests, each at the Upload-Offset reached).
+        """
+        from . import archive
+        size = (request.get_json(force=True) or {}).get("size")
+        if not isinstance(size, int) or size <= 0:
+            abort(400, description="size must be a positive integer")
+        if size > archive.IMPORT_MAX_BYTES:
+            abort(413, description=f"Archives are limited to {archive.IMPORT_MAX_BYTES} bytes")
+        job = archive.create_import(USER_ID, size)
+        return job, 201, {"Location": f"{request.path}/{job['id']}", "Upload-Offset": "0"}
+
+@root.route("/imports/<string:import_id>")
+@root.param("import_id", "Import ID")
+class ImportUpload(Resource):
+    @root.response(200, "Success", ImportOut)
+    def get(self, import_id):
+        """Upload/import progress; `received` (also the Upload-Offset header) is where to resume."""
+        from . import archive
+        job = archive.import_status(USER_ID, import_id)
+        if job is None: abort(404, description="Import not found")
+        return import_response(job)
+
+    @root.doc(params={"Upload-Offset": {"in": "header", "description": "byte offset of this chunk"}})
+    @root.response(200, "Success", ImportOut)
+    @root.response(409, "Offset doesn't match the bytes received, or the upload is busy")
+    def patch(self, import_id):
+        """
+        The next bytes of the archive (raw body). The request that completes it
+        runs the import; if that is interrupted, an empty PATCH at the final
+        offset resumes it where the last committed batch ended.
+        """
+        from . import archive
+        from .utils_files import CHUNK_SIZE
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            abort(400, description="Upload-Offset header (an integer) is required")
+        try:
+            job = archive.append_upload(USER_ID, import_id, offset,
+                                        iter(lambda: request.stream.read(CHUNK_SIZE), b""),
+                                        submit=queue_analysis)
+        except LookupError:
+            abort(404, description="Import not found")
+        except archive.UploadOffsetMismatch as e:
+            return {"message": str(e), "received": e.received}, 409, {"Upload-Offset": str(e.received)}
+        except archive.UploadBusy as e:
+            abort(409, description=str(e))
+        except archive.ArchiveError as e:
+            abort(400, description=str(e))
+        return import_response(job)
@@ -0,0 +1,228 @@
+# backend/api_async.py
+"""
+Async versions of the item endpoints in api.py, served by the FastAPI app in
+main.py under the same /api/v1 paths.
+
+Item queries call the same dao functions as the Flask side, in a small
+dedicated threadpool (DAO_THREADS): shard routing, the move fence and the
+catalog session are all blocking SQLite work, and none of it runs on the
+event loop. Request bodies are validated with the same marshmallow schemas.
+Upload copying, hashing and storing (blob row and file moves) run in the
+threadpool and image analysis runs in the jobs.py process pool, so the event
+loop only waits on them.
+"""
+import os
+import uuid
+from functools import partial
+from typing import Optional
+
+import anyio
+
+from fastapi import APIRouter, Body, File, Form, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from marshmallow import ValidationError
+
+try:
+    from .schemas import CreateClothingItemDTO, UpdateClothingItemDTO, ClothingItemDTO, ITEM_FIELDS
+    from . import dao
+    from .db import SessionLocal, ensure_db
+    from .blob_store import default_store, blob_relpath
+    from .utils_files import IngestFile, allowed_extension, CHUNK_SIZE
+    from .jobs import job_queue, QueueFull, ANALYSIS_FIELDS
+except ImportError:  # run from inside backend/ (uvicorn main:app)
+    from schemas import CreateClothingItemDTO, UpdateClothingItemDTO, ClothingItemDTO, ITEM_FIELDS
+    import dao
+    from db import SessionLocal, ensure_db
+    from blob_store import default_store, blob_relpath
+    from utils_files import IngestFile, allowed_extension, CHUNK_SIZE
+    from jobs import job_queue, QueueFull, ANALYSIS_FIELDS
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback
+    orjson = None
+
+# Same env var / default as app_images.MAX_CONTENT_LENGTH
+MAX_CONTENT_LENGTH = int(float(os.getenv("ASSET_MAX_MB", "10")) * 1024 * 1024)
+# Threads for dao calls. The DAO is mostly Python under the GIL and SQLite
+# takes one writer at a time, so a few threads keep the loop responsive where
+# anyio's default 40 would just contend with it
+DAO_THREADS = int(os.getenv("DAO_THREADS", "4"))
+
+router = APIRouter(prefix="/api/v1")
+create_schema = CreateClothingItemDTO()
+update_schema = UpdateClothingItemDTO()
+out_schema = ClothingItemDTO()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson, for bodies that are already plain dicts."""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content) if orjson else super().render(content)
+
+
+_dao_limiter = None
+
+
+async def run_dao(fn, *args, **kwargs):
+    """
+    Run one of dao's module-level functions in the DAO threadpool. The call
+    does its own shard routing, move fencing and catalog session
+    (shards.run_for_user), so it is rerouted if the user moves meanwhile.
+    """
+    global _dao_limiter
+    if _dao_limiter is None:
+        _dao_limiter = anyio.CapacityLimiter(DAO_THREADS)
+    return await anyio.to_thread.run_sync(partial(fn, *args, **kwargs), limiter=_dao_limiter)
+
+
+def validation_error_handler(request: Request, err: ValidationError):
+    # same body as errors.register_error_handlers on the Flask side
+    return JSONResponse({"error": "validation_error", "details": err.messages}, status_code=422)
+
+
+# ---- items ----
+@router.get("/items")
+async def list_items(category: Optional[str] = None, color: Optional[str] = None,
+                     tolerance: float = 10.0, q: Optional[str] = None,
+                     sort: str = "recent", page: int = 1, per_page: int = 20,
+                     cursor: Optional[str] = None, count: str = "exact"):
+    if count not in ("exact", "cached", "none"):
+        raise HTTPException(400, "count must be exact, cached or none")
+    try:
+        res = await run_dao(dao.list_items, category=category, color=color, q=q, sort=sort,
+                            page=page, per_page=min(per_page, 100), cursor=cursor or None,
+                            count=count, tolerance=tolerance, fields=ITEM_FIELDS)
+    except ValueError as e:  # malformed / mismatched cursor, unknown color or sort
+        raise HTTPException(400, str(e))
+    # rows arrive already shaped like ClothingItemDTO; encode them as-is
+    return FastJSONResponse({
+        "data": res["items"],
+        "page": res["page"], "pages": res["pages"], "total": res["total"],
+        "next_cursor": res["next_cursor"],
+    })
+
+
+@router.post("/items", status_code=201)
+async def create_item(payload: dict = Body(...)):
+    data = create_schema.load(payload)  # validates + normalizes
+    return out_schema.dump(await run_dao(dao.create_item, **data))
+
+
+@router.get("/items/{item_id}")
+async def get_item(item_id: int):
+    item = await run_dao(dao.get_item, item_id, fields=ITEM_FIELDS)
+    if not item:
+        raise HTTPException(404, "Item not found")
+    return FastJSONResponse(item)
+
+
+@router.put("/items/{item_id}")
+async def update_item(item_id: int, payload: dict = Body(default={})):
+    data = update_schema.load(payload or {})
+    item = await run_dao(dao.update_item, item_id, **data)
+    if not item:
+        raise HTTPException(404, "Item not found")
+    return out_schema.dump(item)
+
+
+@router.delete("/items/{item_id}", status_code=204)
+async def delete_item(item_id: int):
+    if not await run_dao(dao.delete_item, item_id):
+        raise HTTPException(404, "Item not found")
+    return Response(status_code=204)
+
+
+# ---- image upload ----
+class NotAnImage(HTTPException):
+    def __init__(self):
+        super().__init__(400, "Uploaded file is not a recognized image")
+
+
+class UploadTooLarge(HTTPException):
+    def __init__(self):
+        super().__init__(413, f"File too large (max {MAX_CONTENT_LENGTH} bytes)")
+
+
+def _ingest(src, dest) -> IngestFile:
+    """Copy the spooled upload into the store's temp file, sniffing + hashing as it goes."""
+    ingest = IngestFile(dest, max_bytes=MAX_CONTENT_LENGTH,
+                        on_bad_type=NotAnImage, on_too_large=UploadTooLarge)
+    try:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            ingest.write(chunk)
+        if ingest.kind is None:  # too short to carry a signature
+            raise NotAnImage()
+    except BaseException:
+        ingest.close()
+        raise
+    ingest.finish()
+    return ingest
+
+
+def _store(ingest: IngestFile, blobs) -> tuple[str, bool]:
+    """(relative path, created) of the upload's blob; blobs live in the catalog, as for app_images."""
+    ensure_db()
+    with SessionLocal() as s:
+        existing = blobs.lookup(s, ingest.hexdigest)
+        if existing is not None:
+            ingest.close()  # drops the temp copy
+            return blob_relpath(existing.digest, existing.ext), False
+        return blobs.put_file(s, ingest.path, ingest.hexdigest, ingest.kind, ingest.size)
+
+
+@router.post("/images")
+async def upload_image(request: Request, image: UploadFile = File(...),
+                       item_id: Optional[int] = Form(None), wait: Optional[float] = Form(None)):
+    """
+    Async counterpart of app_images.upload_image: same response body, stored
+    in the same content-addressed blob store and served under /assets, and
+    analysed by the same job queue.
+    """
+    if not image.filename:
+        raise HTTPException(400, "Empty filename")
+    if not allowed_extension(image.filename):
+        raise HTTPException(400, "Unsupported file extension")
+    blobs = default_store()
+    blobs.root.mkdir(parents=True, exist_ok=True)
+    ingest = await run_in_threadpool(_ingest, image.file, blobs.root / f"__tmp__{uuid.uuid4().hex}")
+
+    relname, created = await run_in_threadpool(_store, ingest, blobs)
+    image_url = str(request.url_for("assets", path=relname))
+    if item_id is not None and not await run_dao(dao.update_item, item_id, image_url=image_url):
+        item_id = None  # no such item: keep the upload, skip the link
+
+    jobs = job_queue()
+    try:
+        job = await run_in_threadpool(jobs.submit, ingest.hexdigest, item_id=item_id)
+    except QueueFull as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": str(e.retry_after)})
+    if wait and job["status"] not in ("done", "failed"):
+        job = await run_in_threadpool(jobs.wait, job["id"], wait)
+    analysis = job["result"] or {}
+
+    return JSONResponse({
+        "image_url": image_url,
+        "filename": relname,
+        "sha256": ingest.hexdigest,
+        "size_bytes": ingest.size,
+        "deduplicated": not created,
+        "item_id": item_id,
+        "job": {"id": job["id"], "status": job["status"],
+                "url": str(request.url_for("get_job", job_id=job["id"]))},
+        **{field: analysis.get(field) for field in ANALYSIS_FIELDS},
+    }, status_code=201 if created else 200)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: int, wait: Optional[float] = None):
+    """Analysis job status, as app_images.get_job; ?wait=<seconds> (<= 30) waits for it to finish."""
+    jobs = job_queue()
+    if wait:
+        job = await run_in_threadpool(jobs.wait, job_id, wait)
+    else:
+        job = await run_in_threadpool(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return FastJSONResponse(job)
@@ -1,13 +1,22 @@
 # app_images.py
 import os
-import imghdr
 import uuid
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional
+from urllib.parse import urlsplit
 
-from flask import Flask, request, jsonify, send_from_directory, url_for, abort
-from werkzeug.utils import secure_filename
-from werkzeug.exceptions import RequestEntityTooLarge
+from flask import (Blueprint, Flask, Request, request, jsonify, send_from_directory, send_file,
+                   url_for, abort, current_app)
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+from image_variants import VariantStore, negotiate_format, PREGENERATE_WIDTHS
+from blob_store import BlobStore, blob_relpath
+from db import SessionLocal, ensure_db
+from dao import update_item, image_urls
+from jobs import job_queue, QueueFull, ANALYSIS_FIELDS
+from utils_files import IngestFile, sniff_image_type, allowed_extension, SNIFF_BYTES
+from metrics import instrument_flask
+from startup import preload
 
 # -----------------------------------------------------------------------------
 # Configuration
@@ -19,44 +28,53 @@ ASSET_DIR = Path(os.getenv("ASSET_DIR", "./images")).resolve()
 MAX_MB = float(os.getenv("ASSET_MAX_MB", "10"))  # default 10 MiB
 MAX_CONTENT_LENGTH = int(MAX_MB * 1024 * 1024)   # Flask expects bytes
 
-# Allowed extensions (basic validation). We also validate with imghdr.
-ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
+class NotAnImage(BadRequest):
+    description = "Uploaded file is not a recognized image"
 
-app = Flask(__name__)
-app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+class UploadRequest(Request):
+    """
+    Streams each multipart file part straight into an IngestFile in ASSET_DIR:
+    one pass sniffs the type, hashes, counts and enforces the size limit,
+    instead of save -> re-open -> sniff -> stat.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return IngestFile(
+            ASSET_DIR / f"__tmp__{uuid.uuid4().hex}",
+            max_bytes=MAX_CONTENT_LENGTH,
+            on_bad_type=NotAnImage,
+            on_too_large=RequestEntityTooLarge,
+        )
 
-# Ensure the asset directory exists
-ASSET_DIR.mkdir(parents=True, exist_ok=True)
+bp = Blueprint("images", __name__)
 
-# -----------------------------------------------------------------------------
-# In-memory "DB" for demo purposes
-# -----------------------------------------------------------------------------
-# item_id -> filename (string). Replace with real DB integration later.
-ITEM_IMAGE_MAP: Dict[int, str] = {}
+# Uploads are stored by content hash: ASSET_DIR/ab/cd/<sha256>.<ext>
+BLOBS = BlobStore(ASSET_DIR)
+
+# Resized/re-encoded variants (/assets/<file>?w=320&fmt=webp), cached on disk
+VARIANTS = VariantStore(ASSET_DIR, Path(os.getenv("VARIANT_DIR", str(ASSET_DIR / ".variants"))))
+
+# Max item ids per batch image lookup (one browse page is at most 100 items)
+MAX_LOOKUP_IDS = 100
 
 # -----------------------------------------------------------------------------
 # Utilities
 # -----------------------------------------------------------------------------
-def allowed_extension(filename: str) -> bool:
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
-
 def detect_image_type(path: Path) -> Optional[str]:
     """
-    Minimal file-type sniffing for safety. Uses Python stdlib imghdr.
+    Minimal file-type sniffing for safety, from the file's magic bytes.
     Returns a type like 'png', 'jpeg', 'gif', 'webp', or None if unknown.
     """
     try:
-        kind = imghdr.what(path)
-    except Exception:
-        kind = None
-    return kind
+        with open(path, "rb") as fh:
+            return sniff_image_type(fh.read(SNIFF_BYTES))
+    except OSError:
+        return None
 
-def safe_unique_filename(original_name: str, detected_ext: Optional[str]) -> str:
+def normalized_extension(original_name: str, detected_ext: Optional[str]) -> str:
     """
-    Generate a collision-resistant filename using UUID4 while preserving extension.
-    If the original extension is untrusted, prefer the detected image extension.
+    Extension for the stored blob. The original extension is untrusted,
+    so prefer the detected image type.
     """
-    base = secure_filename(Path(original_name).stem) or "image"
     # Prefer detected extension if available, else fall back to original
     orig_ext = Path(original_name).suffix.lower().lstrip(".")
     ext = (detected_ext or orig_ext or "png").lower()
@@ -66,42 +84,63 @@ def safe_unique_filename(original_name: str, detected_ext: Optional[str]) -> str
     if ext not in {"png", "jpeg", "gif", "webp"}:
         # Fallback to png if we got something odd
         ext = "png"
-    return f"{base}-{uuid.uuid4().hex}.{ext}"
+    return ext
 
 def build_asset_url(filename: str) -> str:
-    return url_for("serve_asset", filename=filename, _external=True)
+    return url_for("images.serve_asset", filename=filename, _external=True)
 
-def extract_dominant_color(path: Path) -> str:
-    """
-    Stub for future color analysis (no real CV required now).
-    Return a hex color string as a placeholder.
-    """
-    # TODO: Implement real color extraction later.
-    return "#808080"
+def asset_filename(image_url: Optional[str]) -> Optional[str]:
+    """Stored filename behind an /assets/ URL, or None for images hosted elsewhere."""
+    if not image_url:
+        return None
+    path = urlsplit(image_url).path
+    return path.split("/assets/", 1)[1] if "/assets/" in path else None
 
-def associate_image_with_item(item_id: int, filename: str) -> None:
+def associate_image_with_item(item_id: int, filename: str) -> bool:
     """
-    Helper to associate an image with an item after your /api/items flow.
-    Replace with your real persistence layer (DAO/ORM) later.
+    Point the item's image_url at a stored image (through the DAO, so blob
+    refcounts and the image-URL cache stay in step). False if there is no such item.
     """
-    ITEM_IMAGE_MAP[item_id] = filename
+    return update_item(item_id, image_url=build_asset_url(filename)) is not None
+
+def item_image_urls(item_ids) -> dict:
+    """item_id -> image_url (None if the item has no image); unknown ids are left out."""
+    return image_urls(list(item_ids))
+
+def job_summary(job: dict) -> dict:
+    return {"id": job["id"], "status": job["status"],
+            "url": url_for("images.get_job", job_id=job["id"], _external=True)}
+
+def image_payload(item_id: int, image_url: str) -> dict:
+    return {"item_id": item_id, "filename": asset_filename(image_url), "image_url": image_url}
 
 # -----------------------------------------------------------------------------
 # Error handlers
 # -----------------------------------------------------------------------------
-@app.errorhandler(RequestEntityTooLarge)
+@bp.app_errorhandler(RequestEntityTooLarge)
 def handle_file_too_large(e):
-    return jsonify(error="File too large", max_bytes=app.config["MAX_CONTENT_LENGTH"]), 413
+    return jsonify(error="File too large", max_bytes=current_app.config["MAX_CONTENT_LENGTH"]), 413
+
+@bp.app_errorhandler(NotAnImage)
+def handle_not_an_image(e):
+    return jsonify(error=e.description), 400
 
 # -----------------------------------------------------------------------------
 # Routes
 # -----------------------------------------------------------------------------
-@app.route("/api/images", methods=["POST"])
+@bp.route("/api/images", methods=["POST"])
 def upload_image():
     """
     Accepts multipart/form-data with field 'image'.
-    Optional: include 'item_id' to associate immediately.
-    Returns: { image_url, filename, size_bytes, dominant_color, item_id? }
+    Optional: include 'item_id' to associate immediately, and 'wait' (seconds,
+    <= 30) to wait for the analysis instead of picking it up from the job.
+    Returns: { image_url, filename, sha256, size_bytes, deduplicated, item_id?,
+               job: {id, status, url}, dominant_color, palette, phash, possible_duplicates }
+    201 for a new image, 200 when identical bytes were already stored.
+    Colors, hash and possible_duplicates ([{item_id, distance}], nearest
+    first) come from the analysis job (see jobs.py) and are null until it is
+    done; identical bytes reuse the earlier analysis, so they're done at once.
+    503 + Retry-After when the analysis queue is full.
     """
     if "image" not in request.files:
         return jsonify(error="Missing file field 'image'"), 400
@@ -114,40 +153,60 @@ def upload_image():
     if not allowed_extension(file.filename):
         return jsonify(error="Unsupported file extension"), 400
 
-    # Save to a temp path first to allow type sniffing safely
-    tmp_name = secure_filename(file.filename) or "upload"
-    tmp_path = ASSET_DIR / f"__tmp__{uuid.uuid4().hex}_{tmp_name}"
-    file.save(tmp_path)
-
-    # Basic sniffing: ensure it's actually an image
-    detected_type = detect_image_type(tmp_path)
-    if detected_type is None:
-        tmp_path.unlink(missing_ok=True)
+    # The body was already sniffed, hashed and measured while it streamed in
+    # (see UploadRequest); a non-image was rejected after its first bytes.
+    ingest = file.stream
+    if ingest.kind is None:  # too short to carry a signature
         return jsonify(error="Uploaded file is not a recognized image"), 400
+    digest, size_bytes = ingest.hexdigest, ingest.size
 
-    # Final safe unique filename (prefer detected type)
-    final_name = safe_unique_filename(file.filename, detected_type)
-    final_path = ASSET_DIR / final_name
-    tmp_path.replace(final_path)  # atomic move within same filesystem
+    db = SessionLocal()
+    try:
+        existing = BLOBS.lookup(db, digest)
+        if existing is not None:
+            # duplicate: the temp copy is dropped when the request closes
+            final_name, created = blob_relpath(existing.digest, existing.ext), False
+        else:
+            ingest.finish()
+            ext = normalized_extension(file.filename, ingest.kind)
+            final_name, created = BLOBS.put_file(db, ingest.path, digest, ext, size_bytes)
+    finally:
+        db.close()
+
+    # Warm the standard thumbnail sizes in the background (ASSET_PREGENERATE_WIDTHS)
+    if created:
+        VARIANTS.pregenerate(final_name, PREGENERATE_WIDTHS)
 
     # Optional: associate with item_id if provided
     item_id = request.form.get("item_id", type=int)
-    if item_id is not None:
-        associate_image_with_item(item_id, final_name)
+    if item_id is not None and not associate_image_with_item(item_id, final_name):
+        current_app.logger.warning("upload %s: item %s does not exist, not linked", final_name, item_id)
+        item_id = None
 
-    # Minimal metadata
-    dominant_color = extract_dominant_color(final_path)
-    size_bytes = final_path.stat().st_size
+    # Colors + perceptual hash run in the job pool (jobs.py), off this thread.
+    # Queue full: the image is kept, and re-sending it just queues its analysis.
+    jobs = job_queue()
+    try:
+        job = jobs.submit(digest, item_id=item_id)
+    except QueueFull as e:
+        return jsonify(error=str(e), retry_after=e.retry_after), 503, {"Retry-After": str(e.retry_after)}
+    wait = request.values.get("wait", type=float)
+    if wait and job["status"] not in ("done", "failed"):
+        job = jobs.wait(job["id"], wait)
+    analysis = job["result"] or {}
 
     return jsonify(
         image_url=build_asset_url(final_name),
         filename=final_name,
+        sha256=digest,
         size_bytes=size_bytes,
-        dominant_color=dominant_color,
+        deduplicated=not created,
         item_id=item_id,
-    ), 201
+        job=job_summary(job),
+        **{field: analysis.get(field) for field in ANALYSIS_FIELDS},
+    ), (201 if created else 200)
 
-@app.route("/api/items/<int:item_id>/image", methods=["POST"])
+@bp.route("/api/items/<int:item_id>/image", methods=["POST"])
 def link_item_image(item_id: int):
     """
     Helper endpoint to associate an already-uploaded image with an item.
@@ -161,7 +220,8 @@ def link_item_image(item_id: int):
     if not path.exists():
         return jsonify(error="File not found"), 404
 
-    associate_image_with_item(item_id, filename)
+    if not associate_image_with_item(item_id, filename):
+        return jsonify(error="Item not found"), 404
     return jsonify(
         item_id=item_id,
         filename=filename,
@@ -169,39 +229,121 @@ def link_item_image(item_id: int):
         message="Image associated with item."
     ), 200
 
-@app.route("/assets/<path:filename>", methods=["GET"])
+@bp.route("/assets/<path:filename>", methods=["GET"])
 def serve_asset(filename: str):
     """
     Static file serving route. Reverse proxy/real static hosting is recommended
     in production, but this satisfies the DoD for local dev and simple deploys.
+
+    With ?w=<px> and/or ?fmt=webp|jpeg|png a resized/re-encoded variant is
+    served instead (format negotiated from Accept when fmt is omitted).
     """
-    # Normalize to prevent path traversal; send_from_directory handles safety, too.
-    return send_from_directory(ASSET_DIR, filename, as_attachment=False, etag=True, cache_timeout=31536000)
+    width = request.args.get("w", type=int)
+    fmt = request.args.get("fmt")
+    if width is None and fmt is None:
+        # Normalize to prevent path traversal; send_from_directory handles safety, too.
+        return send_from_directory(ASSET_DIR, filename, as_attachment=False, etag=True, max_age=31536000)
 
-@app.route("/api/items/<int:item_id>/image", methods=["GET"])
+    try:
+        source = VARIANTS.source_path(filename)
+        fmt = negotiate_format(fmt, request.headers.get("Accept"), source)
+        variant = VARIANTS.get(filename, width, fmt)
+    except FileNotFoundError:
+        abort(404)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    resp = send_file(variant.path, mimetype=variant.mimetype, etag=variant.etag,
+                     conditional=True, max_age=31536000)
+    resp.vary.add("Accept")
+    return resp
+
+@bp.route("/api/items/<int:item_id>/image", methods=["GET"])
 def get_item_image(item_id: int):
     """
-    Convenience: fetch the image URL for an item_id (from our in-memory map).
+    Convenience: fetch the image URL for an item_id (the item's image_url,
+    read through the DAO's in-process cache).
     """
-    filename = ITEM_IMAGE_MAP.get(item_id)
-    if not filename:
+    urls = item_image_urls([item_id])
+    if item_id not in urls:
+        return jsonify(error="Item not found"), 404
+    if not urls[item_id]:
         return jsonify(error="No image associated with this item"), 404
+    return jsonify(image_payload(item_id, urls[item_id]))
+
+@bp.route("/api/items/images", methods=["GET"])
+def get_item_images():
+    """
+    Batch lookup for a page of items: ?ids=1,2,3 (at most MAX_LOOKUP_IDS).
+    Returns { images: [{item_id, filename, image_url}], missing: [ids] };
+    items without an image come back with image_url null.
+    """
+    try:
+        ids = [int(x) for x in request.args.get("ids", "").split(",") if x.strip()]
+    except ValueError:
+        return jsonify(error="ids must be a comma-separated list of integers"), 400
+    if len(ids) > MAX_LOOKUP_IDS:
+        return jsonify(error=f"At most {MAX_LOOKUP_IDS} ids per request"), 400
+    urls = item_image_urls(ids)
     return jsonify(
-        item_id=item_id,
-        filename=filename,
-        image_url=build_asset_url(filename)
+        images=[image_payload(i, urls[i]) for i in dict.fromkeys(ids) if i in urls],
+        missing=[i for i in dict.fromkeys(ids) if i not in urls],
     )
 
+@bp.route("/api/jobs/<int:job_id>", methods=["GET"])
+def get_job(job_id: int):
+    """
+    Status of an analysis job: { id, status (queued|running|done|failed),
+    digest, item_id, attempts, error, result, created_at, updated_at }.
+    ?wait=<seconds> (<= 30) holds the request until the job finishes or time is up.
+    """
+    wait = request.args.get("wait", type=float)
+    job = job_queue().wait(job_id, wait) if wait else job_queue().get(job_id)
+    if job is None:
+        return jsonify(error="Job not found"), 404
+    return jsonify(job)
+
 # -----------------------------------------------------------------------------
 # Health check / root
 # -----------------------------------------------------------------------------
-@app.get("/health")
+@bp.get("/health")
 def health():
-    return jsonify(status="ok", asset_dir=str(ASSET_DIR), max_bytes=app.config["MAX_CONTENT_LENGTH"])
+    return jsonify(status="ok", asset_dir=str(ASSET_DIR), max_bytes=current_app.config["MAX_CONTENT_LENGTH"])
 
 # -----------------------------------------------------------------------------
 # App entrypoint
 # -----------------------------------------------------------------------------
+def create_app(lazy: bool = True) -> Flask:
+    """
+    The image service. The schema is created/migrated by the first request
+    (db.ensure_db), NumPy/Pillow load with the first analysis job or variant;
+    lazy=False does all of that here instead.
+    """
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+    instrument_flask(app, "images")  # GET /metrics
+    ASSET_DIR.mkdir(parents=True, exist_ok=True)  # uploads stream straight into it
+    app.before_request(ensure_db)
+    app.register_blueprint(bp)
+    if not lazy:
+        ensure_db()
+        preload("features", "PIL.Image")
+    return app
+
+_app = None
+
+def __getattr__(name):
+    # `app_images.app` (flask --app, gunicorn app_images:app) is built on first access
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
+    app = create_app()
+    job_queue()  # resume analysis jobs a previous run left unfinished
     # 0.0.0.0 to be reachable in Docker/WSL; threaded for basic concurrency.
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), threaded=True)
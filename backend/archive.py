@@ -0,0 +1,548 @@
+# archive.py
+"""
+Whole-wardrobe export and import as one zip or tar archive.
+
+An export is streamed straight from generators: item rows are read in
+keyset batches and every image file in chunks, so memory stays flat however
+many multi-MB images there are. Members, in order:
+
+    manifest.json                  {"format", "version", "exported_at", "user_id", "items"}
+    blobs/ab/cd/<sha256>.<ext>     stored images (content-addressed, see blob_store.py)
+    uploads/<path>                 legacy files under ./uploads that items point at
+    items/000001.ndjson            one JSON item record per line, EXPORT_BATCH per member
+
+Each batch's images come before its items member, so an importer reading
+in order has stored every image before the items that show it.
+
+Imports are uploaded resumably (create_import, then append_upload at the
+offset the server reports) into IMPORT_DIR and applied once the last byte
+arrives. Items go in with one transaction per batch, and each transaction
+also records the position reached in the archive, so an interrupted import
+carries on from there instead of inserting anything twice. Images whose
+content hash is already stored are skipped without being read.
+
+    IMPORT_DIR     where uploads are kept until imported (default ./imports)
+    IMPORT_MAX_MB  largest archive accepted (default 4096)
+"""
+from __future__ import annotations
+
+import json
+import os
+import tarfile
+import time
+import uuid
+import zipfile
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from typing import IO, Callable, Iterable, Iterator
+from urllib.parse import urlsplit
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock on uploads
+    fcntl = None
+
+try:
+    from .models import ArchiveImport, Blob, Item, ItemKind
+    from .db import ensure_db
+    from .shards import run_for_user, catalog_of
+    from .blob_store import BlobStore, blob_relpath, default_store, digest_from_ref
+    from .utils_files import CHUNK_SIZE, IngestFile, sha256_file
+    from .dao import SQLItemDAO
+except ImportError:  # run from inside backend/
+    from models import ArchiveImport, Blob, Item, ItemKind
+    from db import ensure_db
+    from shards import run_for_user, catalog_of
+    from blob_store import BlobStore, blob_relpath, default_store, digest_from_ref
+    from utils_files import CHUNK_SIZE, IngestFile, sha256_file
+    from dao import SQLItemDAO
+
+FORMAT = "dressme-wardrobe"
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+EXPORT_BATCH = 500  # items per NDJSON member, and per import transaction
+UPLOAD_DIR = Path("uploads")  # served at /uploads by main.py
+IMPORT_DIR = Path(os.getenv("IMPORT_DIR", "./imports")).resolve()
+IMPORT_MAX_BYTES = int(float(os.getenv("IMPORT_MAX_MB", "4096")) * 1024 * 1024)
+
+# item columns an export carries; ids are only informative (imports assign new ones),
+# values derived from images (Lab cell, hash, feature row) are recomputed on import
+EXPORT_COLUMNS = ("id", "kind", "name", "brand", "image_url", "main_color_hex", "is_neutral",
+                  "season", "created_at", "updated_at")
+
+
+class ArchiveError(ValueError):
+    """Not a wardrobe archive, or not one this version can read."""
+
+
+class UploadOffsetMismatch(Exception):
+    """The client's offset isn't where the stored upload ends; resume from `received`."""
+
+    def __init__(self, received: int):
+        super().__init__(f"Upload is at byte {received}")
+        self.received = received
+
+
+class UploadBusy(Exception):
+    """Another request is writing or importing this upload."""
+
+
+# ---- writing: archive formats that stream through generators ----
+class _Spool:
+    """Write-only sink for zipfile; the generator hands out what was written after each step."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class ZipStream:
+    """Zip written front to back: no seeking, so sizes and CRCs follow each member's data."""
+    mimetype = "application/zip"
+
+    def __init__(self):
+        self._out = _Spool()
+        self._zip = zipfile.ZipFile(self._out, "w")
+
+    def add(self, name: str, chunks: Iterable[bytes], size: int, mtime: float,
+            compress: bool = False) -> Iterator[bytes]:
+        info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+        info.file_size = size  # lets zipfile pick zip64 headers up front for big members
+        # images are compressed already; deflate only the JSON
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        with self._zip.open(info, "w") as fh:
+            for chunk in chunks:
+                fh.write(chunk)
+                yield self._out.take()
+        yield self._out.take()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._out.take()
+
+
+class TarStream:
+    """ustar/pax written by hand, since tarfile.addfile copies a whole member in one call."""
+    mimetype = "application/x-tar"
+
+    def add(self, name: str, chunks: Iterable[bytes], size: int, mtime: float,
+            compress: bool = False) -> Iterator[bytes]:
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime, info.mode = size, int(mtime), 0o644
+        yield info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+        written = 0
+        for chunk in chunks:
+            written += len(chunk)
+            yield chunk
+        if written != size:  # the header is out already; the archive can't be fixed up
+            raise ArchiveError(f"{name} changed size while it was being exported")
+        yield tarfile.NUL * (-size % tarfile.BLOCKSIZE)
+
+    def close(self) -> bytes:
+        return tarfile.NUL * (2 * tarfile.BLOCKSIZE)  # end-of-archive marker
+
+
+FORMATS = {"zip": ZipStream, "tar": TarStream}
+
+
+def _file_chunks(fh) -> Iterator[bytes]:
+    return iter(lambda: fh.read(CHUNK_SIZE), b"")
+
+
+def upload_path(ref: str | None) -> Path | None:
+    """The file under UPLOAD_DIR that an image_url like /uploads/x.jpg names, if it exists."""
+    if not ref or digest_from_ref(ref):
+        return None
+    path = PurePosixPath(urlsplit(ref).path)
+    if path.parts[:2] != ("/", "uploads") or ".." in path.parts:
+        return None
+    local = UPLOAD_DIR.joinpath(*path.parts[2:])
+    return local if local.is_file() else None
+
+
+def image_key(ref: str | None) -> str | None:
+    """What an image_url's file is exported as: a blob digest, an uploads/ member name, or None."""
+    digest = digest_from_ref(ref)
+    if digest is not None:
+        return digest
+    path = upload_path(ref)
+    return f"uploads/{path.relative_to(UPLOAD_DIR).as_posix()}" if path else None
+
+
+# ---- export ----
+def export_archive(user_id: int, fmt: str = "zip", blobs: BlobStore | None = None) -> Iterator[bytes]:
+    """
+    The archive of user_id's wardrobe as a stream of byte chunks (for a
+    streaming response or a file). Items added after the export started are
+    left out; an image deleted meanwhile is exported without its file.
+    """
+    writer = FORMATS[fmt]()
+    blobs = blobs or default_store()
+    ensure_db()
+    started = time.time()
+    last_id, total = run_for_user(user_id, lambda s: s.execute(
+        select(func.coalesce(func.max(Item.id), 0), func.count()).where(Item.user_id == user_id)).one())
+    manifest = json.dumps({"format": FORMAT, "version": FORMAT_VERSION,
+                           "exported_at": datetime.utcfromtimestamp(started).isoformat(),
+                           "user_id": user_id, "items": total}).encode()
+    yield from filter(None, writer.add(MANIFEST, [manifest], len(manifest), started, compress=True))
+
+    members: dict[str, str|None] = {}  # image_key -> member name (None: file missing)
+    cursor, batch_no = 0, 0
+    columns = [getattr(Item, c) for c in EXPORT_COLUMNS]
+    while True:
+        # a short session per batch: a slow download never holds a pooled connection
+        rows, exts = run_for_user(user_id, lambda s: _export_batch(s, user_id, columns, cursor,
+                                                                    last_id, members))
+        if not rows:
+            break
+        cursor, batch_no = rows[-1].id, batch_no + 1
+
+        records = []
+        for r in rows:
+            key = image_key(r.image_url)
+            if key and key not in members:
+                yield from filter(None, _export_image(writer, blobs, key, exts, members))
+            rec = {c: getattr(r, c) for c in EXPORT_COLUMNS}
+            rec.update(kind=r.kind.value, is_neutral=bool(r.is_neutral),
+                       created_at=r.created_at.isoformat(), updated_at=r.updated_at.isoformat(),
+                       image=members.get(key) if key else None)
+            records.append(json.dumps(rec, separators=(",", ":")).encode() + b"\n")
+        body = b"".join(records)
+        yield from filter(None, writer.add(f"items/{batch_no:06d}.ndjson", [body], len(body),
+                                           started, compress=True))
+    yield writer.close()
+
+
+def _export_batch(s: Session, user_id: int, columns, cursor: int, last_id: int, members: dict):
+    """The next EXPORT_BATCH item rows after `cursor`, and digest -> ext of their images not yet written."""
+    rows = s.execute(select(*columns)
+                     .where(Item.user_id == user_id, Item.id > cursor, Item.id <= last_id)
+                     .order_by(Item.id).limit(EXPORT_BATCH)).all()
+    wanted = {digest_from_ref(r.image_url) for r in rows} - members.keys() - {None}
+    exts = dict(catalog_of(s).execute(select(Blob.digest, Blob.ext)
+                                      .where(Blob.digest.in_(wanted))).all()) if wanted else {}
+    return rows, exts
+
+
+def _export_image(writer, blobs: BlobStore, key: str, exts: dict, members: dict) -> Iterator[bytes]:
+    """Write the file behind one image_key and record its member name."""
+    members[key] = None
+    if key in exts:
+        path, name = blobs.path(key, exts[key]), f"blobs/{blob_relpath(key, exts[key])}"
+    elif key.startswith("uploads/"):
+        path, name = UPLOAD_DIR / key[len("uploads/"):], key
+    else:
+        return  # blob row gone
+    try:
+        fh = open(path, "rb")
+    except FileNotFoundError:  # released since the batch was read
+        return
+    with fh:
+        st = os.fstat(fh.fileno())
+        yield from writer.add(name, _file_chunks(fh), st.st_size, st.st_mtime)
+    members[key] = name
+
+
+# ---- import: resumable upload ----
+def import_payload(job: ArchiveImport, received: int) -> dict:
+    return {
+        "id": job.id, "status": job.status, "size": job.size, "received": received,
+        "items_imported": job.items_imported, "images_created": job.images_created,
+        "images_skipped": job.images_skipped, "failed": job.failed, "error": job.error,
+        "created_at": job.created_at.isoformat(), "updated_at": job.updated_at.isoformat(),
+    }
+
+
+def _upload_file(import_id: str) -> Path:
+    return IMPORT_DIR / f"{import_id}.part"
+
+
+def _received(job: ArchiveImport) -> int:
+    if job.status != "uploading":
+        return job.size
+    try:
+        return _upload_file(job.id).stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def create_import(user_id: int, size: int) -> dict:
+    """Start an upload of a `size`-byte archive for user_id's wardrobe."""
+    if not 0 < size <= IMPORT_MAX_BYTES:
+        raise ValueError(f"size must be between 1 and {IMPORT_MAX_BYTES} bytes")
+    IMPORT_DIR.mkdir(parents=True, exist_ok=True)
+
+    def create(s: Session) -> dict:
+        job = ArchiveImport(id=uuid.uuid4().hex, user_id=user_id, status="uploading", size=size,
+                            members_done=0, rows_done=0, items_imported=0, images_created=0,
+                            images_skipped=0, failed=0)
+        s.add(job)
+        s.commit()
+        return import_payload(job, 0)
+
+    job = run_for_user(user_id, create)
+    _upload_file(job["id"]).touch()
+    return job
+
+
+def import_status(user_id: int, import_id: str) -> dict | None:
+    """Progress of one of user_id's imports; None if there is no such import (of theirs)."""
+    def status(s: Session) -> dict | None:
+        job = s.get(ArchiveImport, import_id)
+        return import_payload(job, _received(job)) if job is not None and job.user_id == user_id else None
+    return run_for_user(user_id, status)
+
+
+def append_upload(user_id: int, import_id: str, offset: int, chunks: Iterable[bytes],
+                  blobs: BlobStore | None = None, submit=None) -> dict:
+    """
+    Append the next bytes of an upload, which must start where the stored
+    part ends (UploadOffsetMismatch carries that offset otherwise). If the
+    connection drops, whatever arrived is kept; the client asks
+    import_status() for `received` and continues from there.
+
+    Once all `size` bytes are in, the archive is imported before returning.
+    If that import is interrupted, another call at offset == size (no bytes)
+    resumes it. `submit(digest)` is called for each new image, to queue its
+    analysis. Raises LookupError for an unknown id and UploadBusy while
+    another request holds the upload.
+    """
+    job = import_status(user_id, import_id)
+    if job is None:
+        raise LookupError(f"Unknown import: {import_id}")
+    if job["status"] in ("done", "failed"):
+        if offset != job["size"]:
+            raise UploadOffsetMismatch(job["size"])
+        return job
+    path = _upload_file(import_id)
+    with open(path, "ab") as fh:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)  # released when fh closes
+            except BlockingIOError:
+                raise UploadBusy(f"Import {import_id} is busy") from None
+        received = fh.tell()
+        if offset != received:
+            raise UploadOffsetMismatch(received)
+        for chunk in chunks:
+            if received + len(chunk) > job["size"]:
+                fh.flush()
+                fh.truncate(received)  # keep the bytes of earlier chunks, they were fine
+                raise ArchiveError(f"More than the announced {job['size']} bytes")
+            fh.write(chunk)
+            received += len(chunk)
+        fh.flush()
+        if received < job["size"]:
+            return {**job, "received": received}
+        job = run_for_user(user_id, lambda s: _import(s, import_id, path, blobs or default_store(), submit))
+    if job["status"] in ("done", "failed"):
+        path.unlink(missing_ok=True)
+    return job
+
+
+def _import(s: Session, import_id: str, path: Path, blobs: BlobStore, submit) -> dict:
+    job = s.get(ArchiveImport, import_id)
+    if job.status == "uploading":
+        job.status = "importing"
+        s.commit()
+    _apply(s, job, path, blobs, submit)
+    return import_payload(job, job.size)
+
+
+def _apply(s: Session, job: ArchiveImport, path: Path, blobs: BlobStore, submit) -> None:
+    try:
+        ArchiveImporter(s, job, path, blobs, submit).run()
+    except ArchiveError as e:
+        s.rollback()
+        job.status, job.error = "failed", str(e)
+    else:
+        job.status = "done"
+    s.commit()
+
+
+# ---- import: applying an archive ----
+def read_archive(path: Path) -> Iterator[tuple[str, Callable[[], IO[bytes]]]]:
+    """(name, open()) of each file member in archive order; zip or (optionally gzipped) tar."""
+    try:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir():
+                        yield info.filename, lambda info=info: zf.open(info)
+        elif tarfile.is_tarfile(path):
+            with tarfile.open(path, "r:*") as tf:
+                for member in tf:
+                    if member.isfile():
+                        yield member.name, lambda member=member: tf.extractfile(member)
+        else:
+            raise ArchiveError("Not a zip or tar archive")
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        raise ArchiveError(f"Damaged archive: {e}") from None
+
+
+def _timestamp(value) -> datetime | None:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def item_fields(rec) -> dict:
+    """An exported item record -> SQLItemDAO.bulk_create row; ValueError if it can't be one."""
+    if not isinstance(rec, dict):
+        raise ValueError("item record is not an object")
+    kind = ItemKind(rec.get("kind")).value  # ValueError for a missing/unknown kind
+    return {"kind": kind, "name": rec.get("name"), "brand": rec.get("brand"),
+            "image_url": rec.get("image_url"), "main_color_hex": rec.get("main_color_hex"),
+            "is_neutral": bool(rec.get("is_neutral")), "season": rec.get("season"),
+            "created_at": _timestamp(rec.get("created_at")),
+            "updated_at": _timestamp(rec.get("updated_at"))}
+
+
+class ArchiveImporter:
+    """
+    Applies one archive to job.user_id's wardrobe. Progress fields are set
+    on `job` before each write that commits, so they land in the same
+    transaction; members_done/rows_done say where a rerun picks up.
+    """
+
+    def __init__(self, s: Session, job: ArchiveImport, path: Path, blobs: BlobStore, submit=None):
+        self.s, self.job, self.path, self.blobs, self.submit = s, job, path, blobs, submit
+        self.catalog = catalog_of(s)  # blobs live there
+        self.items = SQLItemDAO(s, blobs)
+
+    def run(self) -> None:
+        seen = 0
+        for index, (name, open_member) in enumerate(read_archive(self.path)):
+            seen += 1
+            if index < self.job.members_done:
+                continue
+            if name.startswith("items/") and name.endswith(".ndjson") and index > 0:
+                self._items(index, open_member)  # advances batch by batch
+                continue
+            # past this member once whatever it writes commits (anything else: ignored)
+            self._advance(index + 1)
+            if index == 0:
+                self._manifest(name, open_member)
+            elif name.startswith("blobs/"):
+                self._blob(name, open_member)
+            elif name.startswith("uploads/"):
+                self._upload(name, open_member)
+        if seen == 0:
+            raise ArchiveError("Empty archive")
+
+    def _advance(self, members_done: int, rows_done: int = 0) -> None:
+        self.job.members_done, self.job.rows_done = members_done, rows_done
+
+    def _fail(self, message: str) -> None:
+        self.job.failed += 1
+        self.job.error = message
+
+    def _manifest(self, name: str, open_member) -> None:
+        if name != MANIFEST:
+            raise ArchiveError(f"Not a wardrobe export (no {MANIFEST})")
+        with open_member() as fh:
+            try:
+                manifest = json.load(fh)
+            except ValueError:
+                raise ArchiveError(f"Unreadable {MANIFEST}") from None
+        if not isinstance(manifest, dict) or manifest.get("format") != FORMAT:
+            raise ArchiveError("Not a wardrobe export")
+        if not isinstance(manifest.get("version"), int) or manifest["version"] > FORMAT_VERSION:
+            raise ArchiveError(f"Export format version {manifest.get('version')} is not supported")
+
+    def _blob(self, name: str, open_member) -> None:
+        digest = digest_from_ref(name)
+        if digest is None:
+            return self._fail(f"{name}: not a content-addressed image")
+        if self.blobs.lookup(self.catalog, digest) is not None:
+            self.job.images_skipped += 1  # never read; progress goes out with the next commit
+            return
+        self.blobs.root.mkdir(parents=True, exist_ok=True)
+        ingest = IngestFile(self.blobs.root / f"__tmp__{uuid.uuid4().hex}")  # sniffs + hashes
+        try:
+            with open_member() as src:
+                for chunk in _file_chunks(src):
+                    ingest.write(chunk)
+            ingest.finish()
+            if ingest.hexdigest != digest or ingest.kind is None:
+                ingest.close()
+                return self._fail(f"{name}: content doesn't match its name")
+            self.job.images_created += 1
+            _, created = self.blobs.put_file(self.catalog, ingest.path, digest, ingest.kind, ingest.size)
+        except BaseException:
+            ingest.close()
+            raise
+        if created and self.submit is not None:
+            self.submit(digest)
+
+    def _upload(self, name: str, open_member) -> None:
+        rel = PurePosixPath(name).relative_to("uploads")
+        if rel.is_absolute() or ".." in rel.parts or not rel.parts:
+            return self._fail(f"{name}: not a path under uploads/")
+        dest = UPLOAD_DIR.joinpath(*rel.parts)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.parent / f"__tmp__{uuid.uuid4().hex}"
+        ingest = IngestFile(tmp)
+        try:
+            with open_member() as src:
+                for chunk in _file_chunks(src):
+                    ingest.write(chunk)
+            ingest.finish()
+            if not dest.exists():
+                os.replace(tmp, dest)
+                self.job.images_created += 1
+            elif sha256_file(dest) == ingest.hexdigest:
+                self.job.images_skipped += 1
+            else:
+                self._fail(f"{name}: a different file with that name exists; kept it")
+        finally:
+            ingest.close()  # no-op once moved
+
+    def _items(self, index: int, open_member) -> None:
+        skip = self.job.rows_done  # lines of this member committed by an earlier run
+        batch, line_no = [], 0
+        with open_member() as fh:
+            for line_no, line in enumerate(fh, start=1):
+                if line_no <= skip or not line.strip():
+                    continue
+                batch.append(line)
+                if len(batch) == EXPORT_BATCH:
+                    self._insert(batch, index, line_no)
+                    batch = []
+        self._insert(batch, index + 1, 0)
+
+    def _insert(self, lines: list[bytes], members_done: int, rows_done: int) -> None:
+        """One transaction: these item rows plus the archive position after them."""
+        rows = []
+        for line in lines:
+            try:
+                rows.append(item_fields(json.loads(line)))
+            except ValueError as e:  # includes malformed JSON
+                self._fail(f"item record: {e}")
+        self._advance(members_done, rows_done)
+        self.job.items_imported += len(rows)
+        if not rows:
+            self.s.commit()
+            return
+        res = self.items.bulk_create(rows, user_id=self.job.user_id)  # commits
+        if res["errors"]:
+            self.job.items_imported -= len(res["errors"])
+            self.job.failed += len(res["errors"])
+            self.job.error = res["errors"][-1]["error"]
+            self.s.commit()
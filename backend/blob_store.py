@@ -0,0 +1,147 @@
+# blob_store.py
+"""
+Content-addressed image storage.
+
+Every stored image lives at <root>/<d[0:2]>/<d[2:4]>/<d>.<ext>, where d is
+the SHA-256 of its bytes, so identical uploads share one file. The `blobs`
+table tracks how many items reference each file; the file is removed when
+the last reference is released.
+"""
+from __future__ import annotations
+
+import os
+import re
+from pathlib import Path
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+try:
+    from .models import Blob, Item
+except ImportError:  # run from inside backend/
+    from models import Blob, Item
+
+# Same env var / default as app_images.ASSET_DIR
+ASSET_DIR = Path(os.getenv("ASSET_DIR", "./images")).resolve()
+
+# Blob columns computed from the image and copied onto its items
+DERIVED_COLUMNS = ("phash", "feature_row")
+
+# <64 hex>.<ext> at the end of a filename or URL
+_BLOB_NAME = re.compile(r"(?:^|/)([0-9a-f]{64})\.([a-z0-9]+)(?:[?#].*)?$")
+
+
+def blob_relpath(digest: str, ext: str) -> str:
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def digest_from_ref(ref: str | None) -> str | None:
+    """Digest named by a stored filename or image URL, or None for non-blob refs."""
+    if not ref:
+        return None
+    m = _BLOB_NAME.search(ref)
+    return m.group(1) if m else None
+
+
+class BlobStore:
+    def __init__(self, root: Path = ASSET_DIR):
+        self.root = Path(root).resolve()
+
+    def path(self, digest: str, ext: str) -> Path:
+        return self.root / blob_relpath(digest, ext)
+
+    def lookup(self, session: Session, digest: str) -> Blob | None:
+        blob = session.get(Blob, digest)
+        if blob is not None and not self.path(blob.digest, blob.ext).exists():
+            return None  # row without a file (manual cleanup); treat as missing
+        return blob
+
+    def put_file(self, session: Session, src: Path, digest: str, ext: str, size: int,
+                 phash: int | None = None) -> tuple[str, bool]:
+        """
+        Move `src` into the store under `digest`. If the content is already
+        stored, `src` is discarded instead. Returns (relative filename, created).
+        """
+        dest = self.path(digest, ext)
+        existing = self.lookup(session, digest)
+        if existing is not None:
+            Path(src).unlink(missing_ok=True)
+            return blob_relpath(existing.digest, existing.ext), False
+
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src, dest)  # atomic; a racing identical upload writes identical bytes
+        session.execute(
+            sqlite_insert(Blob)
+            .values(digest=digest, ext=ext, size_bytes=size, refcount=0, phash=phash)
+            .on_conflict_do_nothing(index_elements=["digest"])
+        )
+        session.commit()
+        return blob_relpath(digest, ext), True
+
+    # ---- values derived from the image: perceptual hash, feature row (callers commit) ----
+    def set_derived(self, session: Session, digest: str, **values) -> None:
+        """Record a blob's DERIVED_COLUMNS values and copy them onto the items already showing it."""
+        session.execute(update(Blob).where(Blob.digest == digest).values(**values))
+        session.execute(self.items_update(digest, **values))
+
+    @staticmethod
+    def items_update(digest: str, **values):
+        """UPDATE copying derived values onto the items showing a blob (run on each shard when sharded)."""
+        return update(Item).where(Item.image_digest == digest).values(**values)
+
+    def derived(self, session: Session, refs) -> dict[str, dict]:
+        """
+        ref -> {column: value} of its blob's DERIVED_COLUMNS, for each given
+        ref (all None: not a blob, or not analysed yet). Items store these too.
+        """
+        digests = {ref: digest_from_ref(ref) for ref in refs if ref}
+        wanted = set(filter(None, digests.values()))
+        known = {row[0]: dict(zip(DERIVED_COLUMNS, row[1:])) for row in session.execute(
+            select(Blob.digest, *(getattr(Blob, c) for c in DERIVED_COLUMNS))
+            .where(Blob.digest.in_(wanted)))} if wanted else {}
+        empty = dict.fromkeys(DERIVED_COLUMNS)
+        return {ref: known.get(d, empty) for ref, d in digests.items()}
+
+    # ---- reference counting (callers commit) ----
+    def acquire(self, session: Session, ref: str | None, n: int = 1) -> bool:
+        """+n references for the blob named by `ref`; False if it isn't a known blob."""
+        digest = digest_from_ref(ref)
+        if digest is None:
+            return False
+        res = session.execute(update(Blob).where(Blob.digest == digest)
+                              .values(refcount=Blob.refcount + n))
+        return res.rowcount == 1
+
+    def release(self, session: Session, ref: str | None) -> Path | None:
+        """
+        -1 reference. When it was the last one the row is deleted and the file
+        path is returned; remove it with discard() after the commit succeeds.
+        """
+        digest = digest_from_ref(ref)
+        if digest is None:
+            return None
+        dec = session.execute(update(Blob).where(Blob.digest == digest, Blob.refcount > 0)
+                              .values(refcount=Blob.refcount - 1))
+        if dec.rowcount != 1:
+            return None  # unknown blob, or nothing held a reference to release
+        blob = session.execute(select(Blob.ext).where(Blob.digest == digest, Blob.refcount == 0)).first()
+        if blob is None:
+            return None
+        gone = session.execute(delete(Blob).where(Blob.digest == digest, Blob.refcount == 0))
+        return self.path(digest, blob.ext) if gone.rowcount == 1 else None
+
+    @staticmethod
+    def discard(path: Path | None) -> None:
+        if path is not None:
+            path.unlink(missing_ok=True)
+
+
+_default: BlobStore | None = None
+
+
+def default_store() -> BlobStore:
+    global _default
+    if _default is None:
+        _default = BlobStore(ASSET_DIR)
+    return _default
@@ -1,105 +1,773 @@
 # dao.py
 from __future__ import annotations
-from typing import Optional, Protocol, Literal
-from sqlalchemy import select, func, or_, asc, desc
+import base64
+import json
+import math
+import re
+import time
+from datetime import datetime
+from functools import lru_cache, wraps
+from inspect import signature
+from threading import Lock
+from typing import Protocol, Literal
+from collections import Counter, OrderedDict
+from sqlalchemy import select, insert, func, or_, asc, desc, false, tuple_, literal, literal_column, table, column, type_coerce, Float, String
 from sqlalchemy.orm import Session
-from models import Item, ItemKind
+try:
+    from .models import Item, ItemKind, WardrobeVersion
+    from .shards import run_for_user, fan_out, item_ids, catalog_of
+    from .migrations import has_items_fts
+    from .blob_store import default_store, digest_from_ref, DERIVED_COLUMNS
+    from .utils_colors import parse_color, rgb_to_hex, hex_to_rgb, rgb_to_lab, lab_cell, lab_cells_within
+    from .phash import duplicate_index, format_hash, DEFAULT_MAX_DISTANCE
+except ImportError:  # run from inside backend/
+    from models import Item, ItemKind, WardrobeVersion
+    from shards import run_for_user, fan_out, item_ids, catalog_of
+    from migrations import has_items_fts
+    from blob_store import default_store, digest_from_ref, DERIVED_COLUMNS
+    from utils_colors import parse_color, rgb_to_hex, hex_to_rgb, rgb_to_lab, lab_cell, lab_cells_within
+    from phash import duplicate_index, format_hash, DEFAULT_MAX_DISTANCE
 
-SortKey = Literal["created_at", "updated_at", "name", "brand", "kind"]
+SortKey = Literal["created_at", "updated_at", "name", "brand", "kind", "relevance"]
 SortDir = Literal["asc", "desc"]
+CountMode = Literal["exact", "cached", "none"]
+
+COUNT_TTL_SECONDS = 30.0  # how stale a "cached" total may get
+COUNT_CACHE_SIZE = 256  # (user, filters) totals kept per process
+DEFAULT_COLOR_TOLERANCE = 10.0  # Delta-E; ~2.3 is barely noticeable, 10 is "same color family"
+MAX_GRID_CELLS = 512  # beyond this a Lab-cell IN list costs more than an L range scan
+MAX_BULK_ROWS = 10_000  # rows per bulk_create/bulk_update call (one transaction)
+IMAGE_CACHE_SIZE = 4096  # item_id -> image_url entries kept per process
+IMAGE_CACHE_TTL_SECONDS = 60.0  # bounds staleness from writes made by other processes
+
+# ---- full-text search (FTS5 table maintained by migrations._m001_items_fts) ----
+items_fts = table("items_fts", column("rowid"))
+_fts_col = literal_column("items_fts")
+_fts_ready: dict[int, bool] = {}  # id(engine) -> items_fts exists
+_EMPTY = literal_column("''")
+
+def fts_query(search:str) -> str|None:
+    """'blue jea' -> '"blue"* "jea"*': every token must match, each as a prefix."""
+    tokens = re.findall(r"\w+", search, flags=re.UNICODE)
+    return " ".join(f'"{t}"*' for t in tokens) or None
+
+def fts_enabled(session:Session) -> bool:
+    bind = session.get_bind()
+    key = id(bind)
+    if key not in _fts_ready:
+        _fts_ready[key] = bind.dialect.name == "sqlite" and has_items_fts(session.connection())
+    return _fts_ready[key]
+
+def color_columns(hex_value:str|None) -> dict:
+    """main_color_hex plus its CIELAB value and grid cell, ready for Item(**...)."""
+    if not hex_value:
+        return {"main_color_hex": None, "lab_l": None, "lab_a": None, "lab_b": None, "lab_cell": None}
+    hx = f"#{hex_value.lstrip('#')}"
+    try:
+        lab = rgb_to_lab(hex_to_rgb(hx))
+    except ValueError:  # keep whatever the client sent, just not searchable
+        return {"main_color_hex": hx, "lab_l": None, "lab_a": None, "lab_b": None, "lab_cell": None}
+    return {"main_color_hex": hx, "lab_l": lab[0], "lab_a": lab[1], "lab_b": lab[2],
+            "lab_cell": lab_cell(lab)}
+
+def color_filter(color_hex:str, tolerance:float):
+    """
+    WHERE clauses for "within `tolerance` Delta-E of color_hex" plus the squared
+    distance expression for ranking. The grid-cell IN list hits the
+    (user_id, lab_cell) index; the exact sphere test only runs on those rows.
+    """
+    L, a, b = rgb_to_lab(hex_to_rgb(color_hex))  # ValueError on junk input
+    dist2 = ((Item.lab_l - L) * (Item.lab_l - L) + (Item.lab_a - a) * (Item.lab_a - a)
+             + (Item.lab_b - b) * (Item.lab_b - b))
+    cells = lab_cells_within((L, a, b), tolerance)
+    coarse = (Item.lab_cell.in_(cells) if len(cells) <= MAX_GRID_CELLS
+              else Item.lab_l.between(L - tolerance, L + tolerance))
+    return [coarse, dist2 <= tolerance * tolerance], dist2
+
+# ---- opaque keyset cursors ----
+# A cursor is the (sort value, id) of the last row on a page, plus the sort it
+# was issued for, so the next page is a plain index range scan instead of OFFSET.
+def encode_cursor(sort_by:str, sort_dir:str, value, item_id:int) -> str:
+    if isinstance(value, datetime): value = value.isoformat()
+    elif isinstance(value, ItemKind): value = value.value
+    raw = json.dumps([sort_by, sort_dir, value, item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor:str, sort_by:str, sort_dir:str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        c_sort, c_dir, value, item_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if (c_sort, c_dir) != (sort_by, sort_dir):
+        raise ValueError("Cursor was issued for a different sort")
+    if sort_by in ("created_at", "updated_at"):
+        value = datetime.fromisoformat(value)
+    elif sort_by == "kind":
+        value = ItemKind(value)
+    return value, int(item_id)
+
+def item_to_dict(i: Item) -> dict:
+    return {
+        "id": i.id, "user_id": i.user_id, "kind": i.kind.value,
+        "name": i.name, "brand": i.brand, "image_url": i.image_url,
+        "main_color_hex": i.main_color_hex, "is_neutral": bool(i.is_neutral),
+        "season": i.season,
+        "created_at": i.created_at.isoformat(), "updated_at": i.updated_at.isoformat(),
+    }
+
+# API field -> column; kind is read as its stored string, skipping the Enum round trip
+_API_COLUMNS = {
+    "id": Item.id, "user_id": Item.user_id, "name": Item.name, "brand": Item.brand,
+    "category": type_coerce(Item.kind, String), "color": Item.main_color_hex,
+    "image_url": Item.image_url, "season": Item.season,
+}
+
+class Projection:
+    """
+    Precompiled row -> dict mapping for a fixed tuple of API fields. Selects
+    only those columns and builds each dict with one zip over the row tuple,
+    so list pages skip ORM hydration and per-item serializers entirely.
+    """
+    def __init__(self, fields:tuple[str, ...]):
+        unknown = [f for f in fields if f not in _API_COLUMNS]
+        if unknown: raise ValueError(f"Unknown item fields: {', '.join(unknown)}")
+        self.fields = fields
+        self.columns = [_API_COLUMNS[f].label(f) for f in fields]
+
+    def to_dicts(self, rows) -> list[dict]:
+        keys = self.fields  # zip stops here, so trailing helper columns are dropped
+        return [dict(zip(keys, r)) for r in rows]
+
+@lru_cache(maxsize=32)
+def projection(fields:tuple[str, ...]) -> Projection:
+    return Projection(fields)
+
+class ImageUrlCache:
+    """Bounded LRU of item_id -> image_url (None = item has no image), with a TTL."""
+    def __init__(self, max_entries:int=IMAGE_CACHE_SIZE, ttl:float=IMAGE_CACHE_TTL_SECONDS):
+        self.max_entries, self.ttl = max_entries, ttl
+        self._data: "OrderedDict[int, tuple[float, str|None]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get_many(self, item_ids) -> dict[int, str|None]:
+        now, hits = time.monotonic(), {}
+        with self._lock:
+            for i in item_ids:
+                entry = self._data.get(i)
+                if entry is None: continue
+                if entry[0] <= now:
+                    del self._data[i]; continue
+                self._data.move_to_end(i)
+                hits[i] = entry[1]
+        return hits
+
+    def put_many(self, urls:dict[int, str|None]) -> None:
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for i, url in urls.items():
+                self._data[i] = (expires, url)
+                self._data.move_to_end(i)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, *item_ids:int) -> None:
+        with self._lock:
+            for i in item_ids:
+                self._data.pop(i, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
 
 class ItemDAO(Protocol):
     def create(self, *, user_id:int, kind:str, name:str|None=None, brand:str|None=None,
-               image_url:str|None=None, main_color_hex:str|None=None, is_neutral:bool=False) -> Item: ...
-    def get(self, item_id:int) -> Item | None: ...
-    def update(self, item_id:int, **fields) -> Item: ...
-    def delete(self, item_id:int) -> None: ...
+               image_url:str|None=None, main_color_hex:str|None=None, is_neutral:bool=False,
+               season:str|None=None) -> Item: ...
+    def bulk_create(self, rows:list[dict], *, user_id:int) -> dict: ...
+    def get(self, item_id:int, user_id:int|None=None) -> Item | None: ...
+    def version(self, user_id:int) -> int: ...
+    def image_urls(self, item_ids:list[int]) -> dict[int, str|None]: ...
+    def phashes(self, user_id:int) -> list[tuple[int, int]]: ...
+    def feature_rows(self, user_id:int) -> list[tuple[int, int]]: ...
+    def update(self, item_id:int, *, user_id:int|None=None, **fields) -> Item: ...
+    def bulk_update(self, rows:list[dict], *, user_id:int) -> dict: ...
+    def delete(self, item_id:int, user_id:int|None=None) -> None: ...
     def list(self, *, user_id:int, kinds:list[str]|None=None, search:str|None=None,
              is_neutral:bool|None=None, color_hex:str|None=None,
-             page:int=1, page_size:int=20, sort_by:SortKey="created_at", sort_dir:SortDir="desc") -> dict: ...
+             color_tolerance:float=DEFAULT_COLOR_TOLERANCE,
+             page:int=1, page_size:int=20, sort_by:SortKey="created_at", sort_dir:SortDir="desc",
+             cursor:str|None=None, count:CountMode="exact") -> dict: ...
+    def near_color(self, *, user_id:int, color_hex:str, tolerance:float=DEFAULT_COLOR_TOLERANCE,
+                   kinds:list[str]|None=None, limit:int=20) -> list[dict]: ...
 
 class SQLItemDAO(ItemDAO):
     """Works with either Flask's db.session or a plain SQLAlchemy Session."""
-    def __init__(self, session: Session):
+    # (user_id, filters) -> (expires_at, total), LRU; shared by every DAO instance.
+    # Only count="cached" reads and fills it: every search string is a new key.
+    _count_cache: "OrderedDict[tuple, tuple[float, int]]" = OrderedDict()
+    _count_lock = Lock()
+    # read-through cache for image_urls(); every write path below discards its ids
+    _image_cache = ImageUrlCache()
+
+    def __init__(self, session: Session, blobs=None):
         self.s = session
+        self.blobs = blobs or default_store()  # image_url refcounts (content-addressed uploads)
+        # blob rows live in the catalog: the same session unless the user is sharded (shards.bind)
+        self.c = catalog_of(session)
+        self._released: list[str] = []  # refs to release once the items commit (sharded)
+        self._orphans: list = []  # blob files to discard after the commit
+
+    @classmethod
+    def invalidate_counts(cls, user_id:int) -> None:
+        with cls._count_lock:
+            for key in [k for k in cls._count_cache if k[0] == user_id]:
+                del cls._count_cache[key]
+
+    def _release(self, ref:str|None) -> None:
+        """-1 reference to ref's blob: in the item write's transaction, or right after it when sharded."""
+        if self.c is self.s:
+            self._orphans.append(self.blobs.release(self.s, ref))
+        elif ref:
+            self._released.append(ref)
+
+    def _commit(self) -> None:
+        """
+        Commit the item write, then discard the blob files it orphaned. Sharded,
+        the refcounts commit in the catalog on their own: new references before
+        the items, dropped ones after, so a failure in between can only leave a
+        reference too many (a file kept), never one too few.
+        """
+        if self.c is not self.s and self.c.in_transaction():
+            self.c.commit()
+        self.s.commit()
+        if self._released:
+            self._orphans += [self.blobs.release(self.c, ref) for ref in self._released]
+            self._released.clear()
+            self.c.commit()
+        for path in self._orphans:
+            self.blobs.discard(path)
+        self._orphans.clear()
 
     # ---- CRUD ----
     def create(self, *, user_id:int, kind:str, name:str|None=None, brand:str|None=None,
-               image_url:str|None=None, main_color_hex:str|None=None, is_neutral:bool=False) -> Item:
+               image_url:str|None=None, main_color_hex:str|None=None, is_neutral:bool=False,
+               season:str|None=None) -> Item:
         item = Item(
             user_id=user_id,
             kind=ItemKind(kind),
-            name=name, brand=brand, image_url=image_url,
-            main_color_hex=(f"#{main_color_hex.lstrip('#')}" if main_color_hex else None),
-            is_neutral=1 if is_neutral else 0
+            name=name, brand=brand, image_url=image_url, image_digest=digest_from_ref(image_url),
+            **color_columns(main_color_hex),
+            is_neutral=1 if is_neutral else 0,
+            season=season,
         )
-        self.s.add(item); self.s.commit()
+        if image_url:
+            for col, val in self.blobs.derived(self.c, [image_url])[image_url].items():
+                setattr(item, col, val)
+        if (new_id := item_ids(1)):
+            item.id = new_id[0]
+        self.s.add(item)
+        self.blobs.acquire(self.c, image_url)
+        self._commit()
+        self.invalidate_counts(user_id)
         return item
 
-    def get(self, item_id:int) -> Item | None:
-        return self.s.get(Item, item_id)
+    def bulk_create(self, rows:list[dict], *, user_id:int) -> dict:
+        """
+        Insert many items (same keyword fields as create(), plus optional
+        created_at/updated_at carried over by archive imports) in one transaction
+        with a single executemany INSERT. Rows that can't be stored are skipped
+        and reported by their position instead of failing the batch.
+        Returns {"ids": [id or None per row], "errors": [{"index", "error"}]}.
+        """
+        if len(rows) > MAX_BULK_ROWS:
+            raise ValueError(f"At most {MAX_BULK_ROWS} rows per batch")
+        ids: list[int|None] = [None] * len(rows)
+        errors, values, positions = [], [], []
+        refs = Counter()
+        now = datetime.utcnow()
+        for idx, row in enumerate(rows):
+            try:
+                values.append({
+                    "user_id": user_id, "kind": ItemKind(row["kind"]),
+                    "name": row.get("name"), "brand": row.get("brand"),
+                    "image_url": row.get("image_url"),
+                    "image_digest": digest_from_ref(row.get("image_url")),
+                    **color_columns(row.get("main_color_hex")),
+                    "is_neutral": 1 if row.get("is_neutral") else 0,
+                    "season": row.get("season"),
+                    "created_at": row.get("created_at") or now,
+                    "updated_at": row.get("updated_at") or now,
+                })
+            except (KeyError, ValueError) as e:
+                errors.append({"index": idx, "error": f"invalid kind: {e}"})
+                continue
+            positions.append(idx)
+            if row.get("image_url"):
+                refs[row["image_url"]] += 1
+        if values:
+            derived = self.blobs.derived(self.c, refs) if refs else {}
+            for v, new_id in zip(values, item_ids(len(values)) or [None] * len(values)):
+                v.update(derived.get(v["image_url"]) or dict.fromkeys(DERIVED_COLUMNS))
+                if new_id is not None: v["id"] = new_id
+            stmt = insert(Item).returning(Item.id, sort_by_parameter_order=True)
+            for idx, new_id in zip(positions, self.s.scalars(stmt, values)):
+                ids[idx] = new_id
+            for ref, n in refs.items():
+                self.blobs.acquire(self.c, ref, n)
+            self._commit()
+            self.invalidate_counts(user_id)
+        return {"ids": ids, "errors": errors}
 
-    def update(self, item_id:int, **fields) -> Item:
+    def get(self, item_id:int, user_id:int|None=None) -> Item | None:
+        """The item; None if there is none, or (given user_id) it is someone else's."""
         obj = self.s.get(Item, item_id)
-        if not obj: raise ValueError("Item not found")
+        return obj if obj is not None and user_id in (None, obj.user_id) else None
+
+    def version(self, user_id:int) -> int:
+        """User's wardrobe version; any item write (triggers, see migrations) bumps it."""
+        return self.s.execute(select(WardrobeVersion.version)
+                              .where(WardrobeVersion.user_id == user_id)).scalar() or 0
+
+    def image_urls(self, item_ids:list[int]) -> dict[int, str|None]:
+        """
+        image_url for each existing id (None when it has no image); unknown ids
+        are left out. Cache misses are resolved with one primary-key IN query.
+        """
+        found = self._image_cache.get_many(item_ids)
+        misses = [i for i in dict.fromkeys(item_ids) if i not in found]
+        if misses:
+            fetched = dict(self.s.execute(
+                select(Item.id, Item.image_url).where(Item.id.in_(misses))).all())
+            self._image_cache.put_many(fetched)
+            found.update(fetched)
+        return found
+
+    def phashes(self, user_id:int) -> list[tuple[int, int]]:
+        """(id, phash) of user_id's items that have a hashed image, read off ix_items_user_phash."""
+        return [tuple(r) for r in self.s.execute(
+            select(Item.id, Item.phash).where(Item.user_id == user_id, Item.phash.is_not(None)))]
+
+    def feature_rows(self, user_id:int) -> list[tuple[int, int]]:
+        """(id, feature_row) of user_id's analysed items, read off ix_items_user_feature_row."""
+        return [tuple(r) for r in self.s.execute(
+            select(Item.id, Item.feature_row)
+            .where(Item.user_id == user_id, Item.feature_row.is_not(None)))]
+
+    def _apply(self, obj:Item, fields:dict) -> None:
+        """Set `fields` on obj; an image change moves the blob reference (settled by _commit())."""
+        if "image_url" in fields and fields["image_url"] != obj.image_url:
+            self.blobs.acquire(self.c, fields["image_url"])
+            self._release(obj.image_url)
+            url = fields["image_url"]
+            obj.image_digest = digest_from_ref(url)
+            derived = self.blobs.derived(self.c, [url])[url] if url else dict.fromkeys(DERIVED_COLUMNS)
+            for col, val in derived.items():
+                setattr(obj, col, val)
         for k, v in fields.items():
             if k == "kind" and v:
                 obj.kind = ItemKind(v)
             elif k == "is_neutral" and v is not None:
                 obj.is_neutral = 1 if v else 0
-            elif k == "main_color_hex" and v:
-                obj.main_color_hex = f"#{v.lstrip('#')}"
+            elif k == "main_color_hex":
+                for col, val in color_columns(v).items():
+                    setattr(obj, col, val)
             else:
                 setattr(obj, k, v)
-        self.s.commit()
+
+    def update(self, item_id:int, *, user_id:int|None=None, **fields) -> Item:
+        obj = self.get(item_id, user_id)
+        if not obj: raise ValueError("Item not found")
+        self._apply(obj, fields)
+        self._commit()
+        self._image_cache.discard(item_id)
+        self.invalidate_counts(obj.user_id)
         return obj
 
-    def delete(self, item_id:int) -> None:
-        obj = self.s.get(Item, item_id)
+    def bulk_update(self, rows:list[dict], *, user_id:int) -> dict:
+        """
+        Update many of user_id's items in one transaction. Each row is {"id", **fields}
+        as for update(); the targets are loaded with one IN query and the flush
+        batches UPDATEs that touch the same columns into executemany calls.
+        Unknown ids / bad values are reported per row, the rest still commit.
+        Returns {"ids": [id or None per row], "errors": [{"index", "error"}]}.
+        """
+        if len(rows) > MAX_BULK_ROWS:
+            raise ValueError(f"At most {MAX_BULK_ROWS} rows per batch")
+        wanted = {r.get("id") for r in rows if isinstance(r.get("id"), int)}
+        objs = {o.id: o for o in self.s.scalars(
+            select(Item).where(Item.user_id == user_id, Item.id.in_(wanted)))} if wanted else {}
+        ids: list[int|None] = [None] * len(rows)
+        errors = []
+        for idx, row in enumerate(rows):
+            fields = {k: v for k, v in row.items() if k != "id"}
+            obj = objs.get(row.get("id"))
+            if obj is None:
+                errors.append({"index": idx, "error": "Item not found"}); continue
+            if fields.get("kind"):
+                try: ItemKind(fields["kind"])
+                except ValueError as e:
+                    errors.append({"index": idx, "error": f"invalid kind: {e}"}); continue
+            self._apply(obj, fields)
+            ids[idx] = obj.id
+        if objs:
+            self._commit()
+            self._image_cache.discard(*objs)
+            self.invalidate_counts(user_id)
+        return {"ids": ids, "errors": errors}
+
+    def delete(self, item_id:int, user_id:int|None=None) -> None:
+        obj = self.get(item_id, user_id)
         if not obj: return
-        self.s.delete(obj); self.s.commit()
+        self._release(obj.image_url)  # the file goes if this was the last item using it
+        self.s.delete(obj); self._commit()
+        self._image_cache.discard(item_id)
+        self.invalidate_counts(obj.user_id)
 
     # ---- Query with paging / filter / sort ----
     def list(self, *, user_id:int, kinds:list[str]|None=None, search:str|None=None,
              is_neutral:bool|None=None, color_hex:str|None=None,
-             page:int=1, page_size:int=20, sort_by:SortKey="created_at", sort_dir:SortDir="desc") -> dict:
-        stmt = select(Item).where(Item.user_id == user_id)
+             color_tolerance:float=DEFAULT_COLOR_TOLERANCE,
+             page:int=1, page_size:int=20, sort_by:SortKey="created_at", sort_dir:SortDir="desc",
+             cursor:str|None=None, count:CountMode="exact",
+             project:Projection|None=None) -> dict:
+        """
+        color_hex keeps items within color_tolerance Delta-E of that color.
+        search is a prefix match on name/brand words through the FTS5 index
+        (sort_by="relevance" orders by bm25); ILIKE is the fallback without it.
+        Two paging modes:
+          * page/page_size: classic OFFSET paging (cost grows with page number)
+          * cursor: keyset paging on (sort column, id); pass meta.next_cursor
+            back to get the following page at the same cost as page 1.
+        count="cached" reuses a recent total, count="none" skips the COUNT query.
+        With `project`, items are that projection's dicts instead of item_to_dict().
+        """
+        stmt = (select(*project.columns) if project else select(Item)).where(Item.user_id == user_id)
 
         if kinds:
             stmt = stmt.where(Item.kind.in_([ItemKind(k) for k in kinds]))
-        if search:
+        rank = None
+        if search and fts_enabled(self.s):
+            match = fts_query(search)
+            if match is None:  # only punctuation: nothing can match
+                stmt = stmt.where(false())
+            elif sort_by == "relevance":
+                # MATERIALIZED: run the MATCH once and join its bm25 ranks. Inlined,
+                # the planner may re-run the full-text query for every row.
+                hits = (select(items_fts.c.rowid.label("id"), func.bm25(_fts_col).label("rank"))
+                        .where(_fts_col.op("MATCH")(match)).cte("fts").prefix_with("MATERIALIZED"))
+                stmt = stmt.join(hits, hits.c.id == Item.id)
+                rank = hits.c.rank
+            else:
+                # Other sorts walk the (user_id, sort) index and stop after a page;
+                # the IN list is built once and probed per row
+                stmt = stmt.where(Item.id.in_(
+                    select(items_fts.c.rowid).where(_fts_col.op("MATCH")(match))))
+        elif search:
             like = f"%{search}%"
             stmt = stmt.where(or_(Item.name.ilike(like), Item.brand.ilike(like)))
         if is_neutral is not None:
             stmt = stmt.where(Item.is_neutral == (1 if is_neutral else 0))
         if color_hex:
-            short = color_hex.lstrip("#")[:3].lower()
-            stmt = stmt.where(or_(
-                Item.main_color_hex.ilike(f"%{color_hex.lstrip('#')}%"),
-                Item.main_color_hex.ilike(f"%{short}%")
-            ))
+            stmt = stmt.where(*color_filter(color_hex, color_tolerance)[0])
 
+        # name/brand are nullable; coalesce so NULLs get a stable keyset position.
+        # The '' is inlined (not bound) so it matches the expression indexes (migration 3).
         sort_col = {
             "created_at": Item.created_at,
             "updated_at": Item.updated_at,
-            "name": Item.name,
-            "brand": Item.brand,
+            "name": func.coalesce(Item.name, _EMPTY),
+            "brand": func.coalesce(Item.brand, _EMPTY),
             "kind": Item.kind,
+            # bm25 is lower-is-better, so "asc" means best match first
+            "relevance": rank if rank is not None else Item.created_at,
         }[sort_by]
-        stmt = stmt.order_by(asc(sort_col) if sort_dir=="asc" else desc(sort_col))
+        if sort_by == "relevance" and rank is None:
+            sort_by = "created_at"  # nothing to rank without a search
+
+        total = None
+        if count != "none":
+            key = (user_id, tuple(kinds or ()), search, is_neutral, color_hex, color_tolerance)
+            now = time.monotonic()
+            if count == "cached":
+                with self._count_lock:
+                    hit = self._count_cache.get(key)
+                    if hit and hit[0] > now:
+                        self._count_cache.move_to_end(key)
+                        total = hit[1]
+            if total is None:
+                total = self.s.execute(select(func.count()).select_from(stmt.subquery())).scalar_one()
+                if count == "cached":
+                    with self._count_lock:
+                        self._count_cache[key] = (now + COUNT_TTL_SECONDS, total)
+                        self._count_cache.move_to_end(key)
+                        while len(self._count_cache) > COUNT_CACHE_SIZE:
+                            self._count_cache.popitem(last=False)
 
-        total = self.s.execute(select(func.count()).select_from(stmt.subquery())).scalar_one()
+        order = (asc if sort_dir == "asc" else desc)
+        stmt = stmt.order_by(order(sort_col), order(Item.id))
 
         page = max(1, page); page_size = max(1, min(100, page_size))
-        rows = self.s.execute(stmt.offset((page-1)*page_size).limit(page_size)).scalars().all()
-
-        def to_dict(i: Item) -> dict:
-            return {
-                "id": i.id, "user_id": i.user_id, "kind": i.kind.value,
-                "name": i.name, "brand": i.brand, "image_url": i.image_url,
-                "main_color_hex": i.main_color_hex, "is_neutral": bool(i.is_neutral),
-                "created_at": i.created_at.isoformat(), "updated_at": i.updated_at.isoformat(),
-            }
-
-        return {"items": [to_dict(r) for r in rows],
-                "meta": {"page": page, "page_size": page_size, "total": total}}
+        if cursor:
+            value, last_id = decode_cursor(cursor, sort_by, sort_dir)
+            key_cols = tuple_(sort_col, Item.id)
+            key_vals = tuple_(literal(value, Float() if sort_by == "relevance" else sort_col.type),
+                              literal(last_id, Item.id.type))
+            stmt = stmt.where(key_cols > key_vals if sort_dir == "asc" else key_cols < key_vals)
+        else:
+            stmt = stmt.offset((page-1)*page_size)
+        # one extra row tells us whether a next page exists without counting
+        if project is not None:
+            # the keyset (sort value, id) rides along after the projected columns
+            rows = self.s.execute(stmt.add_columns(sort_col, Item.id).limit(page_size + 1)).all()
+        elif rank is not None:
+            result = self.s.execute(stmt.add_columns(rank).limit(page_size + 1)).all()
+            rows, ranks = [r[0] for r in result], [r[1] for r in result]
+        else:
+            rows = self.s.execute(stmt.limit(page_size + 1)).scalars().all()
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        next_cursor = None
+        if has_more and rows:
+            last = rows[-1]
+            if project is not None:
+                last_value, last_id = last[-2], last[-1]
+            elif sort_by == "relevance":
+                last_value, last_id = ranks[page_size - 1], last.id
+            else:
+                last_value = {"name": last.name or "", "brand": last.brand or ""}.get(sort_by, getattr(last, sort_by))
+                last_id = last.id
+            next_cursor = encode_cursor(sort_by, sort_dir, last_value, last_id)
+
+        items = project.to_dicts(rows) if project is not None else [item_to_dict(r) for r in rows]
+        return {"items": items,
+                "meta": {"page": None if cursor else page, "page_size": page_size,
+                         "total": total, "next_cursor": next_cursor}}
+
+    def get_projected(self, item_id:int, project:Projection, user_id:int|None=None) -> dict|None:
+        stmt = select(*project.columns).where(Item.id == item_id)
+        if user_id is not None:
+            stmt = stmt.where(Item.user_id == user_id)
+        row = self.s.execute(stmt).first()
+        return project.to_dicts([row])[0] if row is not None else None
+
+    def get_many_projected(self, item_ids:list[int], project:Projection) -> dict[int, dict]:
+        """id -> projected dict for each existing id, in one IN query."""
+        if not item_ids: return {}
+        rows = self.s.execute(select(*project.columns, Item.id).where(Item.id.in_(set(item_ids)))).all()
+        return dict(zip((r[-1] for r in rows), project.to_dicts(rows)))
+
+    def near_color(self, *, user_id:int, color_hex:str, tolerance:float=DEFAULT_COLOR_TOLERANCE,
+                   kinds:list[str]|None=None, limit:int=20) -> list[dict]:
+        """Items within `tolerance` Delta-E of color_hex, closest first, with their delta_e."""
+        where, dist2 = color_filter(color_hex, tolerance)
+        stmt = select(Item, dist2.label("dist2")).where(Item.user_id == user_id, *where)
+        if kinds:
+            stmt = stmt.where(Item.kind.in_([ItemKind(k) for k in kinds]))
+        stmt = stmt.order_by(dist2, Item.id).limit(max(1, min(100, limit)))
+        return [{**item_to_dict(i), "delta_e": round(math.sqrt(max(d2, 0.0)), 2)}
+                for i, d2 in self.s.execute(stmt).all()]
+
+
+# ---- module-level API used by backend/api.py ----
+# api.py speaks the DTO vocabulary (category/color); the table uses kind/main_color_hex.
+DEFAULT_USER_ID = 1  # no auth yet: everything belongs to one wardrobe
+# ?sort= of the list endpoints and the browse page -> SQLItemDAO.list(sort_by, sort_dir)
+LIST_SORTS = {
+    "recent": ("created_at", "desc"),
+    "oldest": ("created_at", "asc"),
+    "name": ("name", "asc"),
+    "category": ("kind", "asc"),
+    "relevance": ("relevance", "asc"),  # best match first when searching
+}
+def _color_to_hex(color:str|None) -> str|None:
+    """"#rrggbb" for a color name or hex; None for no color. ValueError for one parse_color doesn't know."""
+    if color is None: return None
+    rgb = parse_color(color)
+    if rgb is None: raise ValueError(f"Unknown color: {color}")
+    return rgb_to_hex(rgb)
+
+def _to_api(d: dict) -> dict:
+    return {**d, "category": d["kind"], "color": d["main_color_hex"]}
+
+def _query_color(color:str) -> str:
+    hx = _color_to_hex(color)
+    if hx is None: raise ValueError(f"Unknown color: {color}")
+    return hx
+
+def _with_session(fn):
+    """
+    fn(session, ...) -> fn(...) on a fresh Session on the user's shard (its
+    user_id argument; DEFAULT_USER_ID for functions without one), see
+    shards.run_for_user.
+    """
+    params = list(signature(fn).parameters)[1:]
+    at = params.index("user_id") if "user_id" in params else None
+
+    def user_of(args, kwargs) -> int:
+        if at is not None and at < len(args): return args[at]
+        return kwargs.get("user_id", DEFAULT_USER_ID)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        return run_for_user(user_of(args, kwargs), lambda s: fn(s, *args, **kwargs))
+    return wrapper
+
+@_with_session
+def list_items(s:Session, category=None, color=None, q=None, page=1, per_page=20,
+               cursor=None, count:CountMode="exact", tolerance=DEFAULT_COLOR_TOLERANCE,
+               sort="recent", fields:tuple[str, ...]|None=None, user_id=DEFAULT_USER_ID) -> dict:
+    """fields: return just these API fields, read straight from the row (see Projection)."""
+    if sort not in LIST_SORTS: raise ValueError(f"Unknown sort: {sort}")
+    sort_by, sort_dir = LIST_SORTS[sort]
+    project = projection(tuple(fields)) if fields else None
+    res = SQLItemDAO(s).list(
+        user_id=user_id, kinds=[category] if category else None, search=q,
+        color_hex=_query_color(color) if color else None, color_tolerance=tolerance,
+        page=page, page_size=per_page, sort_by=sort_by, sort_dir=sort_dir,
+        cursor=cursor, count=count, project=project,
+    )
+    meta = res["meta"]; total = meta["total"]
+    return {
+        "items": res["items"] if project else [_to_api(i) for i in res["items"]],
+        "page": meta["page"], "total": total, "next_cursor": meta["next_cursor"],
+        "pages": None if total is None else (total + meta["page_size"] - 1) // meta["page_size"],
+    }
+
+@_with_session
+def items_near_color(s:Session, color, tolerance=DEFAULT_COLOR_TOLERANCE, category=None, limit=20,
+                     user_id=DEFAULT_USER_ID) -> list[dict]:
+    rows = SQLItemDAO(s).near_color(user_id=user_id, color_hex=_query_color(color), tolerance=tolerance,
+                                    kinds=[category] if category else None, limit=limit)
+    return [_to_api(r) for r in rows]
+
+@_with_session
+def create_item(s:Session, name, category, color=None, image_url=None, user_id=DEFAULT_USER_ID) -> dict:
+    item = SQLItemDAO(s).create(user_id=user_id, kind=category, name=name,
+                                image_url=image_url, main_color_hex=_color_to_hex(color))
+    return _to_api(item_to_dict(item))
+
+@_with_session
+def wardrobe_version(s:Session, user_id=DEFAULT_USER_ID) -> int:
+    return SQLItemDAO(s).version(user_id)
+
+@_with_session
+def get_item(s:Session, item_id:int, fields:tuple[str, ...]|None=None, user_id=DEFAULT_USER_ID) -> dict|None:
+    if fields:
+        return SQLItemDAO(s).get_projected(item_id, projection(tuple(fields)), user_id)
+    item = SQLItemDAO(s).get(item_id, user_id)
+    return _to_api(item_to_dict(item)) if item else None
+
+@_with_session
+def image_urls(s:Session, item_ids:list[int], user_id=DEFAULT_USER_ID) -> dict[int, str|None]:
+    """item_id -> image_url (None if the item has no image); unknown ids are left out."""
+    return SQLItemDAO(s).image_urls(item_ids)
+
+def _to_fields(data:dict) -> dict:
+    fields = {}
+    for k, v in data.items():
+        if k == "category": fields["kind"] = v
+        elif k == "color": fields["main_color_hex"] = _color_to_hex(v)
+        else: fields[k] = v
+    return fields
+
+@_with_session
+def update_item(s:Session, item_id:int, user_id=DEFAULT_USER_ID, **data) -> dict|None:
+    fields = _to_fields(data)  # an unknown color raises here, rather than reading as "not found"
+    try:
+        return _to_api(item_to_dict(SQLItemDAO(s).update(item_id, user_id=user_id, **fields)))
+    except ValueError:
+        return None
+
+@_with_session
+def delete_item(s:Session, item_id:int, user_id=DEFAULT_USER_ID) -> bool:
+    dao = SQLItemDAO(s)
+    if not dao.get(item_id, user_id): return False
+    dao.delete(item_id, user_id)
+    return True
+
+@_with_session
+def create_items(s:Session, rows:list[dict], user_id=DEFAULT_USER_ID) -> dict:
+    """Bulk create_item(): rows are validated CreateClothingItemDTO dicts."""
+    return SQLItemDAO(s).bulk_create(
+        [{"kind": r["category"], "name": r["name"], "image_url": r.get("image_url"),
+          "main_color_hex": _color_to_hex(r.get("color"))} for r in rows],
+        user_id=user_id)
+
+@_with_session
+def update_items(s:Session, rows:list[dict], user_id=DEFAULT_USER_ID) -> dict:
+    """Bulk update_item(): rows are {"id", **validated UpdateClothingItemDTO fields}."""
+    return SQLItemDAO(s).bulk_update([_to_fields(r) for r in rows], user_id=user_id)
+
+def item_owner(item_id:int) -> int|None:
+    """user_id of an item on whichever shard holds it; None for an unknown item."""
+    owners = fan_out(lambda s: s.scalar(select(Item.user_id).where(Item.id == item_id)))
+    return next((u for u in owners.values() if u is not None), None)
+
+# ---- perceptual-hash duplicates (see phash.py) ----
+def _duplicate_index(s:Session, user_id:int):
+    d = SQLItemDAO(s)
+    return duplicate_index((user_id, d.version(user_id)), lambda: d.phashes(user_id))
+
+@_with_session
+def possible_duplicates(s:Session, phash:int, max_distance=DEFAULT_MAX_DISTANCE, exclude=None,
+                        user_id=DEFAULT_USER_ID) -> list[dict]:
+    """[{"item_id", "distance"}] of user_id's items whose image hash is within max_distance, nearest first."""
+    return [{"item_id": k, "distance": d}
+            for k, d in _duplicate_index(s, user_id).near(phash, max_distance, exclude=exclude)]
+
+@_with_session
+def item_duplicates(s:Session, item_id:int, max_distance=DEFAULT_MAX_DISTANCE,
+                    fields:tuple[str, ...]=("id",), user_id=DEFAULT_USER_ID) -> dict|None:
+    """
+    Possible duplicates of one of user_id's items within their wardrobe: {"item_id",
+    "phash", "data": [{fields..., "distance"}]}; None for an unknown item or
+    someone else's.
+    """
+    row = s.execute(select(Item.phash).where(Item.id == item_id, Item.user_id == user_id)).first()
+    if row is None: return None
+    hits = _duplicate_index(s, user_id).duplicates_of(item_id, max_distance) or []
+    found = SQLItemDAO(s).get_many_projected([k for k, _ in hits], projection(tuple(fields)))
+    return {"item_id": item_id, "phash": format_hash(row.phash),
+            "data": [{**found[k], "distance": d} for k, d in hits if k in found]}
+
+@_with_session
+def duplicate_report(s:Session, max_distance=DEFAULT_MAX_DISTANCE, fields:tuple[str, ...]=("id",),
+                     user_id=DEFAULT_USER_ID) -> dict:
+    """
+    Whole-wardrobe dedup: groups of items whose images are chains of near
+    duplicates, largest first. {"clusters": [{"items": [...], "max_distance"}], "hashed"}
+    """
+    idx = _duplicate_index(s, user_id)
+    clusters = idx.clusters(max_distance)
+    found = SQLItemDAO(s).get_many_projected([k for c in clusters for k in c["items"]],
+                                             projection(tuple(fields)))
+    return {"clusters": [{"items": [found[k] for k in c["items"] if k in found],
+                          "max_distance": c["max_distance"]} for c in clusters],
+            "hashed": len(idx)}
+
+# ---- visual similarity (feature vectors, see features.py) ----
+@_with_session
+def similar_items(s:Session, item_id:int, limit:int|None=None, fields:tuple[str, ...]=("id",),
+                  user_id=DEFAULT_USER_ID) -> dict|None:
+    """
+    Items of the same wardrobe whose images look most like this one's:
+    {"item_id", "analysed", "data": [{fields..., "score"}]}, most similar first.
+    "analysed" is false (and data empty) until the item's image has a vector.
+    None for an unknown item or someone else's.
+    """
+    try:  # numpy-backed; loaded on the first similarity query
+        from .features import similarity_index, DEFAULT_SIMILAR
+    except ImportError:
+        from features import similarity_index, DEFAULT_SIMILAR
+    row = s.execute(select(Item.feature_row).where(Item.id == item_id, Item.user_id == user_id)).first()
+    if row is None: return None
+    if row.feature_row is None:
+        return {"item_id": item_id, "analysed": False, "data": []}
+    d = SQLItemDAO(s)
+    idx = similarity_index((user_id, d.version(user_id)), lambda: d.feature_rows(user_id))
+    hits = idx.similar_to([item_id], limit or DEFAULT_SIMILAR).get(item_id, [])
+    found = d.get_many_projected([k for k, _ in hits], projection(tuple(fields)))
+    return {"item_id": item_id, "analysed": True,
+            "data": [{**found[k], "score": round(score, 4)} for k, score in hits if k in found]}
@@ -1,14 +1,122 @@
-from sqlalchemy import create_engine
+import os
+import threading
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
-from models import Base
+try:
+    from .models import Base
+    from .migrations import migrate
+    from .metrics import instrument_engine
+    from .startup import phase
+except ImportError:  # run from inside backend/
+    from models import Base
+    from migrations import migrate
+    from metrics import instrument_engine
+    from startup import phase
 
 DB_URL = "sqlite:///./app.db"
 
-engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
+# ---- storage profile ----
+# "production": WAL (readers never wait for the writer), fsync only at
+# checkpoints, memory-mapped reads and a bigger page cache per connection.
+# "default": SQLite's own settings (rollback journal, full fsync per commit).
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+PROFILES = {
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",          # durable at checkpoint; safe with WAL
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -16 * 1024,         # KiB, per connection (mmap does the heavy lifting)
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,             # ms a writer waits for another writer
+    },
+    "default": {},
+}
+# WAL lets every reader run alongside the single writer, so the pool is sized
+# for concurrent readers rather than SQLAlchemy's 5 + 10.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "16"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "16"))
+
+def apply_pragmas(dbapi_conn, profile:str=DB_PROFILE) -> None:
+    cur = dbapi_conn.cursor()
+    try:
+        for name, value in PROFILES[profile].items():
+            cur.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cur.close()
+
+def make_engine(url:str=DB_URL, profile:str=DB_PROFILE, **kwargs):
+    """Engine for `url` with the storage profile's pragmas set on every new connection."""
+    file_db = ":memory:" not in url  # in-memory SQLite uses a single-connection pool
+    opts = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW} if file_db else {}
+    if url.startswith("sqlite"):
+        opts["connect_args"] = {"check_same_thread": False}
+    eng = create_engine(url, **{**opts, **kwargs})
+    if eng.dialect.name == "sqlite" and file_db:
+        event.listen(eng, "connect", lambda conn, _record: apply_pragmas(conn, profile))
+    instrument_engine(eng)
+    return eng
+
+engine = make_engine()
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
-def init_db() -> None:
-    Base.metadata.create_all(bind=engine)
+# ---- shards (routing, moves and fan-out live in shards.py) ----
+# DB_SHARDS=1 (default) keeps everything in app.db exactly as before. With N > 1
+# users are spread over N SQLite files: shard0 is app.db, which also stays the
+# catalog (blobs, analysis jobs, the user directory); shard1.. are DB_SHARD_URL.
+DB_SHARDS = max(1, int(os.getenv("DB_SHARDS", "1")))
+DB_SHARD_URL = os.getenv("DB_SHARD_URL", "sqlite:///./app.shard{n}.db")
+CATALOG = "shard0"
+SHARDS = tuple(f"shard{n}" for n in range(DB_SHARDS))
+
+def shard_url(name:str) -> str:
+    n = int(name.removeprefix("shard"))
+    return DB_URL if n == 0 else DB_SHARD_URL.format(n=n)
+
+# one engine (and connection pool) per shard, opened on first use
+_shard_sessions = {CATALOG: SessionLocal}
+_shard_lock = threading.Lock()
+
+def shard_sessions(name:str) -> sessionmaker:
+    """Session factory for one shard (SessionLocal for the catalog)."""
+    if name not in _shard_sessions:
+        if name not in SHARDS:
+            raise KeyError(f"Unknown shard {name!r} (DB_SHARDS={DB_SHARDS})")
+        with _shard_lock:
+            if name not in _shard_sessions:
+                _shard_sessions[name] = sessionmaker(bind=make_engine(shard_url(name)),
+                                                     autoflush=False, autocommit=False)
+    return _shard_sessions[name]
+
+def shard_engine(name:str):
+    return shard_sessions(name).kw["bind"]
+
+def init_db(eng=None) -> None:
+    """Schema + migrations on one engine (default: app.db); every shard gets the full schema."""
+    eng = engine if eng is None else eng
+    Base.metadata.create_all(bind=eng)
+    migrate(eng)
+
+_db_ready = False
+_db_lock = threading.Lock()
+
+def ensure_db() -> None:
+    """init_db() once per process (on every shard), when the database is first used rather than at import."""
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_lock:
+        if not _db_ready:
+            with phase("db: create_all + migrations"):
+                for name in SHARDS:
+                    init_db(shard_engine(name))
+                if DB_SHARDS > 1:
+                    try:
+                        from .shards import prepare
+                    except ImportError:
+                        from shards import prepare
+                    prepare()
+            _db_ready = True
 
 def get_db():
     db = SessionLocal()
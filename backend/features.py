@@ -0,0 +1,341 @@
+# features.py
+"""
+Image feature vectors and "looks like this" search over them.
+
+image_features() turns a garment photo into a FEATURE_DIM float32 unit
+vector: a hue/saturation/value histogram of the foreground, gradient
+orientation histograms at two scales (stripes, knits and plain cloth come
+apart here) and a few global statistics. Each block is normalized on its
+own and weighted, so the cosine of two vectors is a weighted sum of
+per-block similarities.
+
+Vectors live in one append-only file next to the image store,
+<ASSET_DIR>/features.f32: a 16-byte header, then float32 rows. Every blob
+(not item: identical uploads share a row) records its row number, and the
+items showing it copy that number like they copy the perceptual hash.
+Readers memory-map the file, so all worker processes share the page cache
+instead of each loading the matrix; writers append under a file lock, or
+overwrite their blob's row in place on re-analysis.
+
+SimilarityIndex answers batched top-k cosine queries for one wardrobe with
+one matrix product per block of rows. Past IVF_MIN_ITEMS items it also
+builds a coarse quantizer (IVF: k-means centroids, each item filed under
+its nearest one) and only scores the items filed under the few centroids
+closest to the query.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Any, Hashable, Iterable
+
+import numpy as np
+from PIL import Image, ImageOps
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are serialized per process only
+    fcntl = None
+
+try:
+    from .blob_store import ASSET_DIR
+    from .utils_colors import MIN_ALPHA, background_mask, rgb_to_hsv_array
+    from .utils_cache import IndexCache
+except ImportError:  # run from inside backend/
+    from blob_store import ASSET_DIR
+    from utils_colors import MIN_ALPHA, background_mask, rgb_to_hsv_array
+    from utils_cache import IndexCache
+
+SAMPLE_SIZE = 64            # image is reduced to at most this on the long side
+HUE_BINS, SAT_BINS, VAL_BINS = 12, 3, 3
+ORIENT_BINS = 8             # gradient orientations over 0..180 degrees, per scale
+EDGE_THRESHOLD = 0.1        # gradient magnitude (0..1 luminance units) counted as an edge
+COLOR_DIM = HUE_BINS * SAT_BINS * VAL_BINS
+TEXTURE_DIM = 2 * ORIENT_BINS
+STATS_DIM = 4
+FEATURE_DIM = COLOR_DIM + TEXTURE_DIM + STATS_DIM   # 128
+# share of the cosine each block contributes
+COLOR_WEIGHT, TEXTURE_WEIGHT, STATS_WEIGHT = 0.6, 0.3, 0.1
+
+FEATURES_FILE = "features.f32"
+_MAGIC = b"DMFEAT01"
+HEADER_BYTES = 16           # magic + uint32 dim + padding, keeps rows 16-byte aligned
+
+DEFAULT_SIMILAR = 12
+MAX_SIMILAR = 100
+SCAN_BLOCK_ROWS = 65_536    # rows per matrix product when scanning
+IVF_MIN_ITEMS = 20_000      # below this an exact scan is already fast enough
+IVF_PROBES = 8              # centroids whose items are scored per query
+IVF_TRAIN_SAMPLE = 50_000
+IVF_ITERS = 10
+INDEX_CACHE_SIZE = 32
+
+
+# -----------------------------------------------------------------------------
+# Extraction
+# -----------------------------------------------------------------------------
+def _load(src, size: int) -> tuple[np.ndarray, np.ndarray]:
+    """(RGB array on white, foreground mask) at most size x size."""
+    with Image.open(src) as img:
+        img.draft("RGB", (size * 2, size * 2))  # JPEG: decode at reduced scale
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size), Image.Resampling.BILINEAR)
+        rgba = np.asarray(img.convert("RGBA"), dtype=np.float32)
+    alpha = rgba[..., 3:] / 255.0
+    rgb = rgba[..., :3] * alpha + 255.0 * (1.0 - alpha)  # cut-outs flattened onto white
+    opaque = rgba[..., 3] >= MIN_ALPHA
+    fg = opaque & ~background_mask(rgb, opaque)
+    if not fg.any():  # an all-white garment is still a garment
+        fg = np.ones(fg.shape, dtype=bool)
+    return rgb, fg
+
+
+def _unit(v: np.ndarray) -> np.ndarray:
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else v
+
+
+def _orientations(gray: np.ndarray, fg: np.ndarray) -> tuple[np.ndarray, float, float]:
+    """Magnitude-weighted orientation histogram, edge density and mean magnitude on fg."""
+    gy, gx = np.gradient(gray)
+    mag = np.hypot(gx, gy)[fg]
+    theta = (np.arctan2(gy, gx)[fg] % np.pi) / np.pi  # 0..1, direction-less
+    bins = np.minimum((theta * ORIENT_BINS).astype(np.int64), ORIENT_BINS - 1)
+    hist = np.bincount(bins, weights=mag, minlength=ORIENT_BINS)
+    return hist, float((mag > EDGE_THRESHOLD).mean()), float(mag.mean())
+
+
+def image_features(src) -> np.ndarray:
+    """FEATURE_DIM float32 unit vector for an image file (path or file object)."""
+    rgb, fg = _load(src, SAMPLE_SIZE)
+
+    hsv = rgb_to_hsv_array(rgb[fg])
+    h = np.minimum((hsv[:, 0] / 360.0 * HUE_BINS).astype(np.int64), HUE_BINS - 1)
+    s = np.minimum((hsv[:, 1] * SAT_BINS).astype(np.int64), SAT_BINS - 1)
+    v = np.minimum((hsv[:, 2] * VAL_BINS).astype(np.int64), VAL_BINS - 1)
+    color = np.bincount((h * SAT_BINS + s) * VAL_BINS + v, minlength=COLOR_DIM).astype(np.float64)
+
+    gray = rgb @ np.array([0.299, 0.587, 0.114]) / 255.0
+    fine, density, mean_mag = _orientations(gray, fg)
+    # 2x2 mean pooling: the coarse scale sees weave/print structure, not pixel noise
+    hh, ww = (gray.shape[0] // 2) * 2, (gray.shape[1] // 2) * 2
+    half = gray[:hh, :ww].reshape(hh // 2, 2, ww // 2, 2).mean(axis=(1, 3))
+    half_fg = fg[:hh, :ww].reshape(hh // 2, 2, ww // 2, 2).any(axis=(1, 3))
+    coarse = _orientations(half, half_fg)[0] if half_fg.any() else np.zeros(ORIENT_BINS)
+
+    stats = np.array([density, min(1.0, mean_mag * 4.0),
+                      min(1.0, float(gray[fg].std()) * 2.0), float(fg.mean())])
+    # square roots turn histogram overlap into a cosine (Hellinger kernel)
+    vec = np.concatenate([
+        _unit(np.sqrt(color)) * np.sqrt(COLOR_WEIGHT),
+        _unit(np.sqrt(np.concatenate([_unit(fine), _unit(coarse)]))) * np.sqrt(TEXTURE_WEIGHT),
+        _unit(stats) * np.sqrt(STATS_WEIGHT),
+    ])
+    return _unit(vec).astype(np.float32)
+
+
+# -----------------------------------------------------------------------------
+# Storage
+# -----------------------------------------------------------------------------
+class FeatureMatrix:
+    """
+    The append-only feature file. rows() is a read-only memory map of the
+    rows written so far; it is re-mapped (not re-read) when the file grew.
+    """
+
+    def __init__(self, path: Path, dim: int = FEATURE_DIM):
+        self.path, self.dim = Path(path), dim
+        self.row_bytes = dim * 4
+        self._map: np.ndarray | None = None
+        self._lock = threading.Lock()
+
+    def _check_header(self, fd: int) -> None:
+        head = os.pread(fd, HEADER_BYTES, 0)
+        if len(head) < HEADER_BYTES:  # new (or torn) file
+            os.pwrite(fd, _MAGIC + self.dim.to_bytes(4, "little") + bytes(4), 0)
+        elif head[:8] != _MAGIC or int.from_bytes(head[8:12], "little") != self.dim:
+            raise ValueError(f"{self.path} is not a {self.dim}-wide feature matrix")
+
+    def __len__(self) -> int:
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+        return max(0, size - HEADER_BYTES) // self.row_bytes
+
+    def rows(self) -> np.ndarray:
+        n = len(self)
+        with self._lock:
+            if self._map is None or len(self._map) != n:
+                self._map = (np.memmap(self.path, dtype=np.float32, mode="r", offset=HEADER_BYTES,
+                                       shape=(n, self.dim)) if n else
+                             np.empty((0, self.dim), dtype=np.float32))
+            return self._map
+
+    def put(self, vec: np.ndarray, row: int | None = None) -> int:
+        """Write vec at `row` (re-analysis) or append it; returns its row."""
+        data = np.ascontiguousarray(vec, dtype=np.float32)
+        if data.shape != (self.dim,):
+            raise ValueError(f"expected a vector of {self.dim} floats, got {data.shape}")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            with self._lock:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)  # other processes append too
+                try:
+                    self._check_header(fd)
+                    if row is None or row >= len(self):
+                        # a torn last row (crash mid-write) is overwritten
+                        row = (os.fstat(fd).st_size - HEADER_BYTES) // self.row_bytes
+                    os.pwrite(fd, data.tobytes(), HEADER_BYTES + row * self.row_bytes)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+        return row
+
+
+_matrices: dict[Path, FeatureMatrix] = {}
+_matrices_lock = threading.Lock()
+
+
+def feature_matrix(root: Path = ASSET_DIR) -> FeatureMatrix:
+    """The feature file of the image store at `root`, one instance per process."""
+    path = Path(root).resolve() / FEATURES_FILE
+    with _matrices_lock:
+        if path not in _matrices:
+            _matrices[path] = FeatureMatrix(path)
+        return _matrices[path]
+
+
+# -----------------------------------------------------------------------------
+# Search
+# -----------------------------------------------------------------------------
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Per row of scores, column indices of the k largest, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+class SimilarityIndex:
+    """
+    One wardrobe's items -> feature rows, searched by cosine similarity.
+    Vectors are read through the shared FeatureMatrix at query time, so a
+    re-analysed image is picked up without rebuilding anything.
+    """
+
+    def __init__(self, matrix: FeatureMatrix, entries: Iterable[tuple[Hashable, int]],
+                 ivf_min_items: int = IVF_MIN_ITEMS, probes: int = IVF_PROBES):
+        pairs = [(k, r) for k, r in entries if r is not None]
+        self.matrix, self.probes = matrix, probes
+        self.keys = [k for k, _ in pairs]
+        self.rows = np.fromiter((r for _, r in pairs), dtype=np.int64, count=len(pairs))
+        self.position = {k: i for i, k in enumerate(self.keys)}
+        self.centroids: np.ndarray | None = None
+        self.lists: list[np.ndarray] = []
+        if len(self.keys) >= ivf_min_items:
+            self._train()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def vectors(self, positions) -> np.ndarray:
+        return np.asarray(self.matrix.rows()[self.rows[positions]])
+
+    def _scores(self, queries: np.ndarray, positions: np.ndarray | None = None) -> np.ndarray:
+        """queries @ item vectors.T, in blocks of rows so temporaries stay bounded."""
+        if positions is None:
+            matrix = self.matrix.rows()
+            if 2 * len(self.rows) >= len(matrix):
+                # most of the file is ours: score contiguous slices of the map
+                # (no copy) and pick our rows out of the result
+                full = np.empty((len(queries), len(matrix)), dtype=np.float32)
+                for i in range(0, len(matrix), SCAN_BLOCK_ROWS):
+                    full[:, i:i + SCAN_BLOCK_ROWS] = queries @ matrix[i:i + SCAN_BLOCK_ROWS].T
+                return full[:, self.rows]
+            positions = np.arange(len(self.keys))
+        out = np.empty((len(queries), len(positions)), dtype=np.float32)
+        for i in range(0, len(positions), SCAN_BLOCK_ROWS):
+            block = positions[i:i + SCAN_BLOCK_ROWS]
+            out[:, i:i + len(block)] = queries @ self.vectors(block).T
+        return out
+
+    # ---- coarse quantizer ----
+    def _train(self) -> None:
+        """Spherical k-means on a sample, then every item filed under its nearest centroid."""
+        n = len(self.keys)
+        n_lists = max(1, min(1024, int(np.sqrt(n))))
+        rng = np.random.default_rng(0)
+        sample = self.vectors(np.sort(rng.choice(n, min(n, IVF_TRAIN_SAMPLE), replace=False)))
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(IVF_ITERS):
+            labels = (sample @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+        labels = np.concatenate([
+            (self.vectors(np.arange(i, min(n, i + SCAN_BLOCK_ROWS))) @ centroids.T).argmax(axis=1)
+            for i in range(0, n, SCAN_BLOCK_ROWS)])
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(n_lists + 1))
+        self.centroids = centroids
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(n_lists)]
+
+    # ---- queries ----
+    def search(self, queries: np.ndarray, k: int, exclude: list | None = None,
+               exact: bool = False) -> list[list[tuple[Any, float]]]:
+        """
+        Top k (key, cosine) per query vector (rows of `queries`), best first.
+        exclude[i], when given, is a key left out of query i's results.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        exclude = exclude or [None] * len(queries)
+        if not self.keys:
+            return [[] for _ in queries]
+        if self.centroids is None or exact:
+            scores = self._scores(queries)
+            top = _top_k(scores, k + 1)  # one spare for the excluded key
+            return [self._hits(top[i], scores[i], None, exclude[i], k) for i in range(len(queries))]
+        probes = _top_k(queries @ self.centroids.T, self.probes)
+        out = []
+        for i, q in enumerate(queries):
+            cand = np.concatenate([self.lists[c] for c in probes[i]])
+            scores = self._scores(q[None, :], cand)
+            out.append(self._hits(_top_k(scores, k + 1)[0], scores[0], cand, exclude[i], k))
+        return out
+
+    def _hits(self, top, scores, cand, exclude, k) -> list[tuple[Any, float]]:
+        hits = []
+        for j in top:
+            key = self.keys[j if cand is None else cand[j]]
+            if key != exclude:
+                hits.append((key, float(scores[j])))
+        return hits[:k]
+
+    def similar_to(self, keys: list, k: int = DEFAULT_SIMILAR) -> dict[Any, list[tuple[Any, float]]]:
+        """Top k neighbours of each indexed key (itself excluded); unindexed keys are left out."""
+        known = [key for key in keys if key in self.position]
+        if not known:
+            return {}
+        queries = self.vectors(np.array([self.position[key] for key in known]))
+        return dict(zip(known, self.search(queries, k, exclude=known)))
+
+
+_indexes: IndexCache[SimilarityIndex] = IndexCache(INDEX_CACHE_SIZE)
+
+
+def similarity_index(key: Any, load_entries, matrix: FeatureMatrix | None = None) -> SimilarityIndex:
+    """
+    SimilarityIndex for `key`, e.g. (user_id, wardrobe version); load_entries()
+    only runs when that key isn't cached yet.
+    """
+    return _indexes.get(key, lambda: SimilarityIndex(matrix or feature_matrix(), load_entries()))
@@ -0,0 +1,213 @@
+# image_variants.py
+"""
+Resized / re-encoded image variants with a bounded on-disk LRU cache.
+
+A variant is identified by (source file identity, width, format). The first
+request renders it with Pillow on a small worker pool; concurrent requests
+for the same variant wait on the same future instead of rendering twice.
+Later requests are a plain file read. The variant key doubles as a strong
+ETag, since it changes whenever the source file or the parameters change.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+# Standard widths; requested widths snap up to the nearest one so a client
+# can't fill the cache with w=301, w=302, ...
+STANDARD_WIDTHS = (160, 320, 640, 1280)
+FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+SAVE_OPTIONS = {
+    "webp": {"quality": 80, "method": 4},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+    "png": {},
+}
+VARIANT_CACHE_MB = float(os.getenv("VARIANT_CACHE_MB", "256"))
+VARIANT_WORKERS = int(os.getenv("VARIANT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Widths to render right after upload, e.g. "320,640"; empty disables it
+PREGENERATE_WIDTHS = tuple(
+    int(w) for w in os.getenv("ASSET_PREGENERATE_WIDTHS", "").split(",") if w.strip()
+)
+
+
+@dataclass(frozen=True)
+class Variant:
+    path: Path
+    etag: str
+    mimetype: str
+
+
+def snap_width(width: int | None) -> int | None:
+    if not width or width <= 0:
+        return None
+    for w in STANDARD_WIDTHS:
+        if width <= w:
+            return w
+    return STANDARD_WIDTHS[-1]
+
+
+def negotiate_format(requested: str | None, accept: str | None, source: Path) -> str:
+    """
+    Explicit ?fmt= wins; otherwise WebP for clients that accept it, else the
+    source's own family (PNG keeps transparency, JPEG stays JPEG).
+    """
+    if requested:
+        fmt = requested.lower()
+        fmt = "jpeg" if fmt == "jpg" else fmt
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported format: {requested}")
+        return fmt
+    if accept and "image/webp" in accept:
+        return "webp"
+    return "jpeg" if source.suffix.lower() in (".jpg", ".jpeg") else "png"
+
+
+def render_variant(source: Path, dest: Path, width: int | None, fmt: str) -> None:
+    """Resize + re-encode `source` into `dest` (written atomically)."""
+    from PIL import Image, ImageOps  # Pillow loads on the first render, not at import
+    with Image.open(source) as img:
+        if width:
+            img.draft("RGB", (width, width * 4))  # JPEG: decode at reduced scale
+        img = ImageOps.exif_transpose(img)
+        if width and img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        if fmt == "jpeg" and img.mode != "RGB":
+            # JPEG has no alpha: flatten onto white like the browse cards
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA")
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        img.save(tmp, format=fmt.upper(), **SAVE_OPTIONS[fmt])
+    os.replace(tmp, dest)
+
+
+class VariantStore:
+    """Variants of the files under `source_dir`, cached under `cache_dir`."""
+
+    def __init__(self, source_dir: Path, cache_dir: Path | None = None,
+                 max_bytes: int = int(VARIANT_CACHE_MB * 1024 * 1024),
+                 workers: int = VARIANT_WORKERS):
+        self.source_dir = Path(source_dir).resolve()
+        self.cache_dir = Path(cache_dir or self.source_dir / ".variants").resolve()
+        self.max_bytes = max_bytes
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="variants")
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self._lru: "OrderedDict[Path, int]" = OrderedDict()  # path -> size, oldest first
+        self._bytes = 0
+        self._scanned = False
+
+    # ---- cache bookkeeping ----
+    def _scan(self) -> None:
+        """Seed the LRU from disk (oldest access first) once per process."""
+        if self._scanned:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        found = []
+        for p in self.cache_dir.glob("*/*"):
+            if p.name.startswith("."):
+                continue
+            st = p.stat()
+            found.append((st.st_mtime, p, st.st_size))
+        for _, p, size in sorted(found):
+            self._lru[p] = size
+            self._bytes += size
+        self._scanned = True
+
+    def _touch(self, path: Path) -> None:
+        with self._lock:
+            if path in self._lru:
+                self._lru.move_to_end(path)
+        try:
+            os.utime(path)  # lets other processes' scans see recent use
+        except OSError:
+            pass
+
+    def _admit(self, path: Path) -> None:
+        size = path.stat().st_size
+        with self._lock:
+            self._bytes += size - self._lru.pop(path, 0)
+            self._lru[path] = size
+            while self._bytes > self.max_bytes and len(self._lru) > 1:
+                old, old_size = self._lru.popitem(last=False)
+                self._bytes -= old_size
+                try:
+                    old.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._lru), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    # ---- public API ----
+    def source_path(self, filename: str) -> Path:
+        path = (self.source_dir / filename).resolve()
+        if (self.source_dir not in path.parents or self.cache_dir in path.parents
+                or not path.is_file()):
+            raise FileNotFoundError(filename)
+        return path
+
+    def key(self, source: Path, width: int | None, fmt: str) -> str:
+        st = source.stat()
+        ident = f"{source.relative_to(self.source_dir)}|{st.st_size}|{st.st_mtime_ns}|{width or 0}|{fmt}"
+        return hashlib.sha256(ident.encode()).hexdigest()[:32]
+
+    def get(self, filename: str, width: int | None = None, fmt: str = "webp") -> Variant:
+        """Return the cached variant, rendering it on the worker pool if needed."""
+        with self._lock:
+            self._scan()
+        source = self.source_path(filename)
+        width = snap_width(width)
+        key = self.key(source, width, fmt)
+        dest = self.cache_dir / key[:2] / f"{key}.{fmt}"
+        variant = Variant(path=dest, etag=key, mimetype=FORMATS[fmt])
+
+        if dest.exists():
+            self._touch(dest)
+            return variant
+
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is None:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                fut = self._pool.submit(render_variant, source, dest, width, fmt)
+                self._inflight[key] = fut
+                owner = True
+            else:
+                owner = False
+        try:
+            fut.result()
+        finally:
+            if owner:
+                with self._lock:
+                    self._inflight.pop(key, None)
+        if owner:
+            self._admit(dest)
+        return variant
+
+    def pregenerate(self, filename: str, widths=PREGENERATE_WIDTHS, formats=("webp",)) -> None:
+        """
+        Fire-and-forget rendering of standard sizes (used right after upload).
+        Runs on its own thread because get() itself waits on the pool.
+        """
+        if not widths:
+            return
+        threading.Thread(target=self._pregenerate, args=(filename, widths, formats),
+                         name="variants-pregen", daemon=True).start()
+
+    def _pregenerate(self, filename: str, widths, formats) -> None:
+        for w in widths:
+            for fmt in formats:
+                try:
+                    self.get(filename, w, fmt)
+                except Exception:
+                    pass  # a failed pre-render just means the first request renders it
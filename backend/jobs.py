@@ -0,0 +1,344 @@
+# jobs.py
+"""
+Background image analysis.
+
+Uploads store the blob and return right away with a job id; the CPU-bound
+part (k-means palette, perceptual hash, feature vector) runs in a bounded process pool, so
+it never holds a request thread. Jobs are rows in analysis_jobs:
+
+    queued -> running -> done
+                      -> queued again (retry with backoff) ... -> failed
+
+A process takes at most JOB_QUEUE_MAX unfinished jobs. Beyond that submit()
+raises QueueFull (uploads answer 503 + Retry-After), or with block=True it
+waits for a slot (the re-analysis command). Jobs a dead process left behind
+are resumed by the next queue that starts (see recover()).
+
+    JOB_WORKERS     pool processes (default: CPUs - 1, between 1 and 4)
+    JOB_QUEUE_MAX   unfinished jobs per process before uploads get 503 (default 64)
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import select, update
+
+try:
+    from .models import AnalysisJob, Blob
+    from .db import SessionLocal, ensure_db, CATALOG
+    from .shards import sharded, update_everywhere
+    from .blob_store import default_store
+    from .utils_colors import analyze_image
+    from .phash import phash, format_hash
+    from . import dao
+except ImportError:  # run from inside backend/
+    from models import AnalysisJob, Blob
+    from db import SessionLocal, ensure_db, CATALOG
+    from shards import sharded, update_everywhere
+    from blob_store import default_store
+    from utils_colors import analyze_image
+    from phash import phash, format_hash
+    import dao
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "64"))
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_SECONDS = 1.0     # retry n waits JOB_RETRY_SECONDS * 2**(n-1)
+JOB_STALE_SECONDS = 300.0   # unfinished and untouched this long: its process is gone
+MAX_WAIT_SECONDS = 30.0     # longest a request may block on a job
+# keys of a finished job's result, also merged into upload responses
+ANALYSIS_FIELDS = ("dominant_color", "palette", "phash", "possible_duplicates")
+
+
+class QueueFull(Exception):
+    """Too many unfinished jobs in this process; try again in `retry_after` seconds."""
+
+    def __init__(self, retry_after: int = 5):
+        super().__init__("Analysis queue is full")
+        self.retry_after = retry_after
+
+
+def analyze_file(path: str) -> dict:
+    """
+    The analysis itself. Runs in a pool process, so it only reads the file;
+    the parent stores "features" in the matrix and keeps it out of the result.
+    """
+    try:
+        from .features import image_features
+    except ImportError:
+        from features import image_features
+    colors = analyze_image(Path(path), use_cache=False)
+    return {"dominant_color": colors.dominant, "palette": colors.palette,
+            "phash": format_hash(phash(path)), "features": image_features(path)}
+
+
+def job_payload(job: AnalysisJob) -> dict:
+    return {
+        "id": job.id, "status": job.status, "digest": job.digest, "item_id": job.item_id,
+        "attempts": job.attempts, "error": job.error,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at.isoformat(), "updated_at": job.updated_at.isoformat(),
+    }
+
+
+class JobQueue:
+    def __init__(self, session_factory=SessionLocal, blobs=None, workers: int = JOB_WORKERS,
+                 max_pending: int = JOB_QUEUE_MAX, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.session_factory = session_factory
+        self.blobs = blobs or default_store()
+        try:  # numpy comes with it: the first queue loads it, not the web app's import
+            from .features import feature_matrix
+        except ImportError:
+            from features import feature_matrix
+        self.features = feature_matrix(self.blobs.root)
+        self.workers, self.max_pending, self.max_attempts = workers, max_pending, max_attempts
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+        self._pending = 0  # unfinished jobs owned by this process
+        self._finished: dict[int, threading.Event] = {}
+
+    # ---- submitting ----
+    def submit(self, digest: str, item_id: int | None = None, *, reuse: bool = True,
+               block: bool = False, timeout: float | None = None) -> dict:
+        """
+        Queue analysis of the stored blob `digest` and return the job. With
+        reuse, a blob already analysed (its vector is stored) answers with its
+        latest finished job instead: nothing is written, and only the
+        duplicate list is recomputed, from the (user, version)-keyed hash
+        index, for this upload's item. Raises LookupError for an unknown blob,
+        and QueueFull when this process is at JOB_QUEUE_MAX (block=True waits
+        up to `timeout` for a slot instead).
+        """
+        with self.session_factory() as s:
+            blob = s.get(Blob, digest)
+            if blob is None:
+                raise LookupError(f"Unknown blob: {digest}")
+            path = str(self.blobs.path(blob.digest, blob.ext))
+            if reuse and blob.feature_row is not None:
+                previous = s.execute(
+                    select(AnalysisJob)
+                    .where(AnalysisJob.digest == digest, AnalysisJob.status == "done")
+                    .order_by(AnalysisJob.id.desc()).limit(1)
+                ).scalar()
+                if previous is not None:
+                    payload = job_payload(previous)
+                    payload["result"] = self._with_duplicates(payload["result"], item_id)
+                    return payload
+
+            self._reserve(block, timeout)
+            try:
+                job = AnalysisJob(digest=digest, item_id=item_id, status="queued", attempts=0)
+                s.add(job)
+                s.commit()
+                payload = job_payload(job)
+            except BaseException:
+                self._release()
+                raise
+        with self._lock:
+            self._finished[payload["id"]] = threading.Event()
+        self._dispatch(payload["id"], path)
+        return payload
+
+    def _reserve(self, block: bool, timeout: float | None) -> None:
+        with self._slot_free:
+            if self._pending >= self.max_pending and not (
+                    block and self._slot_free.wait_for(
+                        lambda: self._pending < self.max_pending, timeout)):
+                raise QueueFull()
+            self._pending += 1
+
+    def _release(self) -> None:
+        with self._slot_free:
+            self._pending -= 1
+            self._slot_free.notify_all()
+
+    # ---- running ----
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn, not fork: the web process has threads and open SQLite handles
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _drop_pool(self, pool: ProcessPoolExecutor) -> None:
+        """A worker died and took the pool with it; the next dispatch starts a fresh one."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _dispatch(self, job_id: int, path: str) -> None:
+        with self.session_factory() as s:
+            s.execute(update(AnalysisJob).where(AnalysisJob.id == job_id)
+                      .values(status="running", attempts=AnalysisJob.attempts + 1))
+            s.commit()
+        pool = self._executor()
+        try:
+            fut = pool.submit(analyze_file, path)
+        except (BrokenProcessPool, RuntimeError) as e:
+            self._drop_pool(pool)
+            self._failed(job_id, path, e)
+            return
+        fut.add_done_callback(lambda f: self._done(job_id, path, pool, f))
+
+    def _done(self, job_id: int, path: str, pool: ProcessPoolExecutor, fut) -> None:
+        # runs on the pool's management thread
+        try:
+            result = fut.result()
+        except BrokenProcessPool as e:
+            self._drop_pool(pool)
+            return self._failed(job_id, path, e)
+        except Exception as e:
+            return self._failed(job_id, path, e)
+        try:
+            self._complete(job_id, result)
+        except Exception as e:
+            self._failed(job_id, path, e)
+
+    def _complete(self, job_id: int, result: dict) -> None:
+        features = result.pop("features")
+        with self.session_factory() as s:
+            job = s.get(AnalysisJob, job_id)
+            blob = s.get(Blob, job.digest)
+            row = self.features.put(features, blob.feature_row if blob is not None else None)
+            derived = {"phash": int(result["phash"], 16), "feature_row": row}
+            self.blobs.set_derived(s, job.digest, **derived)
+            s.commit()  # items showing the blob get the hash before the duplicate lookup
+            if sharded():  # the catalog only holds shard0's items
+                update_everywhere(self.blobs.items_update(job.digest, **derived), skip=(CATALOG,))
+            job.result = json.dumps(self._with_duplicates(result, job.item_id))
+            job.status, job.error = "done", None
+            s.commit()
+        self._settle(job_id)
+
+    def _failed(self, job_id: int, path: str, err: BaseException) -> None:
+        with self.session_factory() as s:
+            job = s.get(AnalysisJob, job_id)
+            retry = job.attempts < self.max_attempts
+            job.status = "queued" if retry else "failed"
+            job.error = f"{type(err).__name__}: {err}"
+            attempts = job.attempts
+            s.commit()
+        if not retry:
+            return self._settle(job_id)
+        timer = threading.Timer(JOB_RETRY_SECONDS * 2 ** (attempts - 1),
+                                self._dispatch, (job_id, path))
+        timer.daemon = True
+        timer.start()
+
+    def _settle(self, job_id: int) -> None:
+        self._release()
+        with self._lock:
+            event = self._finished.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    @staticmethod
+    def _with_duplicates(result: dict, item_id: int | None) -> dict:
+        """result plus the near-duplicates in the wardrobe of item_id's owner (the default user's without one)."""
+        h = result.get("phash")
+        if not h:
+            return {**result, "possible_duplicates": []}
+        owner = dao.item_owner(item_id) if item_id is not None else None
+        dups = dao.possible_duplicates(int(h, 16), exclude=item_id,
+                                       user_id=dao.DEFAULT_USER_ID if owner is None else owner)
+        return {**result, "possible_duplicates": dups}
+
+    # ---- reading ----
+    def get(self, job_id: int) -> dict | None:
+        with self.session_factory() as s:
+            job = s.get(AnalysisJob, job_id)
+            return job_payload(job) if job else None
+
+    def wait(self, job_id: int, timeout: float) -> dict | None:
+        """The job once it is done or failed, or as it stands after `timeout` (<= MAX_WAIT_SECONDS)."""
+        deadline = time.monotonic() + max(0.0, min(timeout, MAX_WAIT_SECONDS))
+        with self._lock:
+            event = self._finished.get(job_id)
+        if event is not None:
+            event.wait(max(0.0, deadline - time.monotonic()))
+            return self.get(job_id)
+        while True:  # another process's job (or already finished): poll the row
+            job = self.get(job_id)
+            if job is None or job["status"] in ("done", "failed") or time.monotonic() >= deadline:
+                return job
+            time.sleep(0.1)
+
+    def drain(self, timeout: float | None = None) -> bool:
+        """Block until every job this process submitted has finished."""
+        with self._slot_free:
+            return self._slot_free.wait_for(lambda: self._pending == 0, timeout)
+
+    # ---- lifecycle ----
+    def recover(self) -> int:
+        """
+        Resume jobs that stayed queued/running for JOB_STALE_SECONDS (their
+        process died). Each row is claimed with a conditional UPDATE, so two
+        processes starting together don't both take it. Returns jobs resumed.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+        resumed = 0
+        with self.session_factory() as s:
+            stale = s.execute(
+                select(AnalysisJob.id, AnalysisJob.updated_at, Blob.digest, Blob.ext)
+                .join(Blob, Blob.digest == AnalysisJob.digest, isouter=True)
+                .where(AnalysisJob.status.in_(("queued", "running")),
+                       AnalysisJob.updated_at < cutoff)
+                .order_by(AnalysisJob.id)
+            ).all()
+            for job_id, seen, digest, ext in stale:
+                if digest is None:  # blob deleted meanwhile
+                    s.execute(update(AnalysisJob).where(AnalysisJob.id == job_id)
+                              .values(status="failed", error="Blob no longer stored"))
+                    s.commit()
+                    continue
+                try:
+                    self._reserve(block=False, timeout=None)
+                except QueueFull:
+                    break  # the rest wait for the next start
+                claimed = s.execute(
+                    update(AnalysisJob)
+                    .where(AnalysisJob.id == job_id, AnalysisJob.updated_at == seen)
+                    .values(status="queued", attempts=0))
+                s.commit()
+                if claimed.rowcount != 1:
+                    self._release()
+                    continue
+                with self._lock:
+                    self._finished[job_id] = threading.Event()
+                self._dispatch(job_id, str(self.blobs.path(digest, ext)))
+                resumed += 1
+        return resumed
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+
+_queue: JobQueue | None = None
+_queue_lock = threading.Lock()
+
+
+def job_queue() -> JobQueue:
+    """Process-wide queue, built (and stale jobs resumed) on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            ensure_db()
+            _queue = JobQueue()
+            # a pool worker re-imports the app's modules; only the parent resumes jobs
+            if multiprocessing.parent_process() is None:
+                _queue.recover()
+        return _queue
@@ -1,10 +1,17 @@
-from fastapi import FastAPI
+from pathlib import Path
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from db import init_db
-import os
-
-app = FastAPI()
+from marshmallow import ValidationError
+from image_variants import VariantStore, negotiate_format
+from blob_store import ASSET_DIR
+from api_async import router as items_router, validation_error_handler
+from metrics import MetricsMiddleware
+from db import ensure_db
+from startup import preload
 
 origins = [
     "http://localhost:3000",
@@ -13,17 +20,86 @@ origins = [
     "http://127.0.0.1:5173",
     "*"
 ]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-init_db()
-os.makedirs("uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-
-@app.get("/api/health")
+
+
+class VariantStaticFiles(StaticFiles):
+    """StaticFiles that serves resized/re-encoded variants for ?w= / ?fmt= requests."""
+
+    def __init__(self, *, directory: str, store: VariantStore, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.store = store
+
+    async def get_response(self, path: str, scope):
+        request = Request(scope)
+        w, fmt = request.query_params.get("w"), request.query_params.get("fmt")
+        if w is None and fmt is None:
+            return await super().get_response(path, scope)
+        try:
+            width = int(w) if w else None
+            source = self.store.source_path(path)
+            fmt = negotiate_format(fmt, request.headers.get("accept"), source)
+            # Pillow work happens on the store's pool; don't block the event loop waiting
+            variant = await run_in_threadpool(self.store.get, path, width, fmt)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404)
+        except ValueError as e:
+            return PlainTextResponse(str(e), status_code=400)
+
+        headers = {
+            "ETag": f'"{variant.etag}"',
+            "Cache-Control": "public, max-age=31536000",
+            "Vary": "Accept",
+        }
+        if variant.etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return FileResponse(variant.path, media_type=variant.mimetype, headers=headers)
+
+
 def health():
     return {"status": "ok"}
+
+
+def create_app(lazy: bool = True) -> FastAPI:
+    """
+    The FastAPI service. The schema is created/migrated when the first
+    request opens a session (db.ensure_db), NumPy/Pillow load
+    with the first analysis job or variant; lazy=False does that here.
+    """
+    app = FastAPI()
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # outermost, so CORS preflights and errors are timed too; serves GET /metrics
+    app.add_middleware(MetricsMiddleware, app_name="fastapi")
+
+    uploads = Path("uploads")
+    uploads.mkdir(exist_ok=True)
+    app.mount("/uploads", VariantStaticFiles(directory=str(uploads), store=VariantStore(uploads)), name="uploads")
+    # Content-addressed uploads from POST /api/v1/images (same store as app_images.py)
+    ASSET_DIR.mkdir(parents=True, exist_ok=True)
+    app.mount("/assets", VariantStaticFiles(directory=str(ASSET_DIR), store=VariantStore(ASSET_DIR)), name="assets")
+
+    app.include_router(items_router)
+    app.add_exception_handler(ValidationError, validation_error_handler)
+    app.add_api_route("/api/health", health, methods=["GET"])
+    if not lazy:
+        ensure_db()
+        preload("features", "PIL.Image")
+    return app
+
+
+_app = None
+
+
+def __getattr__(name):
+    # `main.app` (uvicorn main:app) is built on first access; `uvicorn --factory main:create_app` works too
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
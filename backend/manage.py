@@ -1,5 +1,23 @@
-from db import init_db, SessionLocal
-from models import ClothingItem
+import shutil
+import sys
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from sqlalchemy import select, update
+
+from db import ensure_db, SessionLocal, SHARDS, CATALOG, shard_sessions
+from models import ClothingItem, Item, Blob, AnalysisJob
+from dao import color_columns, DEFAULT_USER_ID
+from blob_store import default_store, digest_from_ref
+from utils_files import sha256_file
+from phash import phash
+from jobs import job_queue
+from archive import export_archive, create_import, import_status, append_upload
+from utils_files import CHUNK_SIZE
+import shards
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".webp"}
 
 def seed():
     db = SessionLocal()
@@ -13,7 +31,240 @@ def seed():
     db.commit()
     db.close()
 
+def backfill_lab(batch_size=1000):
+    """Fill lab_l/lab_a/lab_b/lab_cell for items stored before color search existed (every shard)."""
+    done = 0
+    for shard in SHARDS:
+        db = shard_sessions(shard)()
+        last_id = 0
+        try:
+            while True:
+                # keyset on id: each batch starts where the last stopped, and
+                # rows left NULL (unparseable hex) are never read twice
+                rows = db.execute(
+                    select(Item).where(Item.id > last_id, Item.main_color_hex.is_not(None),
+                                       Item.lab_cell.is_(None))
+                    .order_by(Item.id).limit(batch_size)
+                ).scalars().all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                for item in rows:
+                    cols = color_columns(item.main_color_hex)
+                    if cols["lab_cell"] is None:
+                        continue  # unparseable hex; leave it unsearchable
+                    for k, v in cols.items():
+                        setattr(item, k, v)
+                    done += 1
+                db.commit()
+                if len(rows) < batch_size:
+                    break
+        finally:
+            db.close()
+    return done
+
+def migrate_blobs(src_dir, store=None):
+    """
+    One-shot move of loose image files (old uuid names) into the content-addressed
+    store. Identical files collapse into one blob; items whose image_url named an
+    old file are re-pointed at the blob and counted as references.
+    """
+    store = store or default_store()
+    src_dir = Path(src_dir).resolve()
+    in_place = src_dir == store.root
+    stats = {"files": 0, "blobs_created": 0, "duplicates": 0, "bytes_saved": 0, "items_relinked": 0}
+    db = SessionLocal()
+    try:
+        for path in sorted(src_dir.iterdir()):
+            if (not path.is_file() or path.suffix.lower() not in IMAGE_SUFFIXES
+                    or path.name.startswith((".", "__tmp__")) or digest_from_ref(path.name)):
+                continue
+            stats["files"] += 1
+            digest, size = sha256_file(path), path.stat().st_size
+            ext = path.suffix.lower().lstrip(".").replace("jpg", "jpeg")
+            staged = store.root / f"__tmp__{uuid.uuid4().hex}{path.suffix}"
+            shutil.copy2(path, staged)  # works across filesystems, original stays until done
+            try:
+                image_hash = phash(staged)
+            except Exception:
+                image_hash = None  # undecodable; backfill-phash will skip it too
+            relname, created = store.put_file(db, staged, digest, ext, size, phash=image_hash)
+            if created:
+                stats["blobs_created"] += 1
+            else:
+                stats["duplicates"] += 1
+                stats["bytes_saved"] += size
+
+            for shard in SHARDS:  # blob refcounts stay in the catalog (db)
+                sdb = db if shard == CATALOG else shard_sessions(shard)()
+                try:
+                    items = sdb.execute(select(Item).where(
+                        (Item.image_url == path.name) | Item.image_url.like(f"%/{path.name}")
+                    )).scalars().all()
+                    for item in items:
+                        old = item.image_url
+                        prefix = old[:-len(path.name)] if in_place else "/assets/"
+                        item.image_url = prefix + relname
+                        item.image_digest = digest_from_ref(relname)
+                        for col, val in store.derived(db, [relname])[relname].items():
+                            setattr(item, col, val)
+                        store.acquire(db, item.image_url)
+                        stats["items_relinked"] += 1
+                    db.commit()  # references before the items that hold them
+                    sdb.commit()
+                finally:
+                    if sdb is not db:
+                        sdb.close()
+            path.unlink()
+    finally:
+        db.close()
+    return stats
+
+def backfill_phash(store=None, batch_size=1000):
+    """
+    Perceptual hashes for blobs stored before duplicate detection existed,
+    then each blob's hash copied onto the items showing it, on every shard.
+    Returns {"blobs_hashed", "unreadable", "items_updated"}.
+    """
+    store = store or default_store()
+    stats = {"blobs_hashed": 0, "unreadable": 0, "items_updated": 0}
+    db = SessionLocal()
+    try:
+        for blob in db.execute(select(Blob).where(Blob.phash.is_(None))).scalars().all():
+            try:
+                blob.phash = phash(store.path(blob.digest, blob.ext))
+                stats["blobs_hashed"] += 1
+            except Exception:
+                stats["unreadable"] += 1
+        db.commit()
+        for shard in SHARDS:
+            sdb = db if shard == CATALOG else shard_sessions(shard)()
+            try:
+                last_id = 0
+                while True:
+                    rows = sdb.execute(
+                        select(Item.id, Item.image_url)
+                        .where(Item.id > last_id, Item.image_url.is_not(None), Item.phash.is_(None))
+                        .order_by(Item.id).limit(batch_size)
+                    ).all()
+                    if not rows:
+                        break
+                    last_id = rows[-1].id
+                    derived = store.derived(db, {r.image_url for r in rows})
+                    changes = [{"id": r.id, "phash": derived[r.image_url]["phash"]}
+                               for r in rows if derived.get(r.image_url, {}).get("phash") is not None]
+                    if changes:
+                        sdb.execute(update(Item), changes)  # executemany UPDATE by primary key
+                    sdb.commit()
+                    stats["items_updated"] += len(changes)
+            finally:
+                if sdb is not db:
+                    sdb.close()
+        return stats
+    finally:
+        db.close()
+
+def reanalyze(queue=None, batch_size=500, progress_every=100):
+    """
+    Re-run image analysis (colors, perceptual hash, feature vector) for
+    every stored blob through the same job pool as uploads; this is also how
+    images stored before similarity search get their vectors. Blobs are read
+    in keyset batches and submitted as pool slots free up, so memory stays
+    flat however large the library is. Returns {"submitted", "done", "failed"}.
+    """
+    queue = queue or job_queue()
+    job_ids, last = [], ""
+    db = SessionLocal()
+    try:
+        while True:
+            digests = db.execute(select(Blob.digest).where(Blob.digest > last)
+                                 .order_by(Blob.digest).limit(batch_size)).scalars().all()
+            if not digests:
+                break
+            for digest in digests:
+                job_ids.append(queue.submit(digest, reuse=False, block=True)["id"])
+                if len(job_ids) % progress_every == 0:
+                    print(f"  {len(job_ids)} submitted", file=sys.stderr)
+            last = digests[-1]
+        queue.drain()
+        statuses = Counter()
+        for i in range(0, len(job_ids), batch_size):
+            statuses.update(db.execute(select(AnalysisJob.status)
+                                       .where(AnalysisJob.id.in_(job_ids[i:i + batch_size]))).scalars())
+    finally:
+        db.close()
+    return {"submitted": len(job_ids), "done": statuses.get("done", 0),
+            "failed": statuses.get("failed", 0)}
+
+def export_wardrobe(path, fmt=None, user_id=DEFAULT_USER_ID):
+    """Write the wardrobe archive (as GET /api/v1/export streams it) to `path`; zip unless it ends in .tar."""
+    fmt = fmt or ("tar" if str(path).endswith(".tar") else "zip")
+    size = 0
+    with open(path, "wb") as fh:
+        for chunk in export_archive(user_id, fmt):
+            fh.write(chunk)
+            size += len(chunk)
+    return size
+
+def import_wardrobe(path, import_id=None, user_id=DEFAULT_USER_ID, queue=None):
+    """
+    Import an archive through the same resumable path as the API. Pass the
+    id of an interrupted import to continue it from the bytes/rows it had
+    reached. New images are analysed before this returns.
+    """
+    size = Path(path).stat().st_size
+    job = import_status(user_id, import_id) if import_id else create_import(user_id, size)
+    if job is None or job["size"] != size:
+        raise SystemExit(f"{import_id} is not an import of {path}")
+    print(f"import {job['id']}", file=sys.stderr)
+    queue = queue or job_queue()
+    with open(path, "rb") as fh:
+        fh.seek(job["received"])
+        job = append_upload(user_id, job["id"], job["received"], iter(lambda: fh.read(CHUNK_SIZE), b""),
+                            submit=lambda digest: queue.submit(digest, block=True))
+    queue.drain()
+    return job
+
+def show_shards():
+    """Per-shard users/items/size and the largest wardrobes, read from every shard at once."""
+    print(f"{'shard':8s} {'pinned':>8s} {'users':>8s} {'items':>10s} {'MB':>9s}")
+    for r in shards.report():
+        pinned = "-" if r["pinned"] is None else r["pinned"]
+        print(f"{r['shard']:8s} {pinned:>8} {r['users']:8d} {r['items']:10d} {r['bytes'] / 2**20:9.1f}")
+    print("largest wardrobes:", ", ".join(f"user {w['user_id']} ({w['items']} on {w['shard']})"
+                                          for w in shards.largest_wardrobes(5)) or "-")
+
 if __name__ == "__main__":
-    init_db()
+    ensure_db()
     # seed()  # ← uncomment once if you want demo rows
+    if "backfill-lab" in sys.argv[1:]:
+        print(f"Backfilled Lab colors for {backfill_lab()} items.")
+    if "migrate-blobs" in sys.argv[1:]:
+        # python manage.py migrate-blobs [dir ...]   (default: the asset dir)
+        dirs = [a for a in sys.argv[sys.argv.index("migrate-blobs") + 1:] if not a.startswith("-")]
+        for d in dirs or [default_store().root]:
+            print(d, migrate_blobs(d))
+    if "backfill-phash" in sys.argv[1:]:
+        print(f"Backfilled image hashes: {backfill_phash()}")
+    if "reanalyze" in sys.argv[1:]:
+        # python manage.py reanalyze   (JOB_WORKERS sets the pool size)
+        print(f"Re-analysed the image library: {reanalyze()}")
+    if "export" in sys.argv[1:]:
+        # python manage.py export wardrobe.zip|wardrobe.tar
+        out = sys.argv[sys.argv.index("export") + 1]
+        print(f"Exported {export_wardrobe(out)} bytes to {out}")
+    if "import" in sys.argv[1:]:
+        # python manage.py import wardrobe.zip [import id to resume]
+        args = sys.argv[sys.argv.index("import") + 1:]
+        print(f"Imported: {import_wardrobe(args[0], args[1] if len(args) > 1 else None)}")
+    if "shards" in sys.argv[1:]:
+        show_shards()
+    if "rebalance" in sys.argv[1:]:
+        # python manage.py rebalance [--dry-run]   (after raising DB_SHARDS; one rebalance at a time)
+        for move in shards.rebalance(dry_run="--dry-run" in sys.argv):
+            print(move)
+    if "move-user" in sys.argv[1:]:
+        # python manage.py move-user USER_ID shardN
+        user, target = sys.argv[sys.argv.index("move-user") + 1:][:2]
+        print(shards.move_user(int(user), target))
     print("DB ready.")
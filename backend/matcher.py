@@ -0,0 +1,323 @@
+# matcher.py
+"""
+Outfit matching.
+
+Items are grouped into slots (tops/bottoms/shoes/accessories) and every slot
+pair gets a dense float32 compatibility matrix, built once per wardrobe with
+NumPy. Outfits are then assembled slot by slot with a beam search over those
+matrices, so the cost is O(beam * items) per slot instead of the full
+tops x bottoms x shoes x accessories product.
+"""
+from __future__ import annotations
+
+import hashlib
+import time
+from dataclasses import dataclass, field
+from itertools import combinations
+from threading import Lock
+from typing import Any, Iterable
+
+import numpy as np
+
+try:
+    from .utils_colors import parse_color, rgb_to_hsv_array, NEUTRAL_NAMES
+    from .utils_cache import IndexCache
+except ImportError:  # imported from inside backend/
+    from utils_colors import parse_color, rgb_to_hsv_array, NEUTRAL_NAMES
+    from utils_cache import IndexCache
+
+SLOTS = ("tops", "bottoms", "shoes", "accessories")
+REQUIRED_SLOTS = ("tops", "bottoms", "shoes")
+
+# ClothingItem rows (and older clients) use singular category names
+_SLOT_ALIASES = {"top": "tops", "bottom": "bottoms", "shoe": "shoes",
+                 "accessory": "accessories"}
+
+SEASONS = ("spring", "summer", "fall", "winter")
+_SEASON_BITS = {name: 1 << i for i, name in enumerate(SEASONS)}
+_SEASON_BITS["autumn"] = _SEASON_BITS["fall"]
+ALL_SEASONS = (1 << len(SEASONS)) - 1
+
+# Harmony scores for two chromatic colors, by hue distance
+ANALOGOUS_DEG, COMPLEMENT_TOL, TRIADIC_TOL = 30.0, 30.0, 20.0
+SCORE_ANALOGOUS, SCORE_COMPLEMENT, SCORE_TRIADIC, SCORE_CLASH = 0.85, 0.80, 0.65, 0.35
+SCORE_NEUTRAL, SCORE_BOTH_NEUTRAL = 0.90, 0.80
+CONTRAST_BONUS = 0.10       # reward light/dark contrast between pieces
+SEASON_MISMATCH = 0.25      # multiplier when two pieces share no season
+NEUTRAL_MAX_SAT = 0.18      # below this saturation a color reads as neutral
+NEUTRAL_MAX_VAL = 0.15      # ...and anything this dark does too
+
+DEFAULT_BUDGET_MS = 50.0
+BLOCK_ROWS = 256            # beam rows scored per step between deadline checks
+INDEX_CACHE_SIZE = 64
+
+
+def normalize_slot(value: Any) -> str | None:
+    v = getattr(value, "value", value)  # ItemKind enum or plain str
+    if not v:
+        return None
+    v = str(v).strip().lower()
+    v = _SLOT_ALIASES.get(v, v)
+    return v if v in SLOTS else None
+
+
+def season_mask(value: str | None) -> int:
+    """'summer', 'spring,summer', 'all' or None -> bitmask over SEASONS."""
+    if not value or value.strip().lower() == "all":
+        return ALL_SEASONS
+    mask = 0
+    for part in value.lower().replace("/", ",").split(","):
+        mask |= _SEASON_BITS.get(part.strip(), 0)
+    return mask or ALL_SEASONS
+
+
+def _field(item: Any, *names: str) -> Any:
+    for n in names:
+        v = item.get(n) if isinstance(item, dict) else getattr(item, n, None)
+        if v is not None:
+            return v
+    return None
+
+
+@dataclass
+class _SlotGroup:
+    items: list[Any] = field(default_factory=list)
+    ids: np.ndarray | None = None        # int64 [n]
+    hsv: np.ndarray | None = None        # float32 [n, 3]
+    has_color: np.ndarray | None = None  # bool [n]
+    neutral: np.ndarray | None = None    # bool [n]
+    seasons: np.ndarray | None = None    # uint8 [n]
+
+
+def pair_scores(a: _SlotGroup, b: _SlotGroup) -> np.ndarray:
+    """Vectorized compatibility matrix (float32 [len(a), len(b)], 0..1)."""
+    ha, hb = a.hsv[:, 0][:, None], b.hsv[:, 0][None, :]
+    dh = np.abs(ha - hb)
+    dh = np.minimum(dh, 360.0 - dh)
+
+    score = np.full(dh.shape, SCORE_CLASH, dtype=np.float32)
+    score[np.abs(dh - 120.0) <= TRIADIC_TOL] = SCORE_TRIADIC
+    score[np.abs(dh - 180.0) <= COMPLEMENT_TOL] = SCORE_COMPLEMENT
+    score[dh <= ANALOGOUS_DEG] = SCORE_ANALOGOUS
+
+    na, nb = a.neutral[:, None], b.neutral[None, :]
+    score = np.where(na | nb, SCORE_NEUTRAL, score)
+    score = np.where(na & nb, SCORE_BOTH_NEUTRAL, score)
+
+    contrast = np.abs(a.hsv[:, 2][:, None] - b.hsv[:, 2][None, :])
+    score = np.minimum(1.0, score + CONTRAST_BONUS * contrast)
+
+    shared = (a.seasons[:, None] & b.seasons[None, :]) != 0
+    score = np.where(shared, score, score * SEASON_MISMATCH)
+    return score.astype(np.float32)
+
+
+class CompatibilityIndex:
+    """Per-wardrobe slot groups + precomputed pairwise compatibility matrices."""
+
+    def __init__(self, items: Iterable[Any]):
+        buckets: dict[str, list[Any]] = {s: [] for s in SLOTS}
+        for it in items:
+            slot = normalize_slot(_field(it, "kind", "category"))
+            if slot:
+                buckets[slot].append(it)
+
+        self.groups: dict[str, _SlotGroup] = {}
+        for slot, members in buckets.items():
+            if members:
+                self.groups[slot] = self._build_group(members)
+
+        self.pairs: dict[tuple[str, str], np.ndarray] = {}
+        for a, b in combinations([s for s in SLOTS if s in self.groups], 2):
+            self.pairs[(a, b)] = pair_scores(self.groups[a], self.groups[b])
+
+    @staticmethod
+    def _build_group(members: list[Any]) -> _SlotGroup:
+        n = len(members)
+        rgb = np.zeros((n, 3), dtype=np.float32)
+        has_color = np.zeros(n, dtype=bool)
+        flagged = np.zeros(n, dtype=bool)
+        seasons = np.empty(n, dtype=np.uint8)
+        for i, it in enumerate(members):
+            raw = _field(it, "main_color_hex", "color")
+            parsed = parse_color(raw)
+            if parsed is not None:
+                rgb[i] = parsed
+                has_color[i] = True
+            flagged[i] = bool(_field(it, "is_neutral")) or (
+                isinstance(raw, str) and raw.strip().lower() in NEUTRAL_NAMES)
+            seasons[i] = season_mask(_field(it, "season"))
+        hsv = rgb_to_hsv_array(rgb)
+        measured = (hsv[:, 1] < NEUTRAL_MAX_SAT) | (hsv[:, 2] < NEUTRAL_MAX_VAL)
+        # no usable color -> treat as neutral rather than guessing a hue
+        neutral = flagged | ~has_color | measured
+        ids = np.array([_field(it, "id") or 0 for it in members], dtype=np.int64)
+        return _SlotGroup(items=members, ids=ids, hsv=hsv, has_color=has_color,
+                          neutral=neutral, seasons=seasons)
+
+    def _pair(self, a: str, b: str) -> np.ndarray:
+        m = self.pairs.get((a, b))
+        return m if m is not None else self.pairs[(b, a)].T
+
+    def top_k(self, k: int = 5, *, budget_ms: float | None = DEFAULT_BUDGET_MS,
+              beam_width: int | None = None, season: str | None = None,
+              include_accessories: bool = True) -> dict:
+        """
+        Best k outfits by mean pairwise compatibility.
+        The deadline is checked between blocks of beam rows; once it has
+        passed, the rows not yet scored are dropped and the beam narrows to k
+        (greedy completion). Any result that took longer than budget_ms is
+        flagged as truncated.
+        """
+        started = time.perf_counter()
+        deadline = None if budget_ms is None else started + budget_ms / 1000.0
+        k = max(1, k)
+        beam = max(beam_width or max(8 * k, 64), k)
+        want = season_mask(season) if season else None
+
+        slots = [s for s in REQUIRED_SLOTS]
+        if include_accessories and "accessories" in self.groups:
+            slots.append("accessories")
+
+        # per-slot candidate indices, optionally restricted to one season
+        cand: dict[str, np.ndarray] = {}
+        for s in slots:
+            g = self.groups.get(s)
+            if g is None:
+                return {"outfits": [], "truncated": False, "elapsed_ms": 0.0}
+            idx = np.arange(len(g.items))
+            if want is not None:
+                idx = idx[(g.seasons & want) != 0]
+            if len(idx) == 0:
+                return {"outfits": [], "truncated": False, "elapsed_ms": 0.0}
+            cand[s] = idx
+
+        truncated = False
+        first = slots[0]
+        chosen = cand[first][:, None]                  # [B, depth]
+        totals = np.zeros(len(chosen), dtype=np.float32)
+        for depth, s in enumerate(slots[1:], start=1):
+            if deadline is not None and time.perf_counter() > deadline and not truncated:
+                # out of time: carry only the best k partial outfits forward
+                truncated, beam = True, k
+                if len(totals) > k:
+                    best = np.argpartition(-totals, k - 1)[:k]
+                    chosen, totals = chosen[best], totals[best]
+            # extend the beam a block of rows at a time, keeping the best `beam`
+            # so far; the first slot starts with every candidate, so this is
+            # also where the deadline has to be checked
+            n = len(cand[s])
+            vals = np.empty(0, dtype=np.float32)
+            rows = cols = np.empty(0, dtype=np.int64)
+            for lo in range(0, len(totals), BLOCK_ROWS):
+                if lo and deadline is not None and time.perf_counter() > deadline:
+                    truncated = True
+                    break
+                blk = slice(lo, lo + BLOCK_ROWS)
+                # partial score + compat of every candidate with every chosen piece
+                ext = np.repeat(totals[blk, None], n, axis=1)
+                for prev_pos, prev in enumerate(slots[:depth]):
+                    ext += self._pair(prev, s)[chosen[blk, prev_pos]][:, cand[s]]
+                flat = ext.ravel()
+                keep = min(beam, flat.size)
+                top = np.argpartition(-flat, keep - 1)[:keep]
+                r, c = np.divmod(top, n)
+                vals = np.concatenate([vals, flat[top]])
+                rows = np.concatenate([rows, r + lo])
+                cols = np.concatenate([cols, c])
+                if len(vals) > beam:
+                    best = np.argpartition(-vals, beam - 1)[:beam]
+                    vals, rows, cols = vals[best], rows[best], cols[best]
+            if truncated:
+                beam = k
+            chosen = np.hstack([chosen[rows], cand[s][cols][:, None]])
+            totals = vals
+
+        n_pairs = len(slots) * (len(slots) - 1) / 2
+        order = np.argsort(-totals, kind="stable")[:k]
+        outfits = []
+        for r in order:
+            outfits.append({
+                "score": round(float(totals[r] / n_pairs), 4),
+                "items": [self.groups[s].items[int(chosen[r, pos])] for pos, s in enumerate(slots)],
+            })
+        finished = time.perf_counter()
+        return {
+            "outfits": outfits,
+            # a search that ends past its budget is reported as such, even if
+            # the overrun came after the last point it could narrow the beam
+            "truncated": truncated or (deadline is not None and finished > deadline),
+            "elapsed_ms": round((finished - started) * 1000.0, 3),
+        }
+
+
+# -----------------------------------------------------------------------------
+# Index cache: wardrobe fingerprint -> CompatibilityIndex
+# -----------------------------------------------------------------------------
+_indexes: IndexCache[CompatibilityIndex] = IndexCache(INDEX_CACHE_SIZE)
+
+
+def wardrobe_fingerprint(items: Iterable[Any]) -> str:
+    h = hashlib.sha1()
+    for it in items:
+        h.update(repr((_field(it, "id"), _field(it, "kind", "category"),
+                       _field(it, "main_color_hex", "color"),
+                       bool(_field(it, "is_neutral")), _field(it, "season"))).encode())
+    return h.hexdigest()
+
+
+def get_index(items: list[Any]) -> CompatibilityIndex:
+    """Reuse the precomputed matrices while the wardrobe is unchanged."""
+    return _indexes.get(wardrobe_fingerprint(items), lambda: CompatibilityIndex(items))
+
+
+def suggest_outfits(items: list[Any], k: int = 5, **opts) -> dict:
+    return get_index(items).top_k(k, **opts)
+
+
+# -----------------------------------------------------------------------------
+# Per-season item sets (weather recommendations)
+# -----------------------------------------------------------------------------
+class SeasonalWardrobe:
+    """
+    A wardrobe split once into per-season item sets. A recommendation for a
+    set of seasons (one weather band) unions those sets and reuses a
+    CompatibilityIndex built for exactly that union, so repeat requests
+    neither rescan the wardrobe nor rebuild matrices.
+    """
+
+    def __init__(self, items: Iterable[Any]):
+        self.items = list(items)
+        masks = np.array([season_mask(_field(it, "season")) for it in self.items], dtype=np.uint8)
+        # season -> positions in self.items, ascending
+        self.by_season = {s: np.flatnonzero(masks & _SEASON_BITS[s]) for s in SEASONS}
+        self._indexes: dict[int, CompatibilityIndex] = {}
+        self._lock = Lock()
+
+    def items_for(self, seasons: Iterable[str]) -> list[Any]:
+        picked = [self.by_season[s] for s in seasons if s in self.by_season]
+        if not picked:
+            return []
+        return [self.items[i] for i in np.unique(np.concatenate(picked))]
+
+    def index_for(self, seasons: Iterable[str]) -> CompatibilityIndex:
+        seasons = tuple(seasons)
+        key = season_mask(",".join(seasons)) if seasons else ALL_SEASONS
+        with self._lock:
+            idx = self._indexes.get(key)
+        if idx is None:
+            idx = CompatibilityIndex(self.items_for(seasons) if seasons else self.items)
+            with self._lock:
+                idx = self._indexes.setdefault(key, idx)
+        return idx
+
+
+_seasonal: IndexCache[SeasonalWardrobe] = IndexCache(INDEX_CACHE_SIZE)
+
+
+def get_seasonal(key: Any, load_items) -> SeasonalWardrobe:
+    """
+    SeasonalWardrobe for `key`, e.g. (user_id, wardrobe version); load_items()
+    only runs when that key isn't cached yet.
+    """
+    return _seasonal.get(key, lambda: SeasonalWardrobe(load_items()))
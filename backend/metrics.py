@@ -0,0 +1,303 @@
+# backend/metrics.py
+"""
+Request and SQL instrumentation, exported in the Prometheus text format.
+
+Both apps record per-route latency, in-flight requests and response sizes.
+SQLAlchemy cursor events count and time the statements each request runs,
+so an N+1 loop shows up as a queries-per-request outlier on its route.
+Served at /metrics by app.py, app_images.py (instrument_flask) and main.py
+(MetricsMiddleware).
+
+Set SLOW_REQUEST_MS to log every request slower than that, together with a
+breakdown of its statements.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+
+from sqlalchemy import event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# 0 disables the slow-request log
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_MS", "0")) / 1000
+SLOW_LOG_STATEMENTS = 5
+slow_log = logging.getLogger("wardrobe.slow_requests")
+
+
+# ---------------------------------------------------------------------------
+# metric types
+# ---------------------------------------------------------------------------
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name:str, help:str, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        self._lock = Lock()
+
+    def _key(self, labels:dict) -> tuple:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount:float=1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount:float=1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def _samples(self, key, value):
+        yield f"{self.name}{_labels(self.labelnames, key)} {_fmt(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name:str, help:str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value:float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts (+Inf last), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def _samples(self, key, value):
+        counts, total = value
+        running = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            le = 'le="%s"' % _fmt(bound)
+            yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {running}"
+        yield f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}"
+        yield f"{self.name}_count{_labels(self.labelnames, key)} {running}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def gauge(self, name:str, help:str, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name:str, help:str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for m in self._metrics for line in m.render()) + "\n"
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time to produce a response.",
+    ("app", "method", "route", "status"))
+IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "Requests currently being served.", ("app",))
+RESPONSE_BYTES = REGISTRY.histogram(
+    "http_response_size_bytes", "Response body size.",
+    ("app", "method", "route"), SIZE_BUCKETS)
+REQUEST_QUERIES = REGISTRY.histogram(
+    "db_queries_per_request", "SQL statements executed while serving one request.",
+    ("app", "route"), QUERY_BUCKETS)
+REQUEST_SQL_SECONDS = REGISTRY.histogram(
+    "db_query_seconds_per_request", "Time one request spent executing SQL.",
+    ("app", "route"))
+
+
+# ---------------------------------------------------------------------------
+# per-request SQL accounting
+# ---------------------------------------------------------------------------
+class RequestStats:
+    """Statements run by one request: totals plus count/time per statement text."""
+    __slots__ = ("queries", "sql_seconds", "statements")
+
+    def __init__(self):
+        self.queries, self.sql_seconds = 0, 0.0
+        self.statements: dict[str, list] = {}
+
+    def record(self, statement:str, seconds:float) -> None:
+        self.queries += 1
+        self.sql_seconds += seconds
+        entry = self.statements.get(statement)
+        if entry is None:
+            entry = self.statements[statement] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+
+# Mutable stats object of the request being served (thread or task local)
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+_WS = re.compile(r"\s+")
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._metrics_t0 = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    t0 = getattr(context, "_metrics_t0", None)
+    if stats is not None and t0 is not None:
+        stats.record(_WS.sub(" ", statement).strip()[:200], time.perf_counter() - t0)
+
+def instrument_engine(engine) -> None:
+    """Count and time every statement on `engine` (sync or async) against the current request."""
+    target = getattr(engine, "sync_engine", engine)
+    if not event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        event.listen(target, "before_cursor_execute", _before_cursor_execute)
+        event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+def _observe(app:str, method:str, route:str, status:int, size, seconds:float,
+             stats:RequestStats) -> None:
+    REQUEST_SECONDS.observe(seconds, app=app, method=method, route=route, status=status)
+    if size is not None:
+        RESPONSE_BYTES.observe(size, app=app, method=method, route=route)
+    REQUEST_QUERIES.observe(stats.queries, app=app, route=route)
+    REQUEST_SQL_SECONDS.observe(stats.sql_seconds, app=app, route=route)
+    if SLOW_REQUEST_SECONDS and seconds >= SLOW_REQUEST_SECONDS:
+        top = sorted(stats.statements.items(), key=lambda kv: kv[1][1], reverse=True)
+        lines = [f"{method} {route} -> {status} in {seconds * 1000:.1f} ms, "
+                 f"{stats.queries} queries in {stats.sql_seconds * 1000:.1f} ms"]
+        lines += [f"  {n:4d} x {t * 1000:8.1f} ms  {sql}" for sql, (n, t) in top[:SLOW_LOG_STATEMENTS]]
+        slow_log.warning("\n".join(lines))
+
+
+# ---------------------------------------------------------------------------
+# Flask
+# ---------------------------------------------------------------------------
+def instrument_flask(app, name:str) -> None:
+    """Record request metrics for a Flask app and serve them at GET /metrics."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_t0 = time.perf_counter()
+        _current.set(RequestStats())
+        IN_FLIGHT.inc(app=name)
+
+    @app.after_request
+    def _metrics_response(response):
+        g._metrics_response = response
+        return response
+
+    @app.teardown_request
+    def _metrics_end(exc):
+        t0 = g.pop("_metrics_t0", None)
+        if t0 is None:  # an earlier before_request handler answered first
+            return
+        seconds = time.perf_counter() - t0
+        stats, response = _current.get() or RequestStats(), g.pop("_metrics_response", None)
+        _current.set(None)
+        IN_FLIGHT.dec(app=name)
+        status, size = 500, None
+        if response is not None:
+            status = response.status_code
+            size = response.content_length
+            if size is None and not response.is_streamed:
+                size = response.calculate_content_length()
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        _observe(name, request.method, route, status, size, seconds, stats)
+
+    app.add_url_rule("/metrics", "metrics",
+                     lambda: Response(REGISTRY.render(), content_type=CONTENT_TYPE))
+
+
+# ---------------------------------------------------------------------------
+# ASGI (FastAPI)
+# ---------------------------------------------------------------------------
+def _asgi_route(scope) -> str:
+    route = scope.get("route")  # set by FastAPI's APIRoute when it matches
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    if "endpoint" in scope and scope.get("root_path"):  # a mounted app, e.g. /assets
+        return scope["root_path"] + "/{path}"
+    return "<unmatched>"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording the same metrics; also answers GET /metrics."""
+
+    def __init__(self, app, app_name:str="fastapi"):
+        self.app, self.app_name = app, app_name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if scope["path"] == "/metrics" and scope["method"] == "GET":
+            body = REGISTRY.render().encode()
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", CONTENT_TYPE.encode()),
+                                    (b"content-length", str(len(body)).encode())]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        status, size = 500, 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        t0 = time.perf_counter()
+        stats = RequestStats()
+        token = _current.set(stats)
+        IN_FLIGHT.inc(app=self.app_name)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = time.perf_counter() - t0
+            _current.reset(token)
+            IN_FLIGHT.dec(app=self.app_name)
+            _observe(self.app_name, scope["method"], _asgi_route(scope), status, size,
+                     seconds, stats)
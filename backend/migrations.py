@@ -0,0 +1,261 @@
+# migrations.py
+"""
+Schema steps that create_all can't express (virtual tables, triggers, new
+indexes on existing tables). Each step runs once; progress is tracked in
+SQLite's PRAGMA user_version, so init_db() can call migrate() every start.
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+try:
+    from .blob_store import digest_from_ref
+except ImportError:  # run from inside backend/
+    from blob_store import digest_from_ref
+
+
+def _m001_items_fts(conn: Connection) -> None:
+    """FTS5 index over items.name/brand, kept in sync by triggers, backfilled."""
+    conn.exec_driver_sql("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+            name, brand,
+            content='items', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )""")
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN
+            INSERT INTO items_fts(rowid, name, brand) VALUES (new.id, new.name, new.brand);
+        END""")
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN
+            INSERT INTO items_fts(items_fts, rowid, name, brand)
+            VALUES ('delete', old.id, old.name, old.brand);
+        END""")
+    conn.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS items_fts_au AFTER UPDATE OF name, brand ON items BEGIN
+            INSERT INTO items_fts(items_fts, rowid, name, brand)
+            VALUES ('delete', old.id, old.name, old.brand);
+            INSERT INTO items_fts(rowid, name, brand) VALUES (new.id, new.name, new.brand);
+        END""")
+    # backfill rows written before the index existed
+    conn.exec_driver_sql("INSERT INTO items_fts(items_fts) VALUES ('rebuild')")
+
+
+def _m002_wardrobe_versions(conn: Connection) -> None:
+    """
+    Bump wardrobe_versions.version for the owning user on every insert,
+    update and delete of items, whoever makes the write (DAO, bulk, manage.py).
+    """
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS wardrobe_versions (
+            user_id INTEGER NOT NULL PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )""")
+    bump = """INSERT INTO wardrobe_versions(user_id, version) SELECT {who}.user_id, 1 {where}
+              ON CONFLICT(user_id) DO UPDATE SET version = version + 1;"""
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER IF NOT EXISTS items_version_ai AFTER INSERT ON items BEGIN
+            {bump.format(who="new", where="WHERE true")}
+        END""")
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER IF NOT EXISTS items_version_ad AFTER DELETE ON items BEGIN
+            {bump.format(who="old", where="WHERE true")}
+        END""")
+    conn.exec_driver_sql(f"""
+        CREATE TRIGGER IF NOT EXISTS items_version_au AFTER UPDATE ON items BEGIN
+            {bump.format(who="new", where="WHERE true")}
+            {bump.format(who="old", where="WHERE old.user_id <> new.user_id")}
+        END""")
+    # start every existing wardrobe at version 1
+    conn.exec_driver_sql("""
+        INSERT OR IGNORE INTO wardrobe_versions(user_id, version)
+        SELECT DISTINCT user_id, 1 FROM items""")
+
+
+def _m003_list_indexes(conn: Connection) -> None:
+    """
+    Composite indexes for SQLItemDAO.list: every query filters on user_id and
+    orders by (sort column, id), so each sort gets an index in exactly that
+    order and pages come straight off the index (OFFSET, keyset cursors, and
+    the per-user COUNT) with no temp B-tree sort. name/brand sort on
+    coalesce(col, ''), matched here as expression indexes.
+    """
+    for name, cols in (
+        ("ix_items_user_created", "user_id, created_at, id"),
+        ("ix_items_user_updated", "user_id, updated_at, id"),
+        ("ix_items_user_name", "user_id, coalesce(name, ''), id"),
+        ("ix_items_user_brand", "user_id, coalesce(brand, ''), id"),
+        ("ix_items_user_kind_created", "user_id, kind, created_at, id"),
+    ):
+        conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON items ({cols})")
+    # single-column user_id index is a prefix of all of the above
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_items_user_id")
+    conn.exec_driver_sql("ANALYZE items")
+
+
+def _m004_phash(conn: Connection) -> None:
+    """
+    Perceptual hashes (phash.py) on blobs, copied onto the items that use
+    them, plus a partial (user_id, phash) index so a wardrobe's hashes load
+    from the index alone. New databases already got the columns from
+    create_all(). Existing blobs/items are filled by `manage.py backfill-phash`.
+    """
+    for tbl in ("blobs", "items"):
+        cols = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({tbl})")}
+        if "phash" not in cols:
+            conn.exec_driver_sql(f"ALTER TABLE {tbl} ADD COLUMN phash INTEGER")
+    conn.exec_driver_sql("""
+        CREATE INDEX IF NOT EXISTS ix_items_user_phash ON items (user_id, phash)
+        WHERE phash IS NOT NULL""")
+
+
+def _m005_analysis_jobs(conn: Connection) -> None:
+    """
+    Job table for background image analysis (jobs.py). (status, updated_at)
+    finds stale work to resume after a crash; (digest, status) finds a
+    finished analysis of the same bytes to reuse.
+    """
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS analysis_jobs (
+            id INTEGER NOT NULL PRIMARY KEY,
+            digest VARCHAR(64) NOT NULL,
+            item_id INTEGER,
+            status VARCHAR(8) NOT NULL,
+            attempts INTEGER NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL,
+            updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL
+        )""")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_analysis_jobs_status ON analysis_jobs (status, updated_at)")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_analysis_jobs_digest ON analysis_jobs (digest, status)")
+
+
+def _m006_feature_rows(conn: Connection) -> None:
+    """
+    Feature-matrix row numbers (features.py) on blobs and their items, and a
+    partial (user_id, feature_row) index so a wardrobe's rows load from the
+    index alone. Existing images get vectors from `manage.py reanalyze`.
+    """
+    for tbl in ("blobs", "items"):
+        cols = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({tbl})")}
+        if "feature_row" not in cols:
+            conn.exec_driver_sql(f"ALTER TABLE {tbl} ADD COLUMN feature_row INTEGER")
+    conn.exec_driver_sql("""
+        CREATE INDEX IF NOT EXISTS ix_items_user_feature_row ON items (user_id, feature_row)
+        WHERE feature_row IS NOT NULL""")
+
+
+def _m007_archive_imports(conn: Connection) -> None:
+    """Resumable wardrobe-archive imports (archive.py): upload state and the position reached."""
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS archive_imports (
+            id VARCHAR(32) NOT NULL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            status VARCHAR(9) NOT NULL,
+            size INTEGER NOT NULL,
+            members_done INTEGER NOT NULL,
+            rows_done INTEGER NOT NULL,
+            items_imported INTEGER NOT NULL,
+            images_created INTEGER NOT NULL,
+            images_skipped INTEGER NOT NULL,
+            failed INTEGER NOT NULL,
+            error TEXT,
+            created_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL,
+            updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL
+        )""")
+
+
+def _m008_shards(conn: Connection) -> None:
+    """Per-user sharding (shards.py): the user directory, move tombstones, id sequences."""
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS user_shards (
+            user_id INTEGER NOT NULL PRIMARY KEY,
+            shard VARCHAR(16) NOT NULL
+        )""")
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS moved_users (
+            user_id INTEGER NOT NULL PRIMARY KEY,
+            shard VARCHAR(16) NOT NULL
+        )""")
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS id_sequences (
+            name VARCHAR(32) NOT NULL PRIMARY KEY,
+            next_id INTEGER NOT NULL
+        )""")
+
+
+def _m009_lab_columns(conn: Connection) -> None:
+    """
+    CIELAB columns for color search (utils_colors.lab_cell) and the
+    (user_id, lab_cell) index, for databases created before create_all()
+    knew about them. Existing rows are filled by `manage.py backfill-lab`.
+    """
+    cols = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(items)")}
+    for name, typ in (("lab_l", "FLOAT"), ("lab_a", "FLOAT"), ("lab_b", "FLOAT"), ("lab_cell", "INTEGER")):
+        if name not in cols:
+            conn.exec_driver_sql(f"ALTER TABLE items ADD COLUMN {name} {typ}")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_items_user_lab_cell ON items (user_id, lab_cell)")
+
+
+def _m010_image_digest(conn: Connection) -> None:
+    """
+    The blob digest an item's image_url names, in its own column with a
+    partial index, so copying a blob's analysis onto its items is an
+    equality lookup instead of a LIKE scan over image_url. Filled here for
+    existing rows; the DAO sets it with every image_url it writes.
+    """
+    cols = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(items)")}
+    if "image_digest" not in cols:
+        conn.exec_driver_sql("ALTER TABLE items ADD COLUMN image_digest VARCHAR(64)")
+    rows = [{"id": i, "d": digest_from_ref(url)} for i, url in conn.exec_driver_sql(
+        "SELECT id, image_url FROM items WHERE image_url IS NOT NULL AND image_digest IS NULL")]
+    rows = [r for r in rows if r["d"]]
+    if rows:
+        conn.execute(text("UPDATE items SET image_digest = :d WHERE id = :id"), rows)
+    conn.exec_driver_sql("""
+        CREATE INDEX IF NOT EXISTS ix_items_image_digest ON items (image_digest)
+        WHERE image_digest IS NOT NULL""")
+
+
+# (version, name, step) in order; never edit a shipped step, append a new one
+MIGRATIONS = [
+    (1, "items_fts", _m001_items_fts),
+    (2, "wardrobe_versions", _m002_wardrobe_versions),
+    (3, "list_indexes", _m003_list_indexes),
+    (4, "phash", _m004_phash),
+    (5, "analysis_jobs", _m005_analysis_jobs),
+    (6, "feature_rows", _m006_feature_rows),
+    (7, "archive_imports", _m007_archive_imports),
+    (8, "shards", _m008_shards),
+    (9, "lab_columns", _m009_lab_columns),
+    (10, "image_digest", _m010_image_digest),
+]
+
+
+def current_version(conn: Connection) -> int:
+    return conn.execute(text("PRAGMA user_version")).scalar_one()
+
+
+def migrate(engine: Engine) -> list[str]:
+    """Apply pending steps; returns the names applied. No-op on non-SQLite engines."""
+    if engine.dialect.name != "sqlite":
+        return []
+    applied = []
+    with engine.begin() as conn:
+        version = current_version(conn)
+        for target, name, step in MIGRATIONS:
+            if target <= version:
+                continue
+            step(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {int(target)}")
+            applied.append(name)
+    return applied
+
+
+def has_items_fts(conn: Connection) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='items_fts'"
+    )).first() is not None
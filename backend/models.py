@@ -1,8 +1,23 @@
-from sqlalchemy import Column, Integer, String, DateTime, func
+import enum
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, Float, Index, func
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
+class UInt64(TypeDecorator):
+    """Unsigned 64-bit value (e.g. a perceptual hash) in SQLite's signed INTEGER."""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return value - (1 << 64) if value is not None and value >= (1 << 63) else value
+
+    def process_result_value(self, value, dialect):
+        return value + (1 << 64) if value is not None and value < 0 else value
+
 class ClothingItem(Base):
     __tablename__ = "clothing_items"
 
@@ -11,3 +26,116 @@ class ClothingItem(Base):
     category  = Column(String, nullable=False, index=True)
     color     = Column(String, nullable=False, index=True)
     created_at = Column(DateTime, server_default=func.now())
+
+class ItemKind(str, enum.Enum):
+    tops = "tops"
+    bottoms = "bottoms"
+    shoes = "shoes"
+    accessories = "accessories"
+
+class Item(Base):
+    __tablename__ = "items"
+
+    id             = Column(Integer, primary_key=True, index=True)
+    user_id        = Column(Integer, nullable=False)  # indexed by (user_id, sort) composites, migration 3
+    kind           = Column(Enum(ItemKind), nullable=False, index=True)
+    name           = Column(String)
+    brand          = Column(String)
+    image_url      = Column(String)
+    image_digest   = Column(String(64))  # blob digest named by image_url (blob_store.digest_from_ref)
+    main_color_hex = Column(String(7))
+    is_neutral     = Column(Integer, nullable=False, default=0)
+    season         = Column(String)  # spring|summer|fall|winter|all, comma-separated
+    # CIELAB of main_color_hex + its coarse grid cell (see utils_colors.lab_cell)
+    lab_l          = Column(Float)
+    lab_a          = Column(Float)
+    lab_b          = Column(Float)
+    lab_cell       = Column(Integer)
+    phash          = Column(UInt64)  # perceptual hash of the image (copied from its blob, see phash.py)
+    feature_row    = Column(Integer)  # its blob's row in the feature matrix (features.py)
+    # Python-side defaults keep microseconds, so keyset cursors on these columns
+    # compare against exactly what was stored (SQLite's CURRENT_TIMESTAMP doesn't)
+    created_at     = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+    updated_at     = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now(),
+                            onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_items_user_lab_cell", "user_id", "lab_cell"),
+    )
+
+class Blob(Base):
+    """One stored image file, addressed by the SHA-256 of its bytes."""
+    __tablename__ = "blobs"
+
+    digest     = Column(String(64), primary_key=True)
+    ext        = Column(String(8), nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    refcount   = Column(Integer, nullable=False, default=0)  # items pointing at it
+    phash      = Column(UInt64)  # perceptual hash (phash.py); NULL until computed
+    feature_row = Column(Integer)  # row of its vector in the feature matrix (features.py)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+
+class WardrobeVersion(Base):
+    """Per-user change counter for items, bumped by triggers (see migrations)."""
+    __tablename__ = "wardrobe_versions"
+
+    user_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class AnalysisJob(Base):
+    """Background analysis (colors, perceptual hash, features) of one stored image; see jobs.py."""
+    __tablename__ = "analysis_jobs"
+
+    id         = Column(Integer, primary_key=True)
+    digest     = Column(String(64), nullable=False)  # blob analysed
+    item_id    = Column(Integer)  # item the upload was linked to, if any
+    status     = Column(String(8), nullable=False, default="queued")  # queued|running|done|failed
+    attempts   = Column(Integer, nullable=False, default=0)
+    result     = Column(Text)  # JSON, once done
+    error      = Column(Text)  # last failure
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now(),
+                        onupdate=datetime.utcnow)
+    # indexed by migration 5
+
+class ArchiveImport(Base):
+    """A wardrobe archive being uploaded (resumably) and imported; see archive.py."""
+    __tablename__ = "archive_imports"
+
+    id             = Column(String(32), primary_key=True)  # random hex; the upload URL is the capability
+    user_id        = Column(Integer, nullable=False)
+    status         = Column(String(9), nullable=False, default="uploading")  # uploading|importing|done|failed
+    size           = Column(Integer, nullable=False)  # bytes announced by the client
+    # position reached in the archive: members fully applied, then lines of the next items member
+    members_done   = Column(Integer, nullable=False, default=0)
+    rows_done      = Column(Integer, nullable=False, default=0)
+    items_imported = Column(Integer, nullable=False, default=0)
+    images_created = Column(Integer, nullable=False, default=0)
+    images_skipped = Column(Integer, nullable=False, default=0)  # already stored (same content hash)
+    failed         = Column(Integer, nullable=False, default=0)  # rows/members that couldn't be imported
+    error          = Column(Text)  # last problem seen
+    created_at     = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+    updated_at     = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now(),
+                            onupdate=datetime.utcnow)
+
+# ---- sharding (shards.py); these live in every shard, used as noted ----
+class UserShard(Base):
+    """Directory (catalog only): the shard holding each user's rows."""
+    __tablename__ = "user_shards"
+
+    user_id = Column(Integer, primary_key=True)
+    shard   = Column(String(16), nullable=False)
+
+class MovedUser(Base):
+    """Tombstone on a shard a user was moved off; requests that still land here are turned away."""
+    __tablename__ = "moved_users"
+
+    user_id = Column(Integer, primary_key=True)
+    shard   = Column(String(16), nullable=False)  # where the rows went
+
+class IdSequence(Base):
+    """Next unreserved id of a table whose ids must be unique across shards (catalog only)."""
+    __tablename__ = "id_sequences"
+
+    name    = Column(String(32), primary_key=True)
+    next_id = Column(Integer, nullable=False)
@@ -0,0 +1,206 @@
+# phash.py
+"""
+Perceptual image hashes and a Hamming-distance index over them.
+
+phash() is the classic 64-bit DCT hash: downscale to 32x32 grayscale, take
+the 8x8 lowest-frequency DCT coefficients and set one bit per coefficient
+above their median. Re-encodes, resizes, small crops and brightness changes
+flip only a few bits, so the Hamming distance between two hashes measures
+how alike the pictures look (<= ~10 of 64 bits: very likely the same photo
+of the same garment).
+
+DuplicateIndex keeps a wardrobe's hashes in a multi-index hash table, so
+"what is within distance r of this hash" opens a few buckets instead of
+comparing against every image.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from itertools import combinations
+from typing import TYPE_CHECKING, Any, Hashable, Iterable
+
+try:
+    from .utils_cache import IndexCache
+except ImportError:  # imported from inside backend/
+    from utils_cache import IndexCache
+
+if TYPE_CHECKING:  # imported where images are hashed, so the index side stays light
+    import numpy as np
+
+HASH_BITS = 64
+DCT_SIZE = 32   # image is reduced to DCT_SIZE x DCT_SIZE before the transform
+LOW_FREQ = 8    # LOW_FREQ x LOW_FREQ coefficients -> HASH_BITS bits
+DEFAULT_MAX_DISTANCE = 10
+MAX_DISTANCE = 24  # beyond this unrelated images start to match
+INDEX_CACHE_SIZE = 32
+
+
+@lru_cache(maxsize=None)
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis; D @ x @ D.T is the 2-D transform of x."""
+    import numpy as np
+    k = np.arange(n)[:, None]
+    d = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    d[0] /= np.sqrt(2.0)
+    return d
+
+
+def _grayscale(src, size: int) -> np.ndarray:
+    import numpy as np
+    from PIL import Image, ImageOps
+    with Image.open(src) as img:
+        img.draft("L", (size * 4, size * 4))  # JPEG: decode at reduced scale
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+            # transparent cut-outs: flatten onto white like the browse cards
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        gray = img.convert("L").resize((size, size), Image.Resampling.LANCZOS)
+    return np.asarray(gray, dtype=np.float64)
+
+
+def phash(src) -> int:
+    """64-bit perceptual hash of an image file (path or file object), as an unsigned int."""
+    import numpy as np
+    dct = _dct_matrix(DCT_SIZE)
+    coeffs = (dct @ _grayscale(src, DCT_SIZE) @ dct.T)[:LOW_FREQ, :LOW_FREQ].ravel()
+    # the DC term only tracks overall brightness; keep it out of the threshold
+    bits = coeffs > np.median(coeffs[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def format_hash(h: int | None) -> str | None:
+    return None if h is None else f"{h:016x}"
+
+
+# -----------------------------------------------------------------------------
+# Multi-index hashing
+# -----------------------------------------------------------------------------
+@lru_cache(maxsize=None)
+def _flip_masks(bits: int, radius: int) -> tuple[int, ...]:
+    """Every `bits`-wide mask with at most `radius` bits set, fewest first."""
+    return tuple(sum(1 << b for b in combo)
+                 for r in range(radius + 1) for combo in combinations(range(bits), r))
+
+
+class MultiIndex:
+    """
+    Multi-index hashing over 64-bit hashes: each hash is cut into CHUNKS
+    substrings of CHUNK_BITS bits, and every substring position has its own
+    table substring -> keys. If two hashes differ in at most r bits, one of
+    their substrings differs in at most r // CHUNKS bits (pigeonhole), so a
+    query only opens the buckets within that many flips of each of its
+    substrings and checks the full distance on what it finds there.
+
+    (A BK-tree was the other candidate; at the radii that matter here, ~10
+    of 64 bits, it ends up visiting most of its nodes.)
+    """
+    CHUNKS = 4
+    CHUNK_BITS = HASH_BITS // CHUNKS
+    _CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+    __slots__ = ("hashes", "_tables")
+
+    def __init__(self, entries: Iterable[tuple[Hashable, int]] = ()):
+        self.hashes: dict[Hashable, int] = {}
+        self._tables: list[dict[int, list]] = [{} for _ in range(self.CHUNKS)]
+        for key, h in entries:
+            self.add(key, h)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def _chunks(self, h: int):
+        return ((h >> (i * self.CHUNK_BITS)) & self._CHUNK_MASK for i in range(self.CHUNKS))
+
+    def add(self, key: Hashable, h: int) -> None:
+        self.hashes[key] = h
+        for table, sub in zip(self._tables, self._chunks(h)):
+            table.setdefault(sub, []).append(key)
+
+    def search(self, h: int, radius: int) -> list[tuple[Hashable, int]]:
+        """[(key, distance)] of every entry within `radius` of h, nearest first."""
+        sub_radius = radius // self.CHUNKS
+        masks = _flip_masks(self.CHUNK_BITS, sub_radius)
+        candidates = set()
+        for table, sub in zip(self._tables, self._chunks(h)):
+            if len(masks) <= len(table):
+                for m in masks:
+                    bucket = table.get(sub ^ m)
+                    if bucket:
+                        candidates.update(bucket)
+            else:  # sparse table: cheaper to test every occupied bucket
+                for other, bucket in table.items():
+                    if (other ^ sub).bit_count() <= sub_radius:
+                        candidates.update(bucket)
+        found = [(k, d) for k in candidates if (d := hamming(h, self.hashes[k])) <= radius]
+        found.sort(key=lambda kd: kd[1])
+        return found
+
+
+class DuplicateIndex:
+    """One wardrobe's item hashes: per-item near-duplicate lookups and a dedup report."""
+
+    def __init__(self, entries: Iterable[tuple[Any, int]]):
+        self.index = MultiIndex((key, h) for key, h in entries if h is not None)
+        self.hashes = self.index.hashes
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def near(self, h: int, max_distance: int = DEFAULT_MAX_DISTANCE,
+             exclude: Any = None) -> list[tuple[Any, int]]:
+        return [(k, d) for k, d in self.index.search(h, max_distance) if k != exclude]
+
+    def duplicates_of(self, key: Any, max_distance: int = DEFAULT_MAX_DISTANCE) -> list[tuple[Any, int]] | None:
+        """Near duplicates of an indexed entry, or None when it has no hash."""
+        h = self.hashes.get(key)
+        return None if h is None else self.near(h, max_distance, exclude=key)
+
+    def clusters(self, max_distance: int = DEFAULT_MAX_DISTANCE) -> list[dict]:
+        """
+        Groups of entries linked by chains of near-duplicate pairs (one index
+        query per entry, then union-find). Each group lists its keys and the
+        largest pairwise distance among the links that joined it.
+        """
+        parent = {k: k for k in self.hashes}
+
+        def find(k):
+            while parent[k] != k:
+                parent[k] = parent[parent[k]]
+                k = parent[k]
+            return k
+
+        widest: dict[Any, int] = {}
+        for key, h in self.hashes.items():
+            for other, d in self.near(h, max_distance, exclude=key):
+                a, b = find(key), find(other)
+                if a != b:
+                    parent[b] = a
+                    widest[a] = max(widest.get(a, 0), widest.pop(b, 0), d)
+                else:
+                    widest[a] = max(widest.get(a, 0), d)
+
+        groups: dict[Any, list] = {}
+        for key in self.hashes:
+            groups.setdefault(find(key), []).append(key)
+        out = [{"items": sorted(keys), "max_distance": widest.get(root, 0)}
+               for root, keys in groups.items() if len(keys) > 1]
+        out.sort(key=lambda g: (-len(g["items"]), g["items"][0]))
+        return out
+
+
+_indexes: IndexCache[DuplicateIndex] = IndexCache(INDEX_CACHE_SIZE)
+
+
+def duplicate_index(key: Any, load_entries) -> DuplicateIndex:
+    """
+    DuplicateIndex for `key`, e.g. (user_id, wardrobe version); load_entries()
+    only runs when that key isn't cached yet.
+    """
+    return _indexes.get(key, lambda: DuplicateIndex(load_entries()))
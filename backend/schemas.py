@@ -1,18 +1,28 @@
 # backend/schemas.py
-from marshmallow import Schema, fields, validate
+from marshmallow import Schema, ValidationError, fields, validate
+
+try:
+    from .utils_colors import parse_color
+except ImportError:  # imported from inside backend/
+    from utils_colors import parse_color
 
 CATEGORY_ENUM = ("tops", "bottoms", "shoes", "accessories")
 
+def known_color(value):
+    """A color name or hex parse_color understands; anything else would be stored as no color."""
+    if parse_color(value) is None:
+        raise ValidationError(f"Unknown color: {value}")
+
 class CreateClothingItemDTO(Schema):
     name = fields.Str(required=True, validate=validate.Length(min=1))
     category = fields.Str(required=True, validate=validate.OneOf(CATEGORY_ENUM))
-    color = fields.Str(load_default=None, allow_none=True)
+    color = fields.Str(load_default=None, allow_none=True, validate=known_color)
     image_url = fields.Str(load_default=None, allow_none=True)
 
 class UpdateClothingItemDTO(Schema):
     name = fields.Str(validate=validate.Length(min=1))
     category = fields.Str(validate=validate.OneOf(CATEGORY_ENUM))
-    color = fields.Str(allow_none=True)
+    color = fields.Str(allow_none=True, validate=known_color)
     image_url = fields.Str(allow_none=True)
 
 class ClothingItemDTO(Schema):
@@ -21,3 +31,6 @@ class ClothingItemDTO(Schema):
     category = fields.Str()
     color = fields.Str(allow_none=True)
     image_url = fields.Str(allow_none=True)
+
+# Fields of an item response; list/detail GETs read exactly these columns (dao.Projection)
+ITEM_FIELDS = tuple(ClothingItemDTO._declared_fields)
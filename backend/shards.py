@@ -0,0 +1,475 @@
+# shards.py
+"""
+Per-user sharding over several SQLite files (DB_SHARDS > 1, see db.py).
+
+Every row that belongs to one user (items with their FTS rows and wardrobe
+version, archive imports) lives on that user's shard, so writes for users on
+different shards never queue behind each other's write lock. What every user
+shares stays in the catalog (shard0 = app.db): blobs and their refcounts,
+analysis jobs, the user directory and the id sequences.
+
+Routing: a new user is placed by a consistent-hash ring and pinned in the
+directory (user_shards), so later ring changes (more shards) don't move
+anybody by themselves; `manage.py rebalance` moves users to where the ring
+now wants them with move_user(), online.
+
+Moves are fenced by a tombstone (moved_users) on the shard the user left.
+Every commit on a user's session checks for it while holding the shard's
+write lock, and reads check it afterwards; a request that still landed on
+the old shard raises UserMoved and run_for_user() reruns it on the new one.
+Item ids come from a catalog sequence, a block at a time, so they stay
+unique across shards and survive moves unchanged.
+
+With DB_SHARDS=1 all of this is bypassed: shard_for() is always the catalog
+and sessions are neither fenced nor split.
+"""
+from __future__ import annotations
+
+import bisect
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from sqlalchemy import event, select, insert, update, delete, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+try:
+    from .models import Item, WardrobeVersion, ArchiveImport, UserShard, MovedUser, IdSequence
+    from .db import DB_SHARDS, SHARDS, CATALOG, shard_sessions, shard_engine, ensure_db
+except ImportError:  # run from inside backend/
+    from models import Item, WardrobeVersion, ArchiveImport, UserShard, MovedUser, IdSequence
+    from db import DB_SHARDS, SHARDS, CATALOG, shard_sessions, shard_engine, ensure_db
+
+VNODES = 64  # ring points per shard; more evens out the split
+ID_BLOCK = 1000  # item ids reserved from the catalog per round trip
+MAX_ROUTES = 3  # attempts of one call while its user keeps being moved
+MOVE_BATCH = 1000  # rows per transaction while copying a user to its new shard
+MOVE_ROUNDS = 3  # unlocked re-syncs before a move fences the user for the last delta
+USER_TABLES = (Item, WardrobeVersion, ArchiveImport)  # rows that follow a user between shards
+
+
+def sharded() -> bool:
+    return DB_SHARDS > 1
+
+
+class UserMoved(Exception):
+    """The user's rows left this shard after the call was routed here."""
+
+    def __init__(self, user_id: int, shard: str):
+        super().__init__(f"user {user_id} moved to {shard}")
+        self.user_id, self.shard = user_id, shard
+
+
+# ---- placement ----
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of user ids onto shards: adding a shard moves ~1/N of the users."""
+
+    def __init__(self, shards=SHARDS, vnodes: int = VNODES):
+        points = sorted((_hash(f"{shard}#{i}"), shard) for shard in shards for i in range(vnodes))
+        self._keys = [p for p, _ in points]
+        self._shards = [s for _, s in points]
+
+    def shard_for(self, user_id: int) -> str:
+        i = bisect.bisect(self._keys, _hash(f"user:{user_id}")) % len(self._keys)
+        return self._shards[i]
+
+
+RING = HashRing()
+_placement: dict[int, str] = {}  # user_id -> shard, as last read from the directory
+
+
+def shard_for(user_id: int) -> str:
+    """The shard holding user_id's rows; a user seen for the first time is pinned where the ring says."""
+    if not sharded():
+        return CATALOG
+    shard = _placement.get(user_id)
+    if shard is None:
+        with shard_sessions(CATALOG)() as s:
+            s.execute(sqlite_insert(UserShard).values(user_id=user_id, shard=RING.shard_for(user_id))
+                      .on_conflict_do_nothing())
+            s.commit()
+            shard = s.scalar(select(UserShard.shard).where(UserShard.user_id == user_id))
+        if shard not in SHARDS:
+            raise RuntimeError(f"user {user_id} lives on {shard}, beyond DB_SHARDS={DB_SHARDS}")
+        _placement[user_id] = shard
+    return shard
+
+
+def forget(user_id: int) -> None:
+    """Drop the cached placement (the user moved); the next shard_for() reads the directory."""
+    _placement.pop(user_id, None)
+
+
+# ---- fencing ----
+def _moved_to(session: Session, user_id: int) -> str | None:
+    # runs on every fenced commit: a bare primary-key lookup, without building an ORM query
+    return session.connection().exec_driver_sql(
+        "SELECT shard FROM moved_users WHERE user_id = ?", (user_id,)).scalar()
+
+
+@event.listens_for(Session, "before_commit")
+def _fence(session: Session) -> None:
+    fence = session.info.get("fence")
+    if fence is None:
+        return
+    session.flush()  # take the shard's write lock first, so a move can't slip in before the commit
+    target = _moved_to(session, fence[0])
+    if target is not None:
+        raise UserMoved(fence[0], target)
+
+
+@event.listens_for(Session, "after_commit")
+def _committed(session: Session) -> None:
+    if "fence" in session.info:
+        session.info["committed"] = True
+
+
+def bind(session: Session, user_id: int, shard: str) -> Session | None:
+    """
+    Set up a session on user_id's shard for the DAO: fenced against the user
+    being moved away, plus a catalog session for blob refcounts when the shard
+    isn't the catalog itself (returned; the caller closes it).
+    """
+    if not sharded():
+        return None
+    session.info["fence"] = (user_id, shard)
+    if shard == CATALOG:
+        return None
+    catalog = session.info["catalog"] = shard_sessions(CATALOG)()
+    return catalog
+
+
+def catalog_of(session: Session) -> Session:
+    """Where blob rows are read and written for a session bound by bind(): the catalog."""
+    return session.info.get("catalog", session)
+
+
+def check(session: Session) -> None:
+    """After a read: raise UserMoved if what it saw may be a shard the user already left."""
+    fence = session.info.get("fence")
+    if fence is not None and not session.info.get("committed"):
+        target = _moved_to(session, fence[0])
+        if target is not None:
+            raise UserMoved(fence[0], target)
+
+
+def run_for_user(user_id: int, fn: Callable[[Session], object]):
+    """
+    fn(session) on user_id's shard. If the user was moved meanwhile and fn
+    hadn't committed anything yet, it runs again on the new shard.
+    """
+    ensure_db()
+    for attempt in range(MAX_ROUTES):
+        shard = shard_for(user_id)
+        s = shard_sessions(shard)()
+        catalog = bind(s, user_id, shard)
+        try:
+            result = fn(s)
+            check(s)
+            return result
+        except UserMoved:
+            if s.info.get("committed") or attempt == MAX_ROUTES - 1:
+                raise
+            forget(user_id)
+        finally:
+            s.close()
+            if catalog is not None:
+                catalog.close()
+
+
+# ---- global item ids ----
+class IdAllocator:
+    """Ids for one table, unique across shards: reserved from id_sequences ID_BLOCK at a time."""
+
+    def __init__(self, name: str, block: int = ID_BLOCK):
+        self.name, self.block = name, block
+        self._next = self._end = 0
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def take(self, n: int) -> list[int]:
+        out: list[int] = []
+        with self._lock:
+            if self._pid != os.getpid():  # forked worker: the parent's block isn't ours to hand out
+                self._next = self._end = 0
+                self._pid = os.getpid()
+            while len(out) < n:
+                if self._next == self._end:
+                    self._reserve(max(self.block, n - len(out)))
+                k = min(n - len(out), self._end - self._next)
+                out.extend(range(self._next, self._next + k))
+                self._next += k
+        return out
+
+    def _reserve(self, k: int) -> None:
+        with shard_sessions(CATALOG)() as s:
+            end = s.execute(update(IdSequence).where(IdSequence.name == self.name)
+                            .values(next_id=IdSequence.next_id + k)
+                            .returning(IdSequence.next_id)).scalar_one()
+            s.commit()
+        self._next, self._end = end - k, end
+
+
+_item_ids = IdAllocator("items")
+
+
+def item_ids(n: int) -> list[int] | None:
+    """n fresh item ids when sharded; None leaves them to the shard's own rowid."""
+    return _item_ids.take(n) if sharded() else None
+
+
+# ---- fan-out ----
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def fan_out(fn: Callable[[Session], object], shards=SHARDS) -> dict[str, object]:
+    """
+    fn(session) on each shard at once, each with its own session (SQLite
+    releases the GIL while it works; session.info["shard"] names the shard);
+    {shard: result} in shard order.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=max(1, DB_SHARDS), thread_name_prefix="shard")
+
+    def run(shard):
+        with shard_sessions(shard)() as s:
+            s.info["shard"] = shard
+            return fn(s)
+
+    futures = {shard: _pool.submit(run, shard) for shard in shards}
+    return {shard: f.result() for shard, f in futures.items()}
+
+
+def update_everywhere(stmt, skip=()) -> int:
+    """Run one UPDATE/DELETE on every shard (but `skip`) and commit; total rows touched."""
+    def run(s):
+        n = s.execute(stmt).rowcount
+        s.commit()
+        return n
+    return sum(fan_out(run, [sh for sh in SHARDS if sh not in skip]).values())
+
+
+def prepare() -> None:
+    """
+    First sharded start (from db.ensure_db): pin the users already in app.db
+    to it, and start the item id sequence above every id on any shard.
+    """
+    top = max(fan_out(lambda s: s.scalar(select(func.max(Item.id))) or 0).values())
+    with shard_sessions(CATALOG)() as s:
+        if s.get(IdSequence, "items") is None:
+            users = s.scalars(select(Item.user_id).distinct()).all()
+            users += s.scalars(select(ArchiveImport.user_id).distinct()).all()
+            if users:
+                s.execute(sqlite_insert(UserShard).on_conflict_do_nothing(),
+                          [{"user_id": u, "shard": CATALOG} for u in set(users)])
+            s.execute(sqlite_insert(IdSequence).values(name="items", next_id=top + 1)
+                      .on_conflict_do_nothing())
+        s.execute(update(IdSequence).where(IdSequence.name == "items", IdSequence.next_id <= top)
+                  .values(next_id=top + 1))
+        s.commit()
+
+
+# ---- admin queries ----
+def _db_bytes(shard: str) -> int:
+    path = shard_engine(shard).url.database or ""
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def report() -> list[dict]:
+    """Per shard: users pinned to it, users and items actually stored, file size."""
+    ensure_db()
+    stored = fan_out(lambda s: s.execute(
+        select(func.count(func.distinct(Item.user_id)), func.count(Item.id))).one())
+    with shard_sessions(CATALOG)() as s:
+        pinned = dict(s.execute(select(UserShard.shard, func.count()).group_by(UserShard.shard)).all())
+    return [{"shard": shard, "pinned": pinned.get(shard, 0) if sharded() else None,
+             "users": users, "items": items, "bytes": _db_bytes(shard)}
+            for shard, (users, items) in stored.items()]
+
+
+def largest_wardrobes(limit: int = 10) -> list[dict]:
+    """The users with the most items across every shard, largest first."""
+    ensure_db()
+    per_shard = fan_out(lambda s: s.execute(
+        select(Item.user_id, func.count()).group_by(Item.user_id)
+        .order_by(func.count().desc()).limit(limit)).all())
+    merged = [{"user_id": u, "items": n, "shard": shard}
+              for shard, rows in per_shard.items() for u, n in rows]
+    return sorted(merged, key=lambda r: -r["items"])[:limit]
+
+
+# ---- rebalancing ----
+def _user_rows(s: Session, model, user_id: int, after: int | None = None, limit: int | None = None):
+    table = model.__table__
+    q = select(table).where(table.c.user_id == user_id)
+    if after is not None:
+        q = q.where(table.c.id > after).order_by(table.c.id).limit(limit)
+    return [dict(r) for r in s.execute(q).mappings()]
+
+
+def _clear_user(s: Session, user_id: int) -> None:
+    for model in USER_TABLES:
+        s.execute(delete(model).where(model.user_id == user_id))
+
+
+def _version(s: Session, user_id: int) -> int:
+    return s.scalar(select(WardrobeVersion.version).where(WardrobeVersion.user_id == user_id)) or 0
+
+
+def _sync_items(s: Session, t: Session, user_id: int) -> int:
+    """Make t's copy of the user's items equal s's; rows changed."""
+    src = {r["id"]: r for r in _user_rows(s, Item, user_id)}
+    dst = {r["id"]: r for r in _user_rows(t, Item, user_id)}
+    stale = [i for i in dst if src.get(i) != dst[i]]
+    fresh = [src[i] for i in src if src[i] != dst.get(i)]
+    if stale:
+        t.execute(delete(Item).where(Item.id.in_(stale)))
+    if fresh:
+        t.execute(insert(Item.__table__), fresh)
+    return len(stale) + len(fresh)
+
+
+def _pin(s: Session, user_id: int, shard: str) -> None:
+    s.execute(sqlite_insert(UserShard).values(user_id=user_id, shard=shard)
+              .on_conflict_do_update(index_elements=[UserShard.user_id], set_={"shard": shard}))
+
+
+def move_user(user_id: int, target: str, batch: int = MOVE_BATCH) -> dict:
+    """
+    Move one user's rows to `target` while the app keeps serving them:
+
+    1. copy the items over in batches, then re-sync whatever changed during
+       the copy until the wardrobe version holds still, without locking anything;
+    2. tombstone the user on the source (this takes its write lock, so from
+       here on writes for the user wait, then fail over with UserMoved);
+       copy the last delta, carry the wardrobe version over bumped (so no cache
+       keyed on it is reused), commit the target, repoint the directory and
+       commit the tombstone, which releases the source;
+    3. delete the source rows in batches, after the fence.
+
+    Only step 2 holds the lock, and it copies just what changed since the
+    last unlocked pass, so writers see UserMoved rather than "database is
+    locked". Run one move at a time. A crash leaves at worst a copy on the
+    shard the directory doesn't point at, which the next move or sweep() removes.
+    """
+    ensure_db()
+    forget(user_id)
+    source = shard_for(user_id)
+    if target not in SHARDS:
+        raise KeyError(f"Unknown shard {target!r}")
+    if source == target:
+        return {"user_id": user_id, "from": source, "to": target, "items": 0, "resynced": 0}
+    S, T = shard_sessions(source), shard_sessions(target)
+
+    with T() as t:  # leftovers of an earlier, interrupted move
+        _clear_user(t, user_id)
+        t.commit()
+    with S() as s:
+        synced = _version(s, user_id)
+    copied, cursor = 0, 0
+    while True:
+        with S() as s:
+            rows = _user_rows(s, Item, user_id, after=cursor, limit=batch)
+        if not rows:
+            break
+        with T() as t:
+            t.execute(insert(Item.__table__), rows)
+            t.commit()
+        cursor, copied = rows[-1]["id"], copied + len(rows)
+    resynced = 0
+    for _ in range(MOVE_ROUNDS):  # catch up with writes made during the copy, still unlocked
+        with S() as s, T() as t:
+            v = _version(s, user_id)
+            if v == synced:
+                break
+            resynced += _sync_items(s, t, user_id)
+            t.commit()
+        synced = v
+
+    with S() as s, T() as t:
+        s.execute(sqlite_insert(MovedUser).values(user_id=user_id, shard=target)
+                  .on_conflict_do_update(index_elements=[MovedUser.user_id], set_={"shard": target}))
+        v1 = _version(s, user_id)
+        if v1 != synced:
+            resynced += _sync_items(s, t, user_id)
+        t.execute(delete(ArchiveImport).where(ArchiveImport.user_id == user_id))
+        imports = _user_rows(s, ArchiveImport, user_id)
+        if imports:
+            t.execute(insert(ArchiveImport.__table__), imports)
+        t.execute(delete(MovedUser).where(MovedUser.user_id == user_id))
+        version = max(v1, _version(t, user_id)) + 1
+        t.execute(sqlite_insert(WardrobeVersion).values(user_id=user_id, version=version)
+                  .on_conflict_do_update(index_elements=[WardrobeVersion.user_id],
+                                         set_={"version": version}))
+        if target == CATALOG:
+            _pin(t, user_id, target)
+        t.commit()
+        if source == CATALOG:
+            _pin(s, user_id, target)
+        elif target != CATALOG:
+            with shard_sessions(CATALOG)() as c:
+                _pin(c, user_id, target)
+                c.commit()
+        s.commit()
+    forget(user_id)
+
+    with S() as s:  # the tombstone turns every caller away from here on
+        while s.execute(delete(Item).where(Item.id.in_(
+                select(Item.id).where(Item.user_id == user_id).limit(batch)))).rowcount:
+            s.commit()
+        _clear_user(s, user_id)
+        s.commit()
+    return {"user_id": user_id, "from": source, "to": target, "items": copied, "resynced": resynced}
+
+
+def plan() -> list[tuple[int, str, str]]:
+    """(user_id, shard it's pinned to, shard the ring wants) for every user not where the ring puts them."""
+    ensure_db()
+    with shard_sessions(CATALOG)() as s:
+        pins = s.execute(select(UserShard.user_id, UserShard.shard)).all()
+    return [(u, shard, RING.shard_for(u)) for u, shard in pins if shard != RING.shard_for(u)]
+
+
+def sweep() -> int:
+    """
+    Remove users' rows from shards the directory doesn't point at (what an
+    interrupted move leaves behind), tombstoning them there; users swept.
+    Not while a move is running: its half-made copy would be swept too.
+    """
+    ensure_db()
+    with shard_sessions(CATALOG)() as s:
+        pins = dict(s.execute(select(UserShard.user_id, UserShard.shard)).all())
+
+    def run(s):
+        here = s.info["shard"]
+        users = set(s.scalars(select(Item.user_id).distinct()))
+        users |= set(s.scalars(select(ArchiveImport.user_id).distinct()))
+        strays = [u for u in users if u in pins and pins[u] != here]
+        for u in strays:
+            s.execute(sqlite_insert(MovedUser).values(user_id=u, shard=pins[u])
+                      .on_conflict_do_update(index_elements=[MovedUser.user_id], set_={"shard": pins[u]}))
+            _clear_user(s, u)
+        s.commit()
+        return len(strays)
+
+    return sum(fan_out(run).values())
+
+
+def rebalance(dry_run: bool = False, limit: int | None = None) -> list[dict]:
+    """Move every user the ring places elsewhere (e.g. after DB_SHARDS grew); one move at a time."""
+    moves = plan()[:limit]
+    if dry_run:
+        return [{"user_id": u, "from": src, "to": dst} for u, src, dst in moves]
+    done = [move_user(u, dst) for u, _, dst in moves]
+    sweep()
+    return done
@@ -0,0 +1,159 @@
+# startup.py
+"""
+Worker boot: lazily loaded subsystems and a startup profiler.
+
+The app factories (app.create_app, app_images.create_app, main.create_app)
+only import what serving a plain request needs. The Swagger API, image
+analysis (NumPy/Pillow) and schema creation/migration load the first time
+something uses them; each such step runs inside phase(), which times it
+when profiling is on.
+
+    python -m backend.startup [web|images|fastapi] [--request PATH] [--eager] [--top N] [--cwd DIR]
+
+runs one cold boot of the app in a fresh interpreter (python -X importtime),
+serves one request in-process, and prints the boot timeline (import, factory,
+first request), the phases, and the modules that took longest to import,
+per module and per top-level package.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+BACKEND = ROOT / "backend"
+PROFILE_ENV = "STARTUP_PROFILE"
+# (phase name, seconds), in the order they finished; only filled while profiling
+PHASES: list[tuple[str, float]] = []
+
+
+@contextmanager
+def phase(name: str):
+    """Time one initialization step (recorded only when STARTUP_PROFILE is set)."""
+    if not os.environ.get(PROFILE_ENV):
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASES.append((name, time.perf_counter() - t0))
+
+
+def preload(*modules: str) -> None:
+    """Import modules now instead of on first use (eager factories, --preload servers)."""
+    import importlib
+    for name in modules:
+        with phase(f"preload {name}"):
+            importlib.import_module(name)
+
+
+# ---- boot in a fresh interpreter ----
+# target -> (directory put on sys.path and used as cwd, module, how to serve one request)
+TARGETS = {
+    "web": (ROOT, "app", "flask"),
+    "images": (BACKEND, "app_images", "flask"),
+    "fastapi": (BACKEND, "main", "asgi"),
+}
+DEFAULT_REQUESTS = {"web": "/api/v1/items?per_page=20", "images": "/health", "fastapi": "/api/v1/items"}
+
+_BOOT = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module} as target
+t1 = time.perf_counter()
+app = target.create_app(lazy={lazy})
+t2 = time.perf_counter()
+status = None
+if {path!r}:
+    if {kind!r} == "flask":
+        status = app.test_client().get({path!r}).status_code
+    else:
+        from starlette.testclient import TestClient
+        with TestClient(app) as client:
+            status = client.get({path!r}).status_code
+t3 = time.perf_counter()
+# app.py imports this module as backend.startup, the apps in backend/ as startup
+phases = [p for m in ("backend.startup", "startup") if m in sys.modules for p in sys.modules[m].PHASES]
+print("BOOT " + json.dumps({{"import": t1 - t0, "create_app": t2 - t1, "first_request": t3 - t2,
+                            "status": status, "phases": phases}}))
+"""
+
+
+def boot_command(target: str, path: str | None = None, eager: bool = False,
+                 importtime: bool = False) -> tuple[list[str], Path, dict]:
+    """(argv, cwd, env) that boots `target` once and prints a BOOT {json} line."""
+    cwd, module, kind = TARGETS[target]
+    code = _BOOT.format(module=module, lazy=not eager, path=path or "", kind=kind)
+    argv = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    env = {**os.environ, PROFILE_ENV: "1",
+           "PYTHONPATH": os.pathsep.join([str(cwd), str(ROOT)])}
+    return argv, cwd, env
+
+
+def run_boot(target: str, path: str | None = None, eager: bool = False,
+             importtime: bool = False, cwd: Path | None = None) -> tuple[dict, str]:
+    """Boot once; returns (the BOOT record, stderr)."""
+    argv, default_cwd, env = boot_command(target, path, eager, importtime)
+    proc = subprocess.run(argv, cwd=cwd or default_cwd, env=env, capture_output=True, text=True)
+    line = next((ln for ln in proc.stdout.splitlines() if ln.startswith("BOOT ")), None)
+    if proc.returncode != 0 or line is None:
+        raise RuntimeError(f"{target} failed to boot:\n{proc.stderr[-4000:]}")
+    return json.loads(line[5:]), proc.stderr
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, float, float]]:
+    """[(module, self seconds, cumulative seconds)] from python -X importtime output."""
+    out = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        out.append((name.strip(), int(self_us) / 1e6, int(cum_us) / 1e6))
+    return out
+
+
+def report(target: str, path: str | None, eager: bool, top: int, cwd: Path | None = None) -> str:
+    boot, stderr = run_boot(target, path, eager, importtime=True, cwd=cwd)
+    modules = parse_importtime(stderr)
+    packages: dict[str, float] = defaultdict(float)
+    for name, self_s, _ in modules:
+        packages[name.split(".")[0]] += self_s
+
+    ms = lambda s: f"{s * 1000:9.1f} ms"  # noqa: E731
+    lines = [f"{target} ({'eager' if eager else 'lazy'}) boot",
+             f"  import     {ms(boot['import'])}",
+             f"  create_app {ms(boot['create_app'])}",
+             f"  first request {path or '-'} -> {boot['status']}: {ms(boot['first_request'])}",
+             "", "phases:"]
+    lines += [f"  {ms(s)}  {name}" for name, s in boot["phases"]] or ["  (none)"]
+    lines += ["", f"slowest imports (cumulative, top {top}):"]
+    lines += [f"  {ms(c)}  {ms(s)} self  {name}"
+              for name, s, c in sorted(modules, key=lambda m: -m[2])[:top]]
+    lines += ["", f"import time by top-level package (self, top {top}):"]
+    lines += [f"  {ms(s)}  {name}" for name, s in sorted(packages.items(), key=lambda p: -p[1])[:top]]
+    return "\n".join(lines)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Profile one cold boot of an app.")
+    ap.add_argument("target", nargs="?", default="web", choices=sorted(TARGETS))
+    ap.add_argument("--request", default=None, help="path to request once after boot ('' for none)")
+    ap.add_argument("--eager", action="store_true", help="load every subsystem in create_app")
+    ap.add_argument("--top", type=int, default=25)
+    ap.add_argument("--cwd", type=Path, default=None,
+                    help="directory to boot in (app.db, images/); default: where the app normally runs")
+    args = ap.parse_args()
+    path = DEFAULT_REQUESTS[args.target] if args.request is None else args.request
+    print(report(args.target, path, args.eager, args.top, cwd=args.cwd))
+
+
+if __name__ == "__main__":
+    main()
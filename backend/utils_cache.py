@@ -0,0 +1,35 @@
+# utils_cache.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class IndexCache(Generic[T]):
+    """
+    Thread-safe LRU of indexes built from a wardrobe, keyed by e.g. (user_id,
+    wardrobe version): a key's index is built once, and a write bumps the
+    version so the next lookup simply misses. At most `size` are kept.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries: OrderedDict[Hashable, T] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, build: Callable[[], T]) -> T:
+        """The index cached for `key`; build() only runs (outside the lock) when there is none."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value
+        value = build()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return value
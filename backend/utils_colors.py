@@ -0,0 +1,310 @@
+# utils_colors.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING
+
+try:
+    from .utils_files import sha256_file
+except ImportError:  # imported from inside backend/ (python app_images.py)
+    from utils_files import sha256_file
+
+# numpy and Pillow are imported inside the pixel functions below: the hex/Lab
+# helpers run on every item query, and a process that never decodes an image
+# shouldn't load them at startup
+if TYPE_CHECKING:
+    import numpy as np
+
+# -----------------------------------------------------------------------------
+# Tuning knobs
+# -----------------------------------------------------------------------------
+SAMPLE_SIZE = 96          # longest side after downsampling (~9k pixels max)
+PALETTE_SIZE = 5          # k for k-means
+KMEANS_ITERS = 12
+BORDER_PX = 2             # ring of the sample used to estimate the backdrop
+BG_DELTA_E = 12.0         # pixels this close (Lab) to a backdrop color are dropped
+BG_SHARE = 0.25           # a border color covering this much of the ring is backdrop
+BG_MAX = 0.9              # dropping more than this of the image means it's the garment
+MIN_ALPHA = 128           # mostly transparent pixels are background too
+CACHE_MAX_ENTRIES = 2048  # palettes are tiny, so this is a few hundred KiB
+
+
+@dataclass(frozen=True)
+class ColorAnalysis:
+    dominant: str                               # "#rrggbb"
+    palette: list[str] = field(default_factory=list)   # dominant first
+    weights: list[float] = field(default_factory=list)  # share of sampled pixels
+
+
+# content-hash -> analysis; re-uploads of the same bytes skip decoding entirely
+_cache: "OrderedDict[str, ColorAnalysis]" = OrderedDict()
+_cache_lock = Lock()
+
+
+def rgb_to_hex(rgb) -> str:
+    r, g, b = (int(round(c)) for c in rgb)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def hex_to_rgb(value: str) -> tuple[int, int, int]:
+    v = value.lstrip("#")
+    if len(v) == 3:
+        v = "".join(ch * 2 for ch in v)
+    if len(v) != 6:
+        raise ValueError(f"not a hex color: {value!r}")
+    return int(v[0:2], 16), int(v[2:4], 16), int(v[4:6], 16)
+
+
+# Plain color words users type into the "color" field -> representative RGB
+NAMED_COLORS: dict[str, tuple[int, int, int]] = {
+    "black": (20, 20, 20), "white": (245, 245, 245), "grey": (128, 128, 128),
+    "gray": (128, 128, 128), "charcoal": (54, 69, 79), "navy": (0, 0, 128),
+    "beige": (225, 205, 170), "khaki": (195, 176, 145), "cream": (255, 253, 208),
+    "brown": (120, 72, 40), "tan": (210, 180, 140), "denim": (21, 96, 189),
+    "blue": (40, 90, 200), "red": (200, 30, 40), "green": (40, 140, 60),
+    "olive": (110, 110, 40), "yellow": (240, 210, 40), "orange": (240, 130, 30),
+    "pink": (240, 150, 180), "purple": (120, 60, 160), "burgundy": (128, 0, 32),
+}
+
+# Colors that go with everything, regardless of measured saturation
+NEUTRAL_NAMES = {"black", "white", "grey", "gray", "charcoal", "navy", "beige",
+                 "khaki", "cream", "tan", "denim"}
+
+
+def parse_color(value: str | None) -> tuple[int, int, int] | None:
+    """'#1a2b3c', '1a2b3c', '#abc' or a plain name like 'navy'; None if unknown."""
+    if not value:
+        return None
+    v = value.strip().lower()
+    if v in NAMED_COLORS:
+        return NAMED_COLORS[v]
+    try:
+        return hex_to_rgb(v)
+    except ValueError:
+        return None
+
+
+# -----------------------------------------------------------------------------
+# CIELAB + a coarse Lab grid used as a database index for "near this color"
+# -----------------------------------------------------------------------------
+_D65 = (0.95047, 1.0, 1.08883)
+LAB_CELL = 10.0     # grid pitch in Delta-E units
+_L_CELLS, _AB_CELLS = 11, 26   # L 0..100, a/b -128..127
+
+
+def _srgb_to_linear(c: float) -> float:
+    c /= 255.0
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+
+def rgb_to_lab(rgb) -> tuple[float, float, float]:
+    """sRGB (0..255) -> CIELAB under D65. Plain Python: called per row in the DAO."""
+    r, g, b = (_srgb_to_linear(float(c)) for c in rgb)
+    x = (0.4124 * r + 0.3576 * g + 0.1805 * b) / _D65[0]
+    y = (0.2126 * r + 0.7152 * g + 0.0722 * b) / _D65[1]
+    z = (0.0193 * r + 0.1192 * g + 0.9505 * b) / _D65[2]
+
+    def f(t: float) -> float:
+        return t ** (1.0 / 3.0) if t > 0.008856 else 7.787 * t + 16.0 / 116.0
+
+    fx, fy, fz = f(x), f(y), f(z)
+    return 116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz)
+
+
+def delta_e(lab1, lab2) -> float:
+    """CIE76 Delta-E*ab (Euclidean distance in Lab); ~2.3 is a just-noticeable difference."""
+    return sum((p - q) ** 2 for p, q in zip(lab1, lab2)) ** 0.5
+
+
+def _cell_coords(lab) -> tuple[int, int, int]:
+    L, a, b = lab
+    return (min(_L_CELLS - 1, max(0, int(L // LAB_CELL))),
+            min(_AB_CELLS - 1, max(0, int((a + 128.0) // LAB_CELL))),
+            min(_AB_CELLS - 1, max(0, int((b + 128.0) // LAB_CELL))))
+
+
+def lab_cell(lab) -> int:
+    """Grid cell id for a Lab color (stored alongside the item and indexed)."""
+    li, ai, bi = _cell_coords(lab)
+    return (li * 32 + ai) * 32 + bi
+
+
+def lab_cells_within(lab, radius: float) -> list[int]:
+    """Every grid cell that intersects the sphere of `radius` around `lab`."""
+    L, a, b = lab
+    lo = _cell_coords((L - radius, a - radius, b - radius))
+    hi = _cell_coords((L + radius, a + radius, b + radius))
+    return [(li * 32 + ai) * 32 + bi
+            for li in range(lo[0], hi[0] + 1)
+            for ai in range(lo[1], hi[1] + 1)
+            for bi in range(lo[2], hi[2] + 1)]
+
+
+def rgb_to_hsv_array(rgb: np.ndarray) -> np.ndarray:
+    """Vectorized RGB (0..255, shape [N,3]) -> HSV with h in degrees, s/v in 0..1."""
+    import numpy as np
+    x = np.asarray(rgb, dtype=np.float32) / 255.0
+    mx, mn = x.max(axis=1), x.min(axis=1)
+    delta = mx - mn
+    r, g, b = x[:, 0], x[:, 1], x[:, 2]
+    safe = np.where(delta == 0, 1.0, delta)
+    h = np.select(
+        [delta == 0, mx == r, mx == g],
+        [0.0, ((g - b) / safe) % 6.0, (b - r) / safe + 2.0],
+        (r - g) / safe + 4.0,
+    ) * 60.0
+    s = np.where(mx == 0, 0.0, delta / np.where(mx == 0, 1.0, mx))
+    return np.stack([h, s, mx], axis=1).astype(np.float32)
+
+
+def rgb_to_lab_array(rgb: np.ndarray) -> np.ndarray:
+    """Vectorized rgb_to_lab for an (N, 3) array of 0..255 values."""
+    import numpy as np
+    c = np.asarray(rgb, dtype=np.float32) / 255.0
+    c = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    m = np.array([[0.4124, 0.3576, 0.1805],
+                  [0.2126, 0.7152, 0.0722],
+                  [0.0193, 0.1192, 0.9505]], dtype=np.float32)
+    xyz = (c @ m.T) / np.array(_D65, dtype=np.float32)
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16.0 / 116.0)
+    return np.stack([116.0 * f[:, 1] - 16.0,
+                     500.0 * (f[:, 0] - f[:, 1]),
+                     200.0 * (f[:, 1] - f[:, 2])], axis=1)
+
+
+def background_mask(arr: np.ndarray, opaque: np.ndarray) -> np.ndarray:
+    """
+    Pixels that match the backdrop, estimated from the image border. Product
+    shots sit on a sweep that is rarely pure white (#e9e8e4, beige paper, a
+    wall meeting the floor), so the ring is clustered and every color that
+    covers BG_SHARE of it counts. All False when that would swallow nearly
+    the whole image, i.e. the garment itself runs off every edge.
+    """
+    import numpy as np
+    none = np.zeros(arr.shape[:2], dtype=bool)
+    ring = np.ones(arr.shape[:2], dtype=bool)
+    ring[BORDER_PX:-BORDER_PX, BORDER_PX:-BORDER_PX] = False
+    border = arr[..., :3][ring & opaque].astype(np.float32)
+    if len(border) == 0:
+        return none
+    centers, counts = kmeans(border, k=3)
+    bg = rgb_to_lab_array(centers[counts >= BG_SHARE * len(border)])
+    if len(bg) == 0:
+        return none
+    lab = rgb_to_lab_array(arr[..., :3].reshape(-1, 3))
+    dist = np.linalg.norm(lab[:, None, :] - bg[None, :, :], axis=2).min(axis=1)
+    mask = (dist < BG_DELTA_E).reshape(arr.shape[:2])
+    return none if mask[opaque].mean() > BG_MAX else mask
+
+
+def load_pixels(path: Path, sample_size: int = SAMPLE_SIZE) -> np.ndarray:
+    """
+    Decode + downsample an image to at most sample_size on the long side and
+    return foreground pixels as an (N, 3) float32 array.
+    """
+    import numpy as np
+    from PIL import Image
+    with Image.open(path) as img:
+        # JPEG can decode straight at 1/2..1/8 scale, which is most of the win
+        img.draft("RGB", (sample_size, sample_size))
+        # Downsample before any mode conversion, so a palette/LA PNG is
+        # converted at ~sample_size rather than at full size. Nearest-neighbour
+        # is a strided pixel sample: good enough for clustering, and cheaper
+        # than reduce()'s box filter, which reads every decoded pixel again
+        w, h = img.size
+        scale = min(1.0, sample_size / max(w, h))
+        if scale < 1.0:
+            img = img.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.Resampling.NEAREST)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+        arr = np.asarray(img)
+
+    if arr.shape[-1] == 4:
+        opaque = arr[..., 3] >= MIN_ALPHA
+    else:
+        opaque = np.ones(arr.shape[:2], dtype=bool)
+    rgb = arr[..., :3][opaque]
+    fg = arr[..., :3][opaque & ~background_mask(arr, opaque)]
+    # A garment the same color as its backdrop is still a garment: fall back
+    # to every opaque pixel
+    if len(fg) == 0:
+        fg = rgb if len(rgb) else arr[..., :3].reshape(-1, 3)
+    return fg.astype(np.float32)
+
+
+def kmeans(pixels: np.ndarray, k: int = PALETTE_SIZE, iters: int = KMEANS_ITERS):
+    """
+    Plain Lloyd's k-means, vectorized over all pixels at once.
+    Seeds are spread along the luminance ordering so results are deterministic.
+    Returns (centers[k,3], counts[k]) sorted by cluster size, largest first.
+    """
+    import numpy as np
+    n = len(pixels)
+    k = max(1, min(k, n))
+    lum = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    order = np.argsort(lum, kind="stable")
+    centers = pixels[order[np.linspace(0, n - 1, k).astype(int)]].copy()
+
+    p2 = np.einsum("ij,ij->i", pixels, pixels)[:, None]
+    for _ in range(iters):
+        # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, avoids an (N, k, 3) temporary
+        d = p2 - 2.0 * pixels @ centers.T + np.einsum("ij,ij->i", centers, centers)[None, :]
+        labels = d.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, pixels)
+        nonempty = counts > 0
+        new_centers = centers.copy()
+        new_centers[nonempty] = sums[nonempty] / counts[nonempty, None]
+        if np.allclose(new_centers, centers, atol=0.5):
+            centers = new_centers
+            break
+        centers = new_centers
+
+    counts = np.bincount(labels, minlength=k)
+    rank = np.argsort(-counts, kind="stable")
+    return centers[rank], counts[rank]
+
+
+def analyze_image(path: Path, *, use_cache: bool = True, digest: str | None = None) -> ColorAnalysis:
+    """
+    Dominant color + palette for an image file, cached by content hash.
+    Pass `digest` when the caller already hashed the bytes (uploads do).
+    """
+    if not use_cache:
+        digest = None
+    elif digest is None:
+        digest = sha256_file(path)
+    if digest is not None:
+        with _cache_lock:
+            hit = _cache.get(digest)
+            if hit is not None:
+                _cache.move_to_end(digest)
+                return hit
+
+    pixels = load_pixels(path)
+    centers, counts = kmeans(pixels)
+    keep = counts > 0
+    centers, counts = centers[keep], counts[keep]
+    total = float(counts.sum()) or 1.0
+    palette = [rgb_to_hex(c) for c in centers]
+    result = ColorAnalysis(
+        dominant=palette[0],
+        palette=palette,
+        weights=[round(float(c) / total, 4) for c in counts],
+    )
+
+    if digest is not None:
+        with _cache_lock:
+            _cache[digest] = result
+            while len(_cache) > CACHE_MAX_ENTRIES:
+                _cache.popitem(last=False)
+    return result
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
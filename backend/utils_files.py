@@ -0,0 +1,122 @@
+# utils_files.py
+import hashlib
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024  # 1 MiB reads keep memory flat for large uploads
+
+
+def sha256_file(path: Path, chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    Hex SHA-256 of a file's contents, read in chunks.
+    Used as the cache key for anything derived from image bytes.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def sha256_stream(stream, chunk_size: int = CHUNK_SIZE) -> tuple[str, int]:
+    """(hex SHA-256, byte count) of a binary stream, read from its current position."""
+    h = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        h.update(chunk)
+        size += len(chunk)
+    return h.hexdigest(), size
+
+
+# -----------------------------------------------------------------------------
+# Magic-byte sniffing (replaces imghdr, which is gone in Python 3.13)
+# -----------------------------------------------------------------------------
+SNIFF_BYTES = 16  # enough for every signature below
+# Allowed extensions (basic validation) for both upload endpoints. We also validate the magic bytes.
+ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
+
+
+def allowed_extension(filename: str) -> bool:
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+
+def sniff_image_type(head: bytes) -> str | None:
+    """'png' | 'jpeg' | 'gif' | 'webp' from the first bytes of a file, else None."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+class IngestFile:
+    """
+    Writable temp file that checks, hashes and measures upload bytes as they
+    arrive, so the body is touched exactly once. The type is sniffed from the
+    first bytes and `max_bytes` is enforced per write: a bad upload is rejected
+    (via the exceptions passed in) before the rest of it is written.
+    The temp file is removed on close() unless it was moved away first.
+    """
+
+    def __init__(self, path, max_bytes: int | None = None,
+                 on_bad_type: type[Exception] | None = None,
+                 on_too_large: type[Exception] | None = None):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._on_bad_type = on_bad_type
+        self._on_too_large = on_too_large
+        self._fh = open(self.path, "w+b")
+        self._hash = hashlib.sha256()
+        self._head = b""
+        self.size = 0
+        self.kind: str | None = None
+
+    # ---- writer side (called by the multipart parser) ----
+    def write(self, data: bytes) -> int:
+        if len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+            self.kind = sniff_image_type(self._head)
+            if self.kind is None and len(self._head) >= SNIFF_BYTES and self._on_bad_type:
+                self.close()  # the parser never hands a rejected part back to us
+                raise self._on_bad_type()
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes and self._on_too_large:
+            self.close()
+            raise self._on_too_large()
+        self._hash.update(data)
+        return self._fh.write(data)
+
+    @property
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    # ---- file-like surface the parser / FileStorage expect ----
+    def seek(self, *args):
+        return self._fh.seek(*args)
+
+    def tell(self) -> int:
+        return self._fh.tell()
+
+    def read(self, *args) -> bytes:
+        return self._fh.read(*args)
+
+    def readline(self, *args) -> bytes:
+        return self._fh.readline(*args)
+
+    def flush(self) -> None:
+        self._fh.flush()
+
+    def close(self) -> None:
+        if not self._fh.closed:
+            self._fh.close()
+        self.path.unlink(missing_ok=True)
+
+    def finish(self) -> None:
+        """Flush + close the handle but keep the file (caller moves it into place)."""
+        if not self._fh.closed:
+            self._fh.flush()
+            self._fh.close()
@@ -0,0 +1,233 @@
+# weather.py
+"""
+Current-conditions forecasts for outfit recommendations.
+
+Providers implement ForecastProvider.current(lat, lon). Lookups go through a
+ForecastCache keyed by a coarse location cell (CELL_DEG degrees, ~25 km), so
+every user in one city shares a single upstream call per TTL. Concurrent
+misses for the same cell wait on one in-flight lookup instead of each
+calling the provider.
+
+    WEATHER_PROVIDER=fixture     offline, from fixtures/forecasts.json (default)
+    WEATHER_PROVIDER=open-meteo  api.open-meteo.com (no key needed)
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+WEATHER_PROVIDER = os.getenv("WEATHER_PROVIDER", "fixture")
+FORECAST_TTL_SECONDS = float(os.getenv("FORECAST_TTL_SECONDS", "900"))
+CELL_DEG = 0.25
+FORECAST_CACHE_SIZE = 4096
+FIXTURE_PATH = Path(__file__).resolve().parent / "fixtures" / "forecasts.json"
+
+# Temperature bands (feels-like, deg C) -> the item seasons worn in them.
+# Items tagged "all" or untagged fit every band.
+WARMTH_BANDS = (
+    # (band, lower bound, seasons)
+    ("hot", 25.0, ("summer",)),
+    ("warm", 18.0, ("spring", "summer")),
+    ("mild", 10.0, ("spring", "fall")),
+    ("cool", 3.0, ("fall", "winter")),
+    ("cold", -math.inf, ("winter",)),
+)
+
+
+class ForecastUnavailable(Exception):
+    """The provider could not produce a forecast for this location."""
+
+
+@dataclass(frozen=True)
+class Forecast:
+    temp_c: float
+    feels_like_c: float
+    precip_mm: float
+    wind_kph: float
+    condition: str      # clear|cloudy|rain|snow|storm|fog
+    provider: str
+
+
+def warmth_band(feels_like_c: float) -> tuple[str, tuple[str, ...]]:
+    for band, lower, seasons in WARMTH_BANDS:
+        if feels_like_c >= lower:
+            return band, seasons
+    raise AssertionError("unreachable: the last band has no lower bound")
+
+
+def location_cell(lat: float, lon: float, cell_deg: float = CELL_DEG) -> tuple[int, int]:
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        raise ValueError("lat must be in [-90, 90] and lon in [-180, 180]")
+    return math.floor(lat / cell_deg), math.floor(lon / cell_deg)
+
+
+def cell_center(cell: tuple[int, int], cell_deg: float = CELL_DEG) -> tuple[float, float]:
+    return (cell[0] + 0.5) * cell_deg, (cell[1] + 0.5) * cell_deg
+
+
+# -----------------------------------------------------------------------------
+# Providers
+# -----------------------------------------------------------------------------
+class ForecastProvider:
+    name = "base"
+
+    def current(self, lat: float, lon: float) -> Forecast:
+        raise NotImplementedError
+
+
+class FixtureProvider(ForecastProvider):
+    """
+    Offline forecasts from a JSON file: {"locations": [{"name", "lat", "lon",
+    forecast fields...}], "default": {forecast fields}}. The nearest location
+    within max_km answers; anything farther gets the default.
+    """
+    name = "fixture"
+
+    def __init__(self, path: Path = FIXTURE_PATH, max_km: float = 100.0):
+        data = json.loads(Path(path).read_text())
+        self.locations = data.get("locations", [])
+        self.default = data.get("default")
+        self.max_km = max_km
+
+    def _forecast(self, entry: dict) -> Forecast:
+        return Forecast(
+            temp_c=float(entry["temp_c"]),
+            feels_like_c=float(entry.get("feels_like_c", entry["temp_c"])),
+            precip_mm=float(entry.get("precip_mm", 0.0)),
+            wind_kph=float(entry.get("wind_kph", 0.0)),
+            condition=entry.get("condition", "clear"),
+            provider=self.name,
+        )
+
+    def current(self, lat: float, lon: float) -> Forecast:
+        best, best_km = None, self.max_km
+        for loc in self.locations:
+            km = _haversine_km(lat, lon, loc["lat"], loc["lon"])
+            if km <= best_km:
+                best, best_km = loc, km
+        entry = best or self.default
+        if entry is None:
+            raise ForecastUnavailable(f"No fixture forecast near {lat:.2f},{lon:.2f}")
+        return self._forecast(entry)
+
+
+class OpenMeteoProvider(ForecastProvider):
+    """Current conditions from the Open-Meteo API."""
+    name = "open-meteo"
+    URL = "https://api.open-meteo.com/v1/forecast"
+    # WMO weather codes -> our coarse conditions
+    _CONDITIONS = ((0, "clear"), (3, "cloudy"), (48, "fog"), (67, "rain"), (77, "snow"),
+                   (82, "rain"), (86, "snow"), (99, "storm"))
+
+    def __init__(self, timeout: float = 3.0):
+        self.timeout = timeout
+
+    def current(self, lat: float, lon: float) -> Forecast:
+        query = urllib.parse.urlencode({
+            "latitude": f"{lat:.4f}", "longitude": f"{lon:.4f}",
+            "current": "temperature_2m,apparent_temperature,precipitation,wind_speed_10m,weather_code",
+        })
+        try:
+            with urllib.request.urlopen(f"{self.URL}?{query}", timeout=self.timeout) as resp:
+                cur = json.load(resp)["current"]
+            code = int(cur["weather_code"])
+            return Forecast(
+                temp_c=float(cur["temperature_2m"]),
+                feels_like_c=float(cur["apparent_temperature"]),
+                precip_mm=float(cur["precipitation"]),
+                wind_kph=float(cur["wind_speed_10m"]),
+                condition=next((c for top, c in self._CONDITIONS if code <= top), "storm"),
+                provider=self.name,
+            )
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise ForecastUnavailable(f"open-meteo: {e}") from e
+
+
+PROVIDERS = {"fixture": FixtureProvider, "open-meteo": OpenMeteoProvider}
+
+
+def _haversine_km(lat1, lon1, lat2, lon2) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+# -----------------------------------------------------------------------------
+# Cache
+# -----------------------------------------------------------------------------
+class ForecastCache:
+    """
+    TTL + LRU cache of forecasts per location cell, in front of a provider.
+    The provider is asked for the cell's center, so every point in a cell
+    gets the same answer whether or not it was cached.
+    """
+
+    def __init__(self, provider: ForecastProvider, ttl: float = FORECAST_TTL_SECONDS,
+                 cell_deg: float = CELL_DEG, max_entries: int = FORECAST_CACHE_SIZE):
+        self.provider, self.ttl, self.cell_deg, self.max_entries = provider, ttl, cell_deg, max_entries
+        self._data: "OrderedDict[tuple[int, int], tuple[float, Forecast]]" = OrderedDict()
+        self._inflight: dict[tuple[int, int], Future] = {}
+        self._lock = threading.Lock()
+        self.lookups = 0  # provider calls made
+
+    def get(self, lat: float, lon: float) -> tuple[Forecast, tuple[int, int], bool]:
+        """(forecast, cell, served from cache)"""
+        cell = location_cell(lat, lon, self.cell_deg)
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(cell)
+            if hit is not None and hit[0] > now:
+                self._data.move_to_end(cell)
+                return hit[1], cell, True
+            fut = self._inflight.get(cell)
+            owner = fut is None
+            if owner:
+                fut = self._inflight[cell] = Future()
+                self.lookups += 1
+        if not owner:  # someone else is already asking for this cell
+            return fut.result(), cell, True
+
+        try:
+            forecast = self.provider.current(*cell_center(cell, self.cell_deg))
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[cell]
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            self._data[cell] = (time.monotonic() + self.ttl, forecast)
+            self._data.move_to_end(cell)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            del self._inflight[cell]
+        fut.set_result(forecast)
+        return forecast, cell, False
+
+
+_cache: ForecastCache | None = None
+_cache_lock = threading.Lock()
+
+
+def forecasts() -> ForecastCache:
+    """Process-wide cache in front of WEATHER_PROVIDER, built on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            if WEATHER_PROVIDER not in PROVIDERS:
+                raise ValueError(f"Unknown WEATHER_PROVIDER: {WEATHER_PROVIDER}")
+            _cache = ForecastCache(PROVIDERS[WEATHER_PROVIDER]())
+        return _cache
+
+
+def forecast_payload(forecast: Forecast, cell: tuple[int, int], cached: bool) -> dict:
+    return {**asdict(forecast), "cell": list(cell), "cached": cached}
@@ -0,0 +1,168 @@
+"""
+Load test: Flask item API (app.py, threaded) vs the async FastAPI routes
+(backend/main.py on uvicorn), same endpoints, same data, same concurrency.
+
+    python benchmarks/bench_async.py [--rows 2000] [--concurrency 32] [--seconds 10]
+
+Each server runs in its own subprocess and throwaway working directory with
+an identical seeded SQLite file. Scenarios:
+  read   GET /api/v1/items?page=N and /api/v1/items/<id>, with a unique query
+         arg so Flask's versioned response cache can't answer them
+  mixed  the read scenario with one POST /api/v1/items in every five requests
+Reports requests/sec, p50/p99 latency and the server's CPU time per request
+per server and scenario. The load generator shares the machine: on few CPUs
+req/s partly measures how the scheduler splits time between it and the
+server, while CPU ms/req is the server's own cost.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+import httpx  # noqa: E402
+
+SERVERS = {
+    "flask": [sys.executable, "-c",
+              "import sys; sys.path.insert(0, sys.argv[1]);"
+              "from werkzeug.serving import run_simple; from app import app;"
+              "run_simple('127.0.0.1', int(sys.argv[2]), app, threaded=True)",
+              str(ROOT), "{port}"],
+    "fastapi": [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", str(ROOT / "backend"),
+                "--host", "127.0.0.1", "--port", "{port}", "--log-level", "warning"],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def seed_db(workdir: Path, rows: int) -> None:
+    """Build app.db in workdir through the DAO (db.py opens ./app.db)."""
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import dao
+        rnd = random.Random(7)
+        kinds = ["tops", "bottoms", "shoes", "accessories"]
+        colors = ["navy", "black", "white", "olive", "#c81e28", "beige"]
+        for start in range(0, rows, 5000):
+            dao.create_items([{"name": f"item {i}", "category": rnd.choice(kinds),
+                               "color": rnd.choice(colors)}
+                              for i in range(start, min(rows, start + 5000))])
+        import db
+        db.engine.dispose()  # last connection closing checkpoints the WAL into app.db
+    finally:
+        os.chdir(cwd)
+
+
+def cpu_seconds(pid: int) -> float | None:
+    """utime + stime of a process (Linux /proc); None elsewhere."""
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def start(name: str, workdir: Path) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    cmd = [a.format(port=port) for a in SERVERS[name]]
+    proc = subprocess.Popen(cmd, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base}/api/v1/items/1", timeout=1).status_code == 200:
+                # first list/count query, imports and pool connections aren't under test
+                asyncio.run(load(base, "read", 4, 1.0, 100))
+                return proc, base
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{name} server did not start")
+
+
+async def load(base: str, scenario: str, concurrency: int, seconds: float, rows: int) -> dict:
+    latencies, errors, counter = [], 0, 0
+    stop_at = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30) as client:
+        async def worker(wid: int):
+            nonlocal errors, counter
+            rnd = random.Random(wid)
+            while time.perf_counter() < stop_at:
+                counter += 1
+                n = counter
+                if scenario == "mixed" and n % 5 == 0:
+                    req = client.post("/api/v1/items", json={"name": f"new {n}", "category": "tops"})
+                elif n % 2:
+                    req = client.get("/api/v1/items", params={"page": rnd.randint(1, 50), "_": n})
+                else:
+                    req = client.get(f"/api/v1/items/{rnd.randint(1, rows)}", params={"_": n})
+                t0 = time.perf_counter()
+                resp = await req
+                latencies.append(time.perf_counter() - t0)
+                if resp.status_code >= 400:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000  # noqa: E731
+    return {"rps": len(latencies) / elapsed, "p50": pick(0.50), "p99": pick(0.99),
+            "requests": len(latencies), "errors": errors}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--seconds", type=float, default=10.0)
+    args = ap.parse_args()
+
+    base_dir = Path(tempfile.mkdtemp(prefix="bench_async_"))
+    seed_dir = base_dir / "seed"
+    seed_dir.mkdir()
+    seed_db(seed_dir, args.rows)
+
+    print(f"concurrency={args.concurrency}  rows={args.rows}  {args.seconds:g}s per run")
+    print(f"{'server':>8s} {'scenario':>8s} {'req/s':>9s} {'p50 ms':>8s} {'p99 ms':>8s} "
+          f"{'cpu ms/req':>11s} {'errors':>7s}")
+    try:
+        for scenario in ("read", "mixed"):
+            for name in SERVERS:
+                workdir = base_dir / f"{name}-{scenario}"
+                workdir.mkdir()
+                shutil.copy(seed_dir / "app.db", workdir / "app.db")
+                proc, base = start(name, workdir)
+                try:
+                    cpu0 = cpu_seconds(proc.pid)
+                    r = asyncio.run(load(base, scenario, args.concurrency, args.seconds, args.rows))
+                    cpu1 = cpu_seconds(proc.pid)
+                finally:
+                    proc.terminate()
+                    proc.wait(timeout=10)
+                cpu = "-" if cpu0 is None or cpu1 is None else f"{(cpu1 - cpu0) * 1000 / r['requests']:.2f}"
+                print(f"{name:>8s} {scenario:>8s} {r['rps']:9.1f} {r['p50']:8.1f} "
+                      f"{r['p99']:8.1f} {cpu:>11s} {r['errors']:7d}")
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Perceptual color search: Lab-grid index vs a full scan.
+
+    python benchmarks/bench_color_search.py [--rows 100000] [--tolerance 10]
+
+Seeds a throwaway SQLite file with random colors and times
+SQLItemDAO.near_color (grid cell IN list on the (user_id, lab_cell) index)
+against the same Delta-E predicate without the coarse grid filter.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+from sqlalchemy import create_engine, insert, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from dao import SQLItemDAO, color_columns, color_filter  # noqa: E402
+from models import Base, Item, ItemKind  # noqa: E402
+
+
+def seed(engine, rows: int, user_id: int = 1) -> None:
+    rnd = random.Random(7)
+    kinds = list(ItemKind)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            batch.append(dict(user_id=user_id, kind=rnd.choice(kinds), name=f"item {i}",
+                              **color_columns("#%06x" % rnd.randrange(1 << 24))))
+            if len(batch) == 5000:
+                conn.execute(insert(Item), batch); batch.clear()
+        if batch:
+            conn.execute(insert(Item), batch)
+
+
+def median_ms(fn, repeat: int) -> float:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); out.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(out)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--tolerance", type=float, default=10.0)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    Base.metadata.create_all(engine)
+    seed(engine, args.rows)
+    s = sessionmaker(bind=engine)()
+    dao = SQLItemDAO(s)
+    queries = ["#1b1b1b", "#000080", "#c81e28", "#f5f5dc", "#3cb371"]
+
+    def indexed():
+        for q in queries:
+            dao.near_color(user_id=1, color_hex=q, tolerance=args.tolerance, limit=20)
+
+    def full_scan():
+        for q in queries:
+            where, dist2 = color_filter(q, args.tolerance)
+            s.execute(select(Item).where(Item.user_id == 1, where[1])
+                      .order_by(dist2, Item.id).limit(20)).all()
+
+    hits = [len(dao.near_color(user_id=1, color_hex=q, tolerance=args.tolerance, limit=100)) for q in queries]
+    print(f"{args.rows:,} rows, tolerance {args.tolerance} dE, hits per query {hits}")
+    print(f"  grid index : {median_ms(indexed, args.repeat) / len(queries):8.2f} ms/query")
+    print(f"  full scan  : {median_ms(full_scan, args.repeat) / len(queries):8.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Dominant-color extraction benchmark.
+
+    python benchmarks/bench_colors.py [image_dir] [--repeat N]
+
+Reports cold (decode + k-means) and cached (content-hash hit) latency per
+image. Defaults to the sample garments in uploads/, whose dominant color is
+also checked against a hand-labelled color family (EXPECTED): a fast answer
+that picked the backdrop is a FAIL, and the script exits non-zero.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+from PIL import Image  # noqa: E402
+
+import utils_colors  # noqa: E402
+
+IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".gif", ".webp"}
+
+# What a person sees in the sample images under uploads/
+EXPECTED = {
+    "Tshirt.png": "blue", "Polo_Shirt.png": "blue", "blue_jeans.jpg": "blue",
+    "rainBoots.jpg": "blue", "sunglasses.jpg": "blue", "GreyShorts.webp": "grey",
+    "beanie.jpg": "dark", "black_shorts.jpg": "dark", "long_sleeve_shirt.jpg": "dark",
+    "rainjacket.png": "dark", "running_shoes.jpg": "light",
+}
+
+
+def family(hex_color: str) -> str:
+    """Coarse color family of "#rrggbb", enough to tell a garment from its backdrop."""
+    h, s, v = utils_colors.rgb_to_hsv_array([utils_colors.hex_to_rgb(hex_color)])[0]
+    if s >= 0.3 and v >= 0.15:   # dark denim is still denim
+        return "blue" if 170 <= h <= 260 else "other"
+    if v < 0.25:
+        return "dark"
+    return "light" if v > 0.75 else "grey"
+
+
+def time_ms(fn, repeat: int) -> list[float]:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("image_dir", nargs="?", default=str(ROOT / "uploads"))
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    files = sorted(p for p in Path(args.image_dir).iterdir() if p.suffix.lower() in IMAGE_EXTS)
+    print(f"{'file':40s} {'pixels':>10s} {'cold ms':>9s} {'cached ms':>10s}  dominant  check")
+    colds, failed = [], 0
+    for path in files:
+        cold = time_ms(lambda: utils_colors.analyze_image(path, use_cache=False), args.repeat)
+        utils_colors.analyze_image(path)  # prime the cache
+        warm = time_ms(lambda: utils_colors.analyze_image(path), args.repeat)
+        with Image.open(path) as img:
+            px = img.width * img.height
+        result = utils_colors.analyze_image(path)
+        colds.append(statistics.median(cold))
+        check = ""
+        if path.name in EXPECTED:
+            got = family(result.dominant)
+            check = "ok" if got == EXPECTED[path.name] else f"FAIL ({got}, expected {EXPECTED[path.name]})"
+            failed += not check == "ok"
+        print(f"{path.name[:40]:40s} {px:>10,d} {statistics.median(cold):9.1f} "
+              f"{statistics.median(warm):10.2f}  {result.dominant}   {check}")
+    if colds:
+        print(f"\nmedian cold: {statistics.median(colds):.1f} ms   max cold: {max(colds):.1f} ms   "
+              f"wrong colors: {failed}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
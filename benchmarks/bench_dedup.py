@@ -0,0 +1,129 @@
+"""
+Near-duplicate lookups over perceptual hashes: multi-index hashing vs
+comparing every pair.
+
+    python benchmarks/bench_dedup.py [--sizes 1000,10000,100000] [--radius 10]
+
+Hashes are synthetic: random 64-bit "garments", each uploaded 1-4 times with
+a few bits flipped (re-crops/re-encodes). Reported per wardrobe size:
+median ms for one "duplicates of this item" query (MultiIndex.search vs a
+linear scan), how many candidates the index had to check, and the full dedup
+report (one index query per item + union-find vs all n^2/2 pairs; the
+pairwise side is skipped above 20k items). Both sides must agree.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import phash  # noqa: E402
+from phash import DuplicateIndex, MultiIndex, hamming  # noqa: E402
+
+PAIRWISE_MAX = 20_000
+
+
+def synth_hashes(n: int, seed: int) -> list[tuple[int, int]]:
+    rng = random.Random(seed)
+    out = []
+    while len(out) < n:
+        base = rng.getrandbits(64)
+        for _ in range(rng.choice((1, 1, 1, 2, 2, 3, 4))):
+            h = base
+            for bit in rng.sample(range(64), rng.randint(0, 6)):
+                h ^= 1 << bit
+            out.append((len(out), h))
+    return out[:n]
+
+
+def linear(entries, h, radius):
+    return sorted(((k, d) for k, x in entries if (d := hamming(h, x)) <= radius),
+                  key=lambda kd: kd[1])
+
+
+def pairwise_clusters(entries, radius) -> list[list[int]]:
+    parent = {k: k for k, _ in entries}
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    for i, (a, ha) in enumerate(entries):
+        for b, hb in entries[i + 1:]:
+            if hamming(ha, hb) <= radius:
+                parent[find(b)] = find(a)
+    groups = {}
+    for k, _ in entries:
+        groups.setdefault(find(k), []).append(k)
+    return sorted(sorted(g) for g in groups.values() if len(g) > 1)
+
+
+def candidates(index: MultiIndex, h: int, radius: int) -> int:
+    """Entries sharing a bucket with h, i.e. full distances the search computes."""
+    found, real = [0], phash.hamming
+
+    def counted(a, b):
+        found[0] += 1
+        return real(a, b)
+    phash.hamming = counted
+    try:
+        index.search(h, radius)
+    finally:
+        phash.hamming = real
+    return found[0]
+
+
+def median_ms(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--radius", type=int, default=phash.DEFAULT_MAX_DISTANCE)
+    ap.add_argument("--queries", type=int, default=50)
+    args = ap.parse_args()
+
+    print(f"radius={args.radius}  (median ms)")
+    print(f"{'items':>8s} {'index q':>8s} {'scan q':>8s} {'checked':>8s} "
+          f"{'index rpt':>10s} {'pairs rpt':>10s}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        entries = synth_hashes(n, seed=n)
+        rng = random.Random(1)
+        probes = [rng.choice(entries)[1] for _ in range(args.queries)]
+        index = MultiIndex(entries)
+
+        for h in probes:  # same answers, same order of distances
+            assert [d for _, d in index.search(h, args.radius)] == \
+                   [d for _, d in linear(entries, h, args.radius)]
+        index_q = statistics.median(
+            median_ms(lambda h=h: index.search(h, args.radius), 3) for h in probes)
+        scan_q = statistics.median(
+            median_ms(lambda h=h: linear(entries, h, args.radius), 3) for h in probes[:10])
+        checked = statistics.mean(candidates(index, h, args.radius) for h in probes)
+
+        t0 = time.perf_counter()
+        clusters = DuplicateIndex(entries).clusters(args.radius)
+        index_rpt = (time.perf_counter() - t0) * 1000
+        if n <= PAIRWISE_MAX:
+            t0 = time.perf_counter()
+            expected = pairwise_clusters(entries, args.radius)
+            pairs_rpt = f"{(time.perf_counter() - t0) * 1000:10.1f}"
+            assert sorted(c["items"] for c in clusters) == expected
+        else:
+            pairs_rpt = f"{'skipped':>10s}"
+        print(f"{n:8d} {index_q:8.3f} {scan_q:8.3f} {checked:8.0f} {index_rpt:10.1f} {pairs_rpt}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+OFFSET vs keyset (cursor) paging in SQLItemDAO.list.
+
+    python benchmarks/bench_pagination.py [--rows 100000] [--page-size 20]
+
+Seeds a throwaway SQLite file and times page 1, a deep OFFSET page and the
+same depth reached through a cursor, with and without the COUNT query.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from dao import SQLItemDAO, encode_cursor  # noqa: E402
+from models import Base, Item, ItemKind  # noqa: E402
+
+
+def seed(engine, rows: int, user_id: int = 1) -> None:
+    rnd = random.Random(42)
+    kinds = list(ItemKind)
+    start = datetime(2024, 1, 1)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            ts = start + timedelta(seconds=i * 7)
+            batch.append(dict(user_id=user_id, kind=rnd.choice(kinds), name=f"item {i:07d}",
+                              brand=rnd.choice(["acme", "zara", "uniqlo", None]),
+                              main_color_hex="#%06x" % rnd.randrange(1 << 24),
+                              is_neutral=rnd.random() < 0.3, created_at=ts, updated_at=ts))
+            if len(batch) == 5000:
+                conn.execute(insert(Item), batch); batch.clear()
+        if batch:
+            conn.execute(insert(Item), batch)
+
+
+def time_ms(fn, repeat: int) -> float:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); out.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(out)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--page-size", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+    Base.metadata.create_all(engine)
+    seed(engine, args.rows)
+    s = sessionmaker(bind=engine)()
+    dao = SQLItemDAO(s)
+    ps = args.page_size
+    deep = max(1, (args.rows // ps) * 9 // 10)  # 90% of the way through
+
+    # walk to the deep page once to get a real cursor for it
+    offset_rows = dao.list(user_id=1, page=deep - 1, page_size=ps, count="none")["items"]
+    last = offset_rows[-1]
+    cursor = encode_cursor("created_at", "desc", datetime.fromisoformat(last["created_at"]), last["id"])
+
+    cases = {
+        "page 1 (offset, count)": lambda: dao.list(user_id=1, page=1, page_size=ps),
+        "page 1 (offset, no count)": lambda: dao.list(user_id=1, page=1, page_size=ps, count="none"),
+        f"page {deep} (offset, count)": lambda: dao.list(user_id=1, page=deep, page_size=ps),
+        f"page {deep} (offset, no count)": lambda: dao.list(user_id=1, page=deep, page_size=ps, count="none"),
+        f"page {deep} (cursor, no count)": lambda: dao.list(user_id=1, cursor=cursor, page_size=ps, count="none"),
+        f"page {deep} (cursor, cached count)": lambda: dao.list(user_id=1, cursor=cursor, page_size=ps, count="cached"),
+    }
+    a = dao.list(user_id=1, page=deep, page_size=ps, count="none")["items"]
+    b = dao.list(user_id=1, cursor=cursor, page_size=ps, count="none")["items"]
+    assert [r["id"] for r in a] == [r["id"] for r in b], "cursor page differs from offset page"
+
+    print(f"{args.rows:,} rows, page_size={ps}")
+    for name, fn in cases.items():
+        print(f"  {name:34s} {time_ms(fn, args.repeat):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
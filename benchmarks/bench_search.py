@@ -0,0 +1,91 @@
+"""
+Name/brand search: ILIKE '%term%' scan vs the FTS5 index.
+
+    python benchmarks/bench_search.py [--rows 100000] [--count exact|none]
+
+Seeds a throwaway SQLite file, runs the migrations (which build and backfill
+items_fts) and times SQLItemDAO.list(search=...) for a set of terms typed
+the way the browse page's search box sends them: newest first (the browse
+default) with ILIKE and with FTS, and FTS ordered by relevance. --count
+exact (the API default) includes the COUNT query for the total.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import dao as dao_mod  # noqa: E402
+from migrations import migrate  # noqa: E402
+from models import Base, Item, ItemKind  # noqa: E402
+
+WORDS = ["blue", "black", "white", "slim", "denim", "linen", "wool", "cotton", "oversized",
+         "cropped", "jeans", "shirt", "tee", "hoodie", "jacket", "sneakers", "boots",
+         "loafers", "scarf", "beanie", "watch", "shorts", "chinos", "blazer", "parka"]
+BRANDS = ["Levis", "Zara", "Uniqlo", "Nike", "Adidas", "H&M", "Patagonia", "Carhartt", None]
+TERMS = ["j", "je", "jea", "jeans", "blue jea", "levis", "parka", "nomatch"]
+
+
+def seed(engine, rows: int) -> None:
+    rnd = random.Random(3)
+    kinds = list(ItemKind)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            name = " ".join(rnd.sample(WORDS, 3)) + f" {i}"
+            batch.append(dict(user_id=1, kind=rnd.choice(kinds), name=name, brand=rnd.choice(BRANDS)))
+            if len(batch) == 5000:
+                conn.execute(insert(Item), batch); batch.clear()
+        if batch:
+            conn.execute(insert(Item), batch)
+
+
+def median_ms(fn, repeat: int) -> float:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); out.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(out)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--count", choices=("exact", "none"), default="exact")
+    args = ap.parse_args()
+
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    Base.metadata.create_all(engine)
+    seed(engine, args.rows)
+    t0 = time.perf_counter()
+    migrate(engine)  # creates items_fts and backfills every row
+    print(f"{args.rows:,} rows; FTS backfill took {(time.perf_counter() - t0):.2f} s")
+
+    s = sessionmaker(bind=engine)()
+    dao = dao_mod.SQLItemDAO(s)
+
+    def run(term, sort_by="created_at"):
+        return dao.list(user_id=1, search=term, page_size=20, count=args.count, sort_by=sort_by)
+
+    print(f"count={args.count}")
+    print(f"  {'term':10s} {'ILIKE ms':>9s} {'FTS ms':>8s} {'FTS relevance ms':>17s}")
+    for term in TERMS:
+        dao_mod._fts_ready[id(engine)] = False
+        ilike = median_ms(lambda: run(term), args.repeat)
+        dao_mod._fts_ready[id(engine)] = True
+        fts = median_ms(lambda: run(term), args.repeat)
+        rel = median_ms(lambda: run(term, "relevance"), args.repeat)
+        print(f"  {term!r:10s} {ilike:9.2f} {fts:8.2f} {rel:17.2f}")
+
+
+if __name__ == "__main__":
+    main()
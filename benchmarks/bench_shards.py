@@ -0,0 +1,119 @@
+"""
+Write throughput vs shard count: concurrent writer processes creating items
+for many users, with DB_SHARDS=1, 2, 4 (see backend/shards.py).
+
+    python benchmarks/bench_shards.py [--shards 1,2,4] [--writers 8] [--users 64] [--seconds 5] [--batch 1]
+
+Each shard count runs in its own throwaway working directory: one process
+creates the schema and pins every user (so routing is warm), then `writers`
+processes start together and, for `seconds`, each commits create_item()
+(or create_items() of --batch rows) for a random user. Every write is one
+transaction on that user's shard, so with one shard they all queue for the
+same write lock; spread over N files they mostly don't.
+
+Reports committed items/sec, transactions/sec, p50/p99 transaction latency
+and how many writes failed (e.g. "database is locked" past busy_timeout).
+Shards only add throughput when writers can actually run at once: on a
+single CPU every writer is CPU-bound and the routing/fencing cost (one
+extra indexed lookup per commit) shows instead.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+BACKEND = ROOT / "backend"
+
+
+def setup(users: int) -> None:
+    sys.path.insert(0, str(BACKEND))
+    import shards
+    from db import ensure_db
+    ensure_db()
+    for u in range(1, users + 1):
+        shards.shard_for(u)
+
+
+def writer(users: int, start_at: float, seconds: float, batch: int) -> None:
+    sys.path.insert(0, str(BACKEND))
+    import dao
+    from db import ensure_db
+    ensure_db()
+    dao.wardrobe_version(user_id=1)  # connect before the clock starts
+    rnd = random.Random(os.getpid())
+    latencies, failed = [], 0
+    time.sleep(max(0.0, start_at - time.time()))
+    end = time.time() + seconds
+    while time.time() < end:
+        user = rnd.randint(1, users)
+        t0 = time.perf_counter()
+        try:
+            if batch == 1:
+                dao.create_item(f"item {rnd.random():.6f}", "tops", color="navy", user_id=user)
+            else:
+                dao.create_items([{"name": f"item {i}", "category": "tops", "color": "navy"}
+                                  for i in range(batch)], user_id=user)
+        except Exception:
+            failed += 1
+            continue
+        latencies.append(time.perf_counter() - t0)
+    print(json.dumps({"latencies": latencies, "failed": failed}))
+
+
+def run(shards: int, writers: int, users: int, seconds: float, batch: int) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="bench_shards_"))
+    env = {**os.environ, "DB_SHARDS": str(shards), "ASSET_DIR": str(workdir / "images")}
+    me = [sys.executable, str(Path(__file__).resolve())]
+    try:
+        subprocess.run(me + ["--setup", "--users", str(users)], cwd=workdir, env=env, check=True)
+        start_at = time.time() + 2.0  # every writer has imported and connected by then
+        procs = [subprocess.Popen(me + ["--writer", "--users", str(users), "--seconds", str(seconds),
+                                        "--batch", str(batch), "--start-at", str(start_at)],
+                                  cwd=workdir, env=env, stdout=subprocess.PIPE, text=True)
+                 for _ in range(writers)]
+        results = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    latencies = sorted(x for r in results for x in r["latencies"])
+    q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    return {"tx_per_s": len(latencies) / seconds, "items_per_s": len(latencies) * batch / seconds,
+            "p50_ms": q[49] * 1000, "p99_ms": q[98] * 1000, "failed": sum(r["failed"] for r in results)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shards", default="1,2,4")
+    ap.add_argument("--writers", type=int, default=8)
+    ap.add_argument("--users", type=int, default=64)
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--batch", type=int, default=1, help="items per transaction")
+    ap.add_argument("--setup", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--writer", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--start-at", type=float, default=0.0, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.setup:
+        return setup(args.users)
+    if args.writer:
+        return writer(args.users, args.start_at, args.seconds, args.batch)
+
+    print(f"{args.writers} writer processes, {args.users} users, {args.seconds:g}s, "
+          f"{args.batch} item(s) per transaction, {os.cpu_count()} CPU(s)")
+    print(f"{'shards':>6s} {'items/s':>9s} {'tx/s':>8s} {'p50 ms':>8s} {'p99 ms':>8s} {'failed':>7s} {'speedup':>8s}")
+    base = None
+    for n in (int(x) for x in args.shards.split(",")):
+        r = run(n, args.writers, args.users, args.seconds, args.batch)
+        base = base or r["items_per_s"]
+        print(f"{n:6d} {r['items_per_s']:9.0f} {r['tx_per_s']:8.0f} {r['p50_ms']:8.2f} {r['p99_ms']:8.2f} "
+              f"{r['failed']:7d} {r['items_per_s'] / base:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+"Find similar items" over the memory-mapped feature matrix.
+
+    python benchmarks/bench_similar.py [--sizes 10000,100000] [--batch 64] [--k 12]
+
+Vectors are synthetic: FEATURE_DIM-wide unit vectors scattered around a few
+hundred "looks" (the way photos of similar garments cluster), written
+through FeatureMatrix into a throwaway file. Reported per library size:
+
+  open      ms for a worker to get at the matrix: np.fromfile (every
+            process loading its own copy) vs np.memmap (shared page cache)
+  single    median ms for one query, exact scan
+  batched   ms per query when --batch queries share each matrix product
+  ivf       ms per query through the coarse quantizer, and its recall@k
+            against the exact answer (only built from IVF_MIN_ITEMS items)
+"""
+import argparse
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+
+import numpy as np  # noqa: E402
+
+import features  # noqa: E402
+from features import FEATURE_DIM, FeatureMatrix, SimilarityIndex  # noqa: E402
+
+
+def synth_vectors(n: int, seed: int, looks: int = 300) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(looks, FEATURE_DIM)).astype(np.float32)
+    x = centers[rng.integers(0, looks, n)] + 0.35 * rng.normal(size=(n, FEATURE_DIM)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def median_ms(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10000,100000")
+    ap.add_argument("--batch", type=int, default=64)
+    ap.add_argument("--k", type=int, default=features.DEFAULT_SIMILAR)
+    args = ap.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_similar_"))
+    try:
+        print(f"dim={FEATURE_DIM}  k={args.k}  batch={args.batch}  (ms)")
+        print(f"{'items':>8s} {'fromfile':>9s} {'memmap':>8s} {'single':>8s} {'batched':>8s} "
+              f"{'ivf':>8s} {'recall':>7s}")
+        for n in (int(s) for s in args.sizes.split(",")):
+            matrix = FeatureMatrix(workdir / f"features_{n}.f32")
+            for v in synth_vectors(n, seed=n):
+                matrix.put(v)
+            load = median_ms(lambda: np.fromfile(matrix.path, dtype=np.float32,
+                                                 offset=features.HEADER_BYTES), 5)
+            mapped = median_ms(lambda: np.memmap(matrix.path, dtype=np.float32, mode="r",
+                                                 offset=features.HEADER_BYTES), 5)
+
+            keys = list(range(n))
+            exact = SimilarityIndex(matrix, ((i, i) for i in keys), ivf_min_items=n + 1)
+            rng = np.random.default_rng(1)
+            probe = [int(i) for i in rng.choice(n, args.batch, replace=False)]
+            single = statistics.median(median_ms(lambda q=q: exact.similar_to([q], args.k), 3)
+                                       for q in probe[:16])
+            batched = median_ms(lambda: exact.similar_to(probe, args.k), 3) / len(probe)
+            truth = exact.similar_to(probe, args.k)
+
+            ivf_ms, recall = float("nan"), float("nan")
+            if n >= features.IVF_MIN_ITEMS:
+                ivf = SimilarityIndex(matrix, ((i, i) for i in keys))
+                ivf_ms = median_ms(lambda: ivf.similar_to(probe, args.k), 3) / len(probe)
+                got = ivf.similar_to(probe, args.k)
+                recall = statistics.mean(len({k for k, _ in truth[q]} & {k for k, _ in got[q]})
+                                         / max(1, len(truth[q])) for q in probe)
+            print(f"{n:8d} {load:9.2f} {mapped:8.3f} {single:8.3f} {batched:8.3f} "
+                  f"{ivf_ms:8.3f} {recall:7.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
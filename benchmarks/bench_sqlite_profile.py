@@ -0,0 +1,149 @@
+"""
+Read-under-write: SQLite's default profile vs the production profile in db.py
+(WAL, synchronous=NORMAL, mmap, bigger cache, list indexes, pooled connections).
+
+    python benchmarks/bench_sqlite_profile.py [--rows 50000] [--readers 8] [--seconds 10]
+
+For each profile a fresh database is seeded, then one writer thread commits
+single-item creates as fast as it can while reader threads page through the
+wardrobe with SQLItemDAO.list (mixed sorts, OFFSET and cursor pages). Reports
+reader throughput and latency, writer commits/sec and lock errors, for:
+  default            SQLite defaults, no list indexes (migration 3 skipped)
+  default+indexes    SQLite defaults with the list indexes
+  production         the full profile
+"""
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import migrations  # noqa: E402
+from dao import SQLItemDAO  # noqa: E402
+from db import make_engine  # noqa: E402
+from models import Base, Item, ItemKind  # noqa: E402
+
+SORTS = ["created_at", "updated_at", "name", "brand"]
+
+
+class NoBlobs:
+    """The benchmark never touches images."""
+    def acquire(self, *a, **k): return False
+    def release(self, *a, **k): return None
+    def discard(self, *a, **k): pass
+
+
+def build(profile: str, indexes: bool, rows: int, workdir: Path):
+    engine = make_engine(f"sqlite:///{workdir / f'{profile}-{indexes}.db'}", profile=profile,
+                         **({} if profile == "production" else {"pool_size": 5, "max_overflow": 10}))
+    Base.metadata.create_all(engine)
+    steps = migrations.MIGRATIONS if indexes else [m for m in migrations.MIGRATIONS if m[1] != "list_indexes"]
+    saved, migrations.MIGRATIONS = migrations.MIGRATIONS, steps
+    try:
+        migrations.migrate(engine)
+    finally:
+        migrations.MIGRATIONS = saved
+    rnd = random.Random(1)
+    kinds = list(ItemKind)
+    with engine.begin() as conn:
+        batch = []
+        for i in range(rows):
+            batch.append(dict(user_id=1, kind=rnd.choice(kinds), name=f"item {rnd.random():.6f}",
+                              brand=rnd.choice(["Levis", "Zara", "Nike", None])))
+            if len(batch) == 5000:
+                conn.execute(insert(Item), batch); batch.clear()
+        if batch:
+            conn.execute(insert(Item), batch)
+    return engine
+
+
+def run(engine, readers: int, seconds: float) -> dict:
+    Session = sessionmaker(bind=engine, autoflush=False)
+    stop = threading.Event()
+    lat, reads, read_errors = [], [0], [0]
+    writes, write_errors = [0], [0]
+    lock = threading.Lock()
+
+    def reader(seed: int):
+        rnd = random.Random(seed)
+        while not stop.is_set():
+            s = Session()
+            try:
+                t0 = time.perf_counter()
+                dao = SQLItemDAO(s, blobs=NoBlobs())
+                sort = rnd.choice(SORTS)
+                res = dao.list(user_id=1, sort_by=sort, page=rnd.randint(1, 20), count="none")
+                if res["meta"]["next_cursor"]:  # the following page, by cursor
+                    dao.list(user_id=1, sort_by=sort, cursor=res["meta"]["next_cursor"], count="none")
+                dt = time.perf_counter() - t0
+                with lock:
+                    lat.append(dt); reads[0] += 1
+            except OperationalError:
+                with lock:
+                    read_errors[0] += 1
+            finally:
+                s.close()
+
+    def writer():
+        n = 0
+        while not stop.is_set():
+            s = Session()
+            try:
+                SQLItemDAO(s, blobs=NoBlobs()).create(user_id=1, kind="tops", name=f"new {n}")
+                writes[0] += 1
+            except OperationalError:
+                s.rollback(); write_errors[0] += 1
+            finally:
+                s.close()
+            n += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for t in threads: t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads: t.join()
+
+    lat.sort()
+    p = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] * 1000 if lat else float("nan")  # noqa: E731
+    return {"reads/s": reads[0] / seconds, "p50": p(0.5), "p99": p(0.99),
+            "read_errors": read_errors[0], "writes/s": writes[0] / seconds,
+            "write_errors": write_errors[0]}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=50_000)
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--seconds", type=float, default=10.0)
+    args = ap.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_sqlite_"))
+    print(f"rows={args.rows}  readers={args.readers}  writer=1  {args.seconds:g}s")
+    print(f"{'profile':>16s} {'reads/s':>9s} {'p50 ms':>8s} {'p99 ms':>8s} "
+          f"{'rd err':>7s} {'writes/s':>9s} {'wr err':>7s}")
+    try:
+        for label, profile, indexes in (("default", "default", False),
+                                        ("default+indexes", "default", True),
+                                        ("production", "production", True)):
+            engine = build(profile, indexes, args.rows, workdir)
+            r = run(engine, args.readers, args.seconds)
+            engine.dispose()
+            print(f"{label:>16s} {r['reads/s']:9.1f} {r['p50']:8.1f} {r['p99']:8.1f} "
+                  f"{r['read_errors']:7d} {r['writes/s']:9.1f} {r['write_errors']:7d}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
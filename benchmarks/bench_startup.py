@@ -0,0 +1,63 @@
+"""
+Cold start: how long a fresh worker takes to import, build and serve its
+first request, with the app factories in lazy (default) and eager mode.
+
+    python benchmarks/bench_startup.py [--runs 7] [--targets web,images,fastapi]
+
+Each boot is a new interpreter (backend/startup.py's boot script) in a
+throwaway working directory, so the first boot also creates app.db; that
+run is discarded and the medians are over the rest. Per target and mode:
+
+  import   ms to import the app module
+  factory  ms for create_app()
+  first    ms for the first request (what startup.DEFAULT_REQUESTS hits);
+           in lazy mode this includes whatever that request loads
+  ready    import + factory, the time before a worker can accept
+  total    ready + first
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from backend import startup  # noqa: E402
+
+
+def boots(target: str, eager: bool, runs: int) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="bench_startup_"))
+    os.environ["ASSET_DIR"] = str(workdir / "images")  # inherited by the boot
+    try:
+        samples = [startup.run_boot(target, startup.DEFAULT_REQUESTS[target], eager, cwd=workdir)[0]
+                   for _ in range(runs + 1)][1:]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    med = lambda key: statistics.median(s[key] for s in samples) * 1000  # noqa: E731
+    out = {"import": med("import"), "factory": med("create_app"), "first": med("first_request")}
+    out["ready"] = out["import"] + out["factory"]
+    out["total"] = out["ready"] + out["first"]
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=7)
+    ap.add_argument("--targets", default="web,images,fastapi")
+    args = ap.parse_args()
+    print(f"median of {args.runs} cold boots (ms)")
+    print(f"{'target':>8s} {'mode':>6s} {'import':>8s} {'factory':>8s} {'first':>8s} "
+          f"{'ready':>8s} {'total':>8s}")
+    for target in args.targets.split(","):
+        for eager in (False, True):
+            r = boots(target, eager, args.runs)
+            print(f"{target:>8s} {'eager' if eager else 'lazy':>6s} {r['import']:8.1f} "
+                  f"{r['factory']:8.1f} {r['first']:8.1f} {r['ready']:8.1f} {r['total']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Image upload ingest: single streaming pass vs save-then-rehash.
+
+    python benchmarks/bench_upload.py [--sizes 1,8,32] [--repeat 3]
+
+Builds multipart bodies on disk (a PNG signature followed by filler bytes)
+and feeds them to the Flask app through its WSGI entry point, so the body is
+streamed exactly as a server would. For each size it reports throughput and
+the peak Python heap seen by tracemalloc, next to the old path: default
+form parsing, file.save(), then a second read for the hash and the type.
+Runs against a throwaway ASSET_DIR and database.
+"""
+import argparse
+import hashlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+WORKDIR = Path(tempfile.mkdtemp(prefix="bench_upload_"))
+os.environ["ASSET_DIR"] = str(WORKDIR / "images")
+os.environ.setdefault("ASSET_MAX_MB", "1024")
+os.chdir(WORKDIR)  # db.py keeps app.db in the working directory
+
+from werkzeug.formparser import parse_form_data  # noqa: E402
+from werkzeug.test import EnvironBuilder  # noqa: E402
+
+import app_images  # noqa: E402
+from utils_files import sha256_file, sniff_image_type, SNIFF_BYTES  # noqa: E402
+
+# the filler bytes are not a decodable PNG: their analysis jobs fail in the
+# background pool (untimed); keep any logging about them quiet
+app_images.app.logger.disabled = True
+
+BOUNDARY = "benchboundary7MA4YWxkTrZu0gW"
+PNG_SIG = b"\x89PNG\r\n\x1a\n"
+
+
+def write_body(path: Path, size: int, salt: int) -> int:
+    """multipart/form-data body with one 'image' part of `size` bytes."""
+    with open(path, "wb") as fh:
+        fh.write((f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"image\"; "
+                  f"filename=\"bench.png\"\r\nContent-Type: image/png\r\n\r\n").encode())
+        fh.write(PNG_SIG + salt.to_bytes(8, "big"))
+        chunk = hashlib.sha256(str(salt).encode()).digest() * 32768  # 1 MiB
+        left = size - len(PNG_SIG) - 8
+        while left > 0:
+            fh.write(chunk[:left])
+            left -= len(chunk)
+        fh.write(f"\r\n--{BOUNDARY}--\r\n".encode())
+    return path.stat().st_size
+
+
+def environ_for(body: Path, length: int, fh) -> dict:
+    return EnvironBuilder(
+        path="/api/images", method="POST", input_stream=fh,
+        content_type=f"multipart/form-data; boundary={BOUNDARY}",
+        content_length=length,
+    ).get_environ()
+
+
+def streaming(body: Path, length: int) -> None:
+    with open(body, "rb") as fh:
+        status = []
+        out = app_images.app.wsgi_app(environ_for(body, length, fh),
+                                      lambda s, h, *a: status.append(s))
+        b"".join(out)
+        if hasattr(out, "close"):
+            out.close()
+    if not status[0].startswith(("200", "201")):
+        raise RuntimeError(status[0])
+
+
+def save_then_rehash(body: Path, length: int) -> None:
+    with open(body, "rb") as fh:
+        _, _, files = parse_form_data(environ_for(body, length, fh))
+        dest = WORKDIR / "legacy.bin"
+        files["image"].save(dest)
+        files["image"].close()
+    sha256_file(dest)
+    with open(dest, "rb") as fh:
+        sniff_image_type(fh.read(SNIFF_BYTES))
+    dest.stat()
+    dest.unlink()
+
+
+def measure(fn, body: Path, length: int) -> tuple[float, float]:
+    """(seconds, peak traced MiB) for one call."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn(body, length)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1,8,32", help="upload sizes in MiB")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"{'size':>7s} {'path':>18s} {'MiB/s':>9s} {'peak heap MiB':>14s}")
+    salt = 0
+    for mib in (float(s) for s in args.sizes.split(",")):
+        size = int(mib * 1024 * 1024)
+        for name, fn in (("streaming", streaming), ("save+rehash", save_then_rehash)):
+            times, peaks = [], []
+            for _ in range(args.repeat):
+                salt += 1  # fresh content each time, so nothing is deduplicated
+                body = WORKDIR / "body.bin"
+                length = write_body(body, size, salt)
+                t, p = measure(fn, body, length)
+                times.append(t)
+                peaks.append(p)
+            print(f"{mib:6.0f}M {name:>18s} {mib / statistics.median(times):9.1f} {max(peaks):14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Reproducible benchmark suite with baseline comparison.
+
+    python benchmarks/suite.py [--sizes 1k,10k,100k] [--only dao,colors,upload,load]
+                               [--out PATH] [--baseline benchmarks/baseline.json]
+                               [--threshold 0.25] [--save-baseline]
+
+Everything runs in-process against throwaway files generated by synth.py:
+  dao     SQLItemDAO.list (first page, deep OFFSET, cursor, kind filter,
+          name sort, FTS search, color filter) and near_color, per wardrobe size
+  colors  dominant-color extraction on synthetic JPEG/PNG garments (cold)
+  upload  POST /api/images through the Flask image service (new + duplicate)
+  load    concurrent requests against the Flask app (items API + browse page)
+          and the FastAPI app, via httpx's WSGI/ASGI transports
+
+Results are written as JSON to --out (by default a file in the system temp
+directory, so a run leaves the tree clean). Given a baseline (the default one is checked in),
+each metric is compared and anything worse than --threshold is reported as a
+regression; the exit status is 1 when there is one. Timings are machine
+specific: regenerate the baseline with --save-baseline on the machine that
+runs the comparison.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+sys.path.insert(0, str(ROOT))  # app.py (Flask) imports the backend package
+
+CALLER_CWD = Path.cwd()  # relative --out/--baseline paths are the caller's
+WORKDIR = Path(tempfile.mkdtemp(prefix="bench_suite_"))
+os.environ["ASSET_DIR"] = str(WORKDIR / "images")  # read by app_images / blob_store at import
+# db.py resolves ./app.db when it is imported, and main.py mounts relative paths,
+# so everything below runs from the throwaway directory
+os.chdir(WORKDIR)
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import synth  # noqa: E402
+import utils_colors  # noqa: E402
+from dao import SQLItemDAO  # noqa: E402
+from db import make_engine  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+# metrics where bigger is better; everything else is a latency
+HIGHER_IS_BETTER = {"rps"}
+
+
+def parse_size(s: str) -> int:
+    s = s.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1], 1)
+    return int(float(s.rstrip("km")) * mult)
+
+
+def label(n: int) -> str:
+    return f"{n // 1_000_000}m" if n >= 1_000_000 else f"{n // 1000}k" if n >= 1000 else str(n)
+
+
+def timed(fn, repeat: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {"median_ms": round(statistics.median(samples), 3),
+            "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3)}
+
+
+class NoBlobs:
+    def acquire(self, *a, **k): return False
+    def release(self, *a, **k): return None
+    def discard(self, *a, **k): pass
+
+
+# ---------------------------------------------------------------------------
+# groups
+# ---------------------------------------------------------------------------
+def bench_dao(results: dict, sizes: list[int], repeat: int) -> None:
+    for rows in sizes:
+        path = WORKDIR / f"dao-{rows}.db"
+        engine = make_engine(f"sqlite:///{path}")
+        t0 = time.perf_counter()
+        synth.make_wardrobe(engine, rows, seed=rows)
+        print(f"  seeded {rows:,} items in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        s = sessionmaker(bind=engine)()
+        dao = SQLItemDAO(s, blobs=NoBlobs())
+        deep = max(1, min(rows // 20, 5000) // 2)  # halfway into the wardrobe, capped
+        cursor = dao.list(user_id=1, page=1, count="none")["meta"]["next_cursor"]
+        cases = {
+            "list.page1": lambda: dao.list(user_id=1),
+            "list.page1_nocount": lambda: dao.list(user_id=1, count="none"),
+            "list.offset_deep": lambda: dao.list(user_id=1, page=deep, count="none"),
+            "list.cursor": lambda: dao.list(user_id=1, cursor=cursor, count="none"),
+            "list.kind_filter": lambda: dao.list(user_id=1, kinds=["shoes"], count="none"),
+            "list.sort_name": lambda: dao.list(user_id=1, sort_by="name", sort_dir="asc", count="none"),
+            "list.search": lambda: dao.list(user_id=1, search="blue jea", count="none"),
+            "list.color": lambda: dao.list(user_id=1, color_hex="#000080", count="none"),
+            "near_color": lambda: dao.near_color(user_id=1, color_hex="#000080"),
+        }
+        for name, fn in cases.items():
+            results[f"dao.{name}[{label(rows)}]"] = timed(fn, repeat)
+        s.close()
+        engine.dispose()
+
+
+def bench_colors(results: dict, repeat: int) -> None:
+    images = {
+        "jpeg_800x1000": synth.make_image(WORKDIR / "c1.jpg", (800, 1000), seed=1),
+        "jpeg_3000x4000": synth.make_image(WORKDIR / "c2.jpg", (3000, 4000), seed=2),
+        "png_1200x1500": synth.make_image(WORKDIR / "c3.png", (1200, 1500), seed=3),
+    }
+    for name, path in images.items():
+        results[f"colors.{name}"] = timed(lambda: utils_colors.analyze_image(path, use_cache=False),
+                                          repeat)
+
+
+def bench_upload(results: dict, repeat: int) -> None:
+    import app_images
+    client = app_images.app.test_client()
+    bodies = []
+    for i in range(repeat + 1):
+        buf = io.BytesIO()
+        synth.make_image(buf, (1200, 1500), seed=100 + i, fmt="JPEG")
+        bodies.append(buf.getvalue())
+    it = iter(bodies)
+
+    def post(data: bytes):
+        r = client.post("/api/images", data={"image": (io.BytesIO(data), "g.jpg")},
+                        content_type="multipart/form-data")
+        assert r.status_code in (200, 201), r.status_code
+
+    results["upload.new_jpeg_1200x1500"] = timed(lambda: post(next(it)), repeat)
+    # re-sending analysed bytes is the reuse path, not another queued job
+    app_images.job_queue().drain(timeout=60)
+    results["upload.duplicate"] = timed(lambda: post(bodies[0]), repeat)
+    app_images.job_queue().drain(timeout=60)  # nothing may write into WORKDIR once it's gone
+
+
+def bench_load(results: dict, requests: int, concurrency: int, rows: int) -> None:
+    import httpx
+    # both apps open ./app.db (WORKDIR/app.db); seed it before either is imported
+    engine = make_engine("sqlite:///app.db")
+    synth.make_wardrobe(engine, rows, seed=5)
+    engine.dispose()
+
+    def record(name: str, latencies: list[float], elapsed: float) -> None:
+        latencies.sort()
+        results[name] = {"rps": round(len(latencies) / elapsed, 1),
+                         "p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))] * 1000, 3)}
+
+    def paths(n: int, rnd: random.Random, browse: bool) -> str:
+        if browse and n % 10 == 0:
+            return "/"
+        if n % 2:
+            return f"/api/v1/items?page={rnd.randint(1, 50)}&_={n}"  # defeat the response cache
+        return f"/api/v1/items/{rnd.randint(1, rows)}?_={n}"
+
+    # Flask (WSGI): one thread per concurrent client
+    from app import app as flask_app
+    lat, lock, counter = [], threading.Lock(), iter(range(requests))
+
+    def wsgi_worker(wid: int):
+        rnd = random.Random(wid)
+        with httpx.Client(transport=httpx.WSGITransport(app=flask_app), base_url="http://bench") as c:
+            for n in counter:
+                t0 = time.perf_counter()
+                r = c.get(paths(n, rnd, browse=True))
+                with lock:
+                    lat.append(time.perf_counter() - t0)
+                assert r.status_code == 200, (r.status_code, r.url)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(wsgi_worker, range(concurrency)))
+    record("load.flask", lat, time.perf_counter() - t0)
+
+    # FastAPI (ASGI): concurrent tasks on one event loop
+    from main import app as fastapi_app
+
+    async def asgi_run():
+        out, counter = [], iter(range(requests))
+        transport = httpx.ASGITransport(app=fastapi_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+            async def worker(wid: int):
+                rnd = random.Random(wid)
+                for n in counter:
+                    t0 = time.perf_counter()
+                    r = await c.get(paths(n, rnd, browse=False))
+                    out.append(time.perf_counter() - t0)
+                    assert r.status_code == 200, (r.status_code, r.url)
+            t0 = time.perf_counter()
+            await asyncio.gather(*(worker(i) for i in range(concurrency)))
+            return out, time.perf_counter() - t0
+
+    lat, elapsed = asyncio.run(asgi_run())
+    record("load.fastapi", lat, elapsed)
+
+
+# ---------------------------------------------------------------------------
+# baseline comparison
+# ---------------------------------------------------------------------------
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float = 0.5) -> list[tuple]:
+    """
+    (name, metric, baseline, current, change) for every metric worse than
+    threshold. Latency changes smaller than min_delta_ms are timer noise on
+    sub-millisecond queries and never count.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, value in metrics.items():
+            old = base.get(metric)
+            if not old:
+                continue
+            if metric not in HIGHER_IS_BETTER and abs(value - old) < min_delta_ms:
+                continue
+            change = (value - old) / old
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > threshold:
+                regressions.append((name, metric, old, value, change))
+    return regressions
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": commit, "python": platform.python_version(),
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1k,10k,100k", help="wardrobe sizes, e.g. 1k,10k,100k,1m")
+    ap.add_argument("--only", default="dao,colors,upload,load")
+    ap.add_argument("--repeat", type=int, default=15)
+    ap.add_argument("--requests", type=int, default=600, help="requests per load test")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--out", default=str(Path(tempfile.gettempdir()) / "bench_suite_results.json"))
+    ap.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    ap.add_argument("--min-delta-ms", type=float, default=0.5,
+                    help="ignore latency changes smaller than this")
+    ap.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    args = ap.parse_args()
+
+    groups = {g.strip() for g in args.only.split(",")}
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    results: dict[str, dict] = {}
+    try:
+        if "dao" in groups:
+            print("dao ...", file=sys.stderr)
+            bench_dao(results, sizes, args.repeat)
+        if "colors" in groups:
+            print("colors ...", file=sys.stderr)
+            bench_colors(results, max(3, args.repeat // 3))
+        if "upload" in groups:
+            print("upload ...", file=sys.stderr)
+            bench_upload(results, max(3, args.repeat // 3))
+        if "load" in groups:
+            print("load ...", file=sys.stderr)
+            bench_load(results, args.requests, args.concurrency, rows=10_000)
+    finally:
+        os.chdir(CALLER_CWD)
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    report = {"env": environment(), "results": results}
+    Path(args.out).write_text(json.dumps(report, indent=2) + "\n")
+    for name, metrics in results.items():
+        print(f"{name:40s} " + "  ".join(f"{k}={v:g}" for k, v in metrics.items()))
+    print(f"\nwrote {args.out}")
+
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"saved baseline {args.baseline}")
+        return
+    if not Path(args.baseline).exists():
+        print("no baseline to compare against (run with --save-baseline)")
+        return
+    baseline = json.loads(Path(args.baseline).read_text())
+    regressions = compare(results, baseline["results"], args.threshold, args.min_delta_ms)
+    print(f"compared with baseline from {baseline['env'].get('commit')} "
+          f"({baseline['env'].get('timestamp')}), threshold {args.threshold:.0%}")
+    for name, metric, old, new, change in regressions:
+        print(f"  REGRESSION {name} {metric}: {old:g} -> {new:g} ({change:+.0%})")
+    if regressions:
+        sys.exit(1)
+    print("  no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Synthetic data for the benchmarks: wardrobes of any size and garment images.
+
+Both are deterministic for a given seed, so runs on the same machine are
+comparable. Used by suite.py; importable from the other bench scripts too.
+"""
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+import numpy as np  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from dao import color_columns  # noqa: E402
+from models import Base, Item, ItemKind  # noqa: E402
+from utils_colors import NAMED_COLORS, NEUTRAL_NAMES, rgb_to_hex  # noqa: E402
+import migrations  # noqa: E402
+
+WORDS = ["blue", "black", "white", "slim", "denim", "linen", "wool", "cotton", "oversized",
+         "cropped", "jeans", "shirt", "tee", "hoodie", "jacket", "sneakers", "boots",
+         "loafers", "scarf", "beanie", "watch", "shorts", "chinos", "blazer", "parka"]
+BRANDS = ["Levis", "Zara", "Uniqlo", "Nike", "Adidas", "H&M", "Patagonia", "Carhartt", None]
+SEASONS = ["spring", "summer", "fall", "winter", "all", None]
+BATCH = 5000
+
+
+def make_wardrobe(engine, rows: int, *, users: int = 1, seed: int = 0) -> None:
+    """
+    Create the schema (create_all + migrations, like init_db) and insert `rows`
+    items spread over `users` wardrobes, with realistic names for FTS, named
+    and random colors for the Lab index, and increasing timestamps.
+    """
+    Base.metadata.create_all(engine)
+    migrations.migrate(engine)
+    rnd = random.Random(seed)
+    kinds = list(ItemKind)
+    names = list(NAMED_COLORS)
+    start = datetime(2024, 1, 1)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            if rnd.random() < 0.6:
+                color = rnd.choice(names)
+                hex_value, neutral = rgb_to_hex(NAMED_COLORS[color]), color in NEUTRAL_NAMES
+            else:
+                hex_value, neutral = "#%06x" % rnd.randrange(1 << 24), False
+            ts = start + timedelta(seconds=i * 7)
+            batch.append(dict(
+                user_id=1 + i % users, kind=rnd.choice(kinds),
+                name=" ".join(rnd.sample(WORDS, 3)), brand=rnd.choice(BRANDS),
+                season=rnd.choice(SEASONS), is_neutral=1 if neutral else 0,
+                created_at=ts, updated_at=ts, **color_columns(hex_value),
+            ))
+            if len(batch) == BATCH:
+                conn.execute(insert(Item), batch)
+                batch.clear()
+        if batch:
+            conn.execute(insert(Item), batch)
+
+
+def make_image(path: Path, size=(800, 1000), *, seed: int = 0, fmt: str | None = None) -> Path:
+    """
+    A garment-like test image: a noisy colored shape on a white background,
+    which is what the color extraction and variant code see from real uploads.
+    """
+    rnd = random.Random(seed)
+    w, h = size
+    color = tuple(rnd.randrange(256) for _ in range(3))
+    img = Image.new("RGB", size, (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    mx, my = w // 6, h // 8
+    draw.rounded_rectangle((mx, my, w - mx, h - my), radius=min(w, h) // 10, fill=color)
+    draw.rectangle((mx // 2, my, mx + w // 8, my + h // 3), fill=color)           # sleeves
+    draw.rectangle((w - mx - w // 8, my, w - mx // 2, my + h // 3), fill=color)
+    noise = np.random.default_rng(seed).integers(-18, 19, size=(h, w, 3), dtype=np.int16)
+    arr = np.clip(np.asarray(img, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    Image.fromarray(arr).save(path, format=fmt, quality=90)
+    return path